@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
 from customlogger import Logger
 import constants
 import os
@@ -9,10 +10,14 @@ from endpoints import profile
 from endpoints import vehicle
 from endpoints import payments
 from endpoints import parking_lots
-from utils.database_utils import get_db_path
+from utils.database_utils import get_db_path, ensure_indexes
+from utils import metrics_utils, looplag_utils, profiling_utils, tracing_utils, jobs_utils, admission_utils
+from utils import compression_utils, msgpack_utils
+from utils import parking_lots_utils, reservations_utils, archive_utils
 from endpoints import billing
 from endpoints import reservations
 from endpoints import discounts
+from endpoints import debug
 
 class ApiResponse(BaseModel):
     StatusResponse: dict
@@ -20,12 +25,30 @@ class ApiResponse(BaseModel):
 
 class Apiroutes:
     def __init__(self) -> None:
-        self.App = FastAPI()
+        self.App = FastAPI(lifespan=self.Lifespan)
         self.log = Logger.getLogger("API")
+        self.SetupDatabase()
+        self.SetupJobs()
+        self.SetupMiddleware()
         self.SetupEndpoints()
         self.SetupRoutes()
 
 
+    @asynccontextmanager
+    async def Lifespan(self, app: FastAPI):
+        """Background monitors and jobs that run as long as the app runs"""
+        monitor = looplag_utils.LoopLagMonitor()
+        monitor.start()
+        scheduler = app.state.scheduler
+        if constants.JOBS_ENABLED:
+            scheduler.start()
+        try:
+            yield
+        finally:
+            await scheduler.stop()
+            await monitor.stop()
+
+
     def FormatResponse(self, status_response: dict, content : Any) -> ApiResponse:
         return ApiResponse(StatusResponse=status_response, Content=content)
 
@@ -47,8 +70,43 @@ class Apiroutes:
         except Exception as e:
             return self.FormatResponse(self.StatusResponse(400), {"status" : "failed"})
     
+    def SetupDatabase(self) -> None:
+        """Create the indexes the list endpoints rely on"""
+        try:
+            ensure_indexes()
+        except Exception as e:
+            self.log.error(f"Could not create database indexes: {e}")
+
+    def SetupJobs(self) -> None:
+        """Periodic maintenance; started in the lifespan, status and manual runs via /debug/jobs"""
+        scheduler = jobs_utils.Scheduler()
+        scheduler.add(jobs_utils.Job("resume_expired_sessions", parking_lots_utils.check_and_resume_expired_sessions,
+                                     interval=constants.RESUME_SESSIONS_INTERVAL_SECONDS, jitter=5, timeout=30))
+        scheduler.add(jobs_utils.Job("reservation_lifecycle", reservations_utils.expire_past_reservations,
+                                     interval=constants.RESERVATION_LIFECYCLE_INTERVAL_SECONDS, jitter=30, timeout=60))
+        scheduler.add(jobs_utils.Job("reconcile_reserved_counts", reservations_utils.reconcile_reserved_counts,
+                                     interval=constants.RECONCILE_RESERVED_INTERVAL_SECONDS, jitter=60, timeout=120))
+        scheduler.add(jobs_utils.Job("rollup_daily_stats", parking_lots_utils.rollup_daily_stats,
+                                     interval=constants.ROLLUP_INTERVAL_SECONDS, jitter=300, timeout=600))
+        scheduler.add(jobs_utils.Job("archive_sessions", archive_utils.archive_sessions,
+                                     daily_at=constants.ARCHIVE_DAILY_AT, jitter=600, timeout=3600))
+        self.App.state.scheduler = scheduler
+
+    def SetupMiddleware(self) -> None:
+        """Metrics per route, admission control per route class, response compression, MessagePack bodies, request tracing; admins can profile requests (X-Profile)"""
+        # De laatst toegevoegde middleware is de buitenste: profiling, tracing en admission draaien binnen metrics
+        # (request id); wachten op admission telt niet mee in de trace, comprimeren wel mee in het admission slot
+        self.App.add_middleware(profiling_utils.ProfilingMiddleware)
+        self.App.add_middleware(tracing_utils.TracingMiddleware)
+        # MessagePack binnen compressie, zodat ook MessagePack antwoorden gecomprimeerd worden
+        self.App.add_middleware(msgpack_utils.MessagePackMiddleware)
+        if constants.COMPRESSION_ENABLED:
+            self.App.add_middleware(compression_utils.CompressionMiddleware)
+        self.App.add_middleware(admission_utils.AdmissionMiddleware)
+        self.App.add_middleware(metrics_utils.MetricsMiddleware)
+
     def SetupEndpoints(self) -> None:
-        """Include all endpoint routers"""
+        """Include all endpoint routers; their JSON bodies are also offered as MessagePack in the OpenAPI schema"""
         self.App.include_router(account.router, tags=["Account"])
         self.App.include_router(profile.router, tags=["Profile"])        
         self.App.include_router(vehicle.router, tags=["Vehicle"])
@@ -57,6 +115,10 @@ class Apiroutes:
         self.App.include_router(parking_lots.router, tags=["Parking Lots"])
         self.App.include_router(reservations.router, tags=["Reservations"])
         self.App.include_router(discounts.router, tags=["Discounts"])
+        self.App.include_router(debug.router, tags=["Debug"])
+        # Elke JSON body kan ook als MessagePack (MessagePackMiddleware), met hetzelfde schema
+        openapi = self.App.openapi
+        self.App.openapi = lambda: msgpack_utils.add_to_openapi(openapi())
         
     def SetupRoutes(self) -> None:
 
@@ -77,6 +139,11 @@ class Apiroutes:
                 "database_name": os.path.basename(get_db_path())
             }
 
+        @self.App.get("/metrics")
+        async def metrics():
+            """Request and database metrics in Prometheus text format"""
+            return Response(content=metrics_utils.render(), media_type=metrics_utils.CONTENT_TYPE)
+
 def run():
     print("run")
     api_instance = Apiroutes()
@@ -9,7 +9,79 @@ SYSTEMLOGS_DIR = os.path.join(MAIN_DIR, 'systemlogs')
 MAX_BACKUPS = 4 
 MAX_LOG_SIZE = 5 * 1024 * 1024  
 
+# Log records gaan via een queue naar een writer thread; bij een volle queue worden ze weggegooid (en geteld)
+LOG_LEVEL = (environment.get("LOG_LEVEL") or os.getenv("LOG_LEVEL", "INFO")).upper()
+LOG_QUEUE_SIZE = 10000
+# Fractie van de DEBUG records die gelogd wordt (per logger), andere levels altijd
+LOG_DEBUG_SAMPLE_RATE = float(environment.get("LOG_DEBUG_SAMPLE_RATE") or os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+
 UVICORN_HOST_IP = environment.get("API_HOST_IP") or os.getenv("API_HOST_IP", "0.0.0.0")
 UVICORN_HOST_PORT = int(environment.get("API_HOST_PORT") or os.getenv("API_HOST_PORT", "8000"))
 
 FERNET_KEY = environment.get("FERNET_KEY") or os.getenv("FERNET_KEY", "") 
+
+PAGINATION_DEFAULT_LIMIT = 100
+PAGINATION_MAX_LIMIT = 1000
+
+# Sessie archivering: afgeronde sessies ouder dan dit aantal dagen gaan naar de archief database
+ARCHIVE_AFTER_DAYS = int(environment.get("ARCHIVE_AFTER_DAYS") or os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = 5000
+
+# Na het stoppen heeft een voertuig zoveel minuten om via de slagboom te vertrekken, daarna loopt de sessie weer door
+GRACE_PERIOD_MINUTES = 15
+# Reserveringen die binnen zoveel minuten beginnen tellen mee als bezet bij het starten van een sessie
+UPCOMING_RESERVATION_MINUTES = 15
+
+# Statements die langer duren dan dit aantal milliseconden komen in het slow-query log
+SLOW_QUERY_THRESHOLD_MS = float(environment.get("SLOW_QUERY_THRESHOLD_MS") or os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_LOG_PATH = os.path.join(SYSTEMLOGS_DIR, 'slow_queries.log')
+
+# Profielen van requests met de X-Profile header (alleen admins)
+PROFILES_DIR = os.path.join(SYSTEMLOGS_DIR, 'profiles')
+PROFILE_SAMPLE_INTERVAL_MS = 1
+# Alleen de nieuwste zoveel profielen blijven bewaard
+PROFILES_KEEP = 50
+
+# Event loop lag monitor: meet elke interval hoe laat de loop wakker wordt, boven de drempel wordt de stack gesampled
+LOOP_LAG_INTERVAL_MS = 50
+LOOP_LAG_THRESHOLD_MS = float(environment.get("LOOP_LAG_THRESHOLD_MS") or os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+LOOP_LAG_STACK_DEPTH = 15
+
+# Geheugen profiling (tracemalloc) via de admin debug endpoints
+MEMORY_TRACE_FRAMES = 10
+MEMORY_MAX_SNAPSHOTS = 5
+
+# Request tracing: afgeronde traces in een ring buffer, en als TRACE_EXPORT_PATH gezet is ook als OTLP/JSON regels in dat bestand
+TRACING_ENABLED = (environment.get("TRACING_ENABLED") or os.getenv("TRACING_ENABLED", "true")).lower() == "true"
+TRACE_BUFFER_SIZE = 500
+TRACE_MAX_SPANS = 1000
+TRACE_EXPORT_PATH = environment.get("TRACE_EXPORT_PATH") or os.getenv("TRACE_EXPORT_PATH")
+
+# Achtergrond jobs (zie utils/jobs_utils.py); in test mode draaien ze alleen via POST /debug/jobs/{name}/run
+JOBS_ENABLED = (environment.get("JOBS_ENABLED") or os.getenv("JOBS_ENABLED", "false" if os.getenv("TEST_MODE") == "true" else "true")).lower() == "true"
+RESUME_SESSIONS_INTERVAL_SECONDS = 60
+RESERVATION_LIFECYCLE_INTERVAL_SECONDS = 5 * 60
+RECONCILE_RESERVED_INTERVAL_SECONDS = 15 * 60
+ROLLUP_INTERVAL_SECONDS = 60 * 60
+# Aantal dagen dat de rollup elk uur opnieuw berekent (oudere dagen veranderen niet meer)
+ROLLUP_DAYS = 2
+ARCHIVE_DAILY_AT = "03:00"
+
+# Admission control (zie utils/admission_utils.py): gelijktijdige requests per route class, de rest wacht in een
+# queue (hoogste prioriteit eerst) en krijgt na de deadline (seconden) een 503 met Retry-After.
+# ADMISSION_MAX_CONCURRENCY geldt voor default en bulk samen; critical (slagboom, betalingen) heeft eigen slots.
+ADMISSION_ENABLED = (environment.get("ADMISSION_ENABLED") or os.getenv("ADMISSION_ENABLED", "true")).lower() == "true"
+ADMISSION_MAX_CONCURRENCY = int(environment.get("ADMISSION_MAX_CONCURRENCY") or os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+ADMISSION_CLASSES = {
+    "critical": {"priority": 0, "limit": 64, "max_queue": 500, "deadline": 2.0, "shared": False},
+    "default": {"priority": 1, "limit": 48, "max_queue": 500, "deadline": 5.0},
+    "bulk": {"priority": 2, "limit": 4, "max_queue": 50, "deadline": 10.0},
+}
+
+# Response compressie (zie utils/compression_utils.py): br of gzip volgens Accept-Encoding, alleen boven
+# COMPRESSION_MIN_SIZE bytes. Gestreamde antwoorden worden elke COMPRESSION_FLUSH_BYTES input doorgeflusht.
+COMPRESSION_ENABLED = (environment.get("COMPRESSION_ENABLED") or os.getenv("COMPRESSION_ENABLED", "true")).lower() == "true"
+COMPRESSION_MIN_SIZE = int(environment.get("COMPRESSION_MIN_SIZE") or os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_FLUSH_BYTES = 16 * 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
@@ -1,23 +1,38 @@
+import atexit
+import copy
+import gzip
+import itertools
+import json
 import logging
 import logging.handlers
 import datetime as dt
 import os
+import queue
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 import constants
+from utils import metrics_utils
+
 
 class Logger:
 
     def __init__(self):
+        # Compressie van de laatst geroteerde file; een volgende rollover wacht daarop
+        self.compressing = None
         self.log_file_path = self.setupLogFile()
 
 
     def setupLogFile(self):
         """
         Setup the log file and return the path to it.
+
+        Log calls only put the record on a queue (QueueHandler on the root logger); a
+        background QueueListener thread formats them as JSON lines and writes the file.
         """
 
         log_time = dt.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
         log_file_path = os.path.join(constants.MAIN_DIR, constants.SYSTEMLOGS_DIR, f'Log_{log_time}.txt')
-        
+
         handler = logging.handlers.RotatingFileHandler(
             filename=log_file_path,
             maxBytes=constants.MAX_LOG_SIZE,
@@ -25,19 +40,41 @@ class Logger:
             mode='a'
         )
 
+        # Geroteerde bestanden worden op de achtergrond gecomprimeerd (Log_x.txt.1.gz, ...)
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = self.gzipRotator
         handler.doRollover = self.customDoRollover(handler)
-        
-        formatter = logging.Formatter('[%(asctime)s] - [%(name)s] -- %(message)s')
-        handler.setFormatter(formatter)
-        
+        handler.setFormatter(JsonFormatter())
+
+        self.queue_handler = DroppingQueueHandler(queue.Queue(constants.LOG_QUEUE_SIZE))
+        self.queue_handler.addFilter(RequestContextFilter())
+        self.queue_handler.addFilter(DebugSamplingFilter(constants.LOG_DEBUG_SAMPLE_RATE))
+
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
         self.logger = logging.getLogger()
-        self.logger.setLevel(logging.INFO)
-        self.logger.addHandler(handler)
+        self.logger.setLevel(constants.LOG_LEVEL)
+        self.logger.addHandler(self.queue_handler)
 
         logging.info("Logging initialized in file: %s", log_file_path)
-        
+
         return log_file_path
-    
+
+
+    def stop(self):
+        """Write the remaining queued records and stop the writer thread"""
+        atexit.unregister(self.stop)
+        if self.listener._thread is not None:
+            self.listener.stop()
+        try:
+            # Een worker: als deze lege taak klaar is, zijn de eerder ingediende compressies ook klaar
+            _compressor.submit(lambda: None).result()
+        except RuntimeError:
+            # Bij het afsluiten van de interpreter is de executor al gestopt (en zijn de taken afgerond)
+            pass
+
 
     def customDoRollover(self, handler : logging.handlers.RotatingFileHandler):
         """
@@ -46,15 +83,122 @@ class Logger:
         originalDoRollover = handler.doRollover
 
         def newDoRollover():
+            # De rollover schuift .1.gz door en hernoemt naar .1: eerst moet de vorige compressie klaar zijn
+            if self.compressing is not None:
+                self.compressing.result()
+                self.compressing = None
             originalDoRollover()
-            self.logger.info("Log reached maximum file size, transferring to new log file.")
+            # Draait al in de writer thread: direct naar de (nieuwe) file in plaats van terug op de queue
+            record = self.logger.makeRecord(self.logger.name, logging.INFO, __file__, 0,
+                                            "Log reached maximum file size, transferring to new log file.", None, None)
+            handler.handle(record)
 
         return newDoRollover
 
 
+    def gzipRotator(self, source, dest):
+        """
+        Rename the full log file and compress it in the background (dest ends in .gz).
+        The writer thread only does the rename, so logging doesn't wait for gzip
+        unless the next rollover comes before the compression is done.
+        """
+        uncompressed = dest[:-len(".gz")]
+        os.rename(source, uncompressed)
+        try:
+            self.compressing = _compressor.submit(_gzip_file, uncompressed, dest)
+        except RuntimeError:
+            _gzip_file(uncompressed, dest)
+
+
     @staticmethod
     def getLogger(module_name):
         """
         Return a logger for the specified module name.
         """
-        return logging.getLogger(module_name)
\ No newline at end of file
+        return logging.getLogger(module_name)
+
+
+# Een thread voor het comprimeren van geroteerde logs, los van de writer thread
+_compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-gzip")
+
+
+def _gzip_file(source, dest):
+    try:
+        with open(source, "rb") as file_in, gzip.open(dest, "wb") as file_out:
+            shutil.copyfileobj(file_in, file_out)
+        os.remove(source)
+    except OSError:
+        # Het ongecomprimeerde bestand blijft dan gewoon staan
+        pass
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler die bij een volle queue de record telt en weggooit in plaats van te blokkeren"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Bericht en traceback nu al als tekst (args kunnen later veranderen), de JSON opmaak gebeurt in de writer thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class RequestContextFilter(logging.Filter):
+    """Voegt request id en route van het huidige request toe (draait in de thread die logt)"""
+
+    def filter(self, record):
+        record.request_id = metrics_utils.CURRENT_REQUEST_ID.get()
+        record.route = metrics_utils.request_route()
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Laat van DEBUG records maar een deel door (1 op de N per logger), andere levels altijd"""
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.every = max(1, round(1 / sample_rate)) if sample_rate > 0 else 0
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if not self.every:
+            return False
+        counter = self.counters.get(record.name)
+        if counter is None:
+            counter = self.counters.setdefault(record.name, itertools.count())
+        return next(counter) % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Een JSON object per regel"""
+
+    def format(self, record):
+        entry = {
+            "time": dt.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+            entry["route"] = getattr(record, "route", None)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
@@ -6,8 +6,9 @@ from models.User import User
 from utils import database_utils as db
 from utils import auth_utils
 from utils.session_manager import add_session, remove_session, get_session
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 # Request/Response models
 class RegisterRequest(BaseModel):
@@ -1,30 +1,49 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from typing import Optional
-from utils import billing_utils
+from utils import billing_utils, etag_utils
 from utils.session_manager import get_session
+from utils.streaming_utils import stream_format, stream_rows
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 
 @router.get("/billing")
-async def get_user_billing(authorization: Optional[str] = Header(None)):
-    """Get billing information for the authenticated user"""
+async def get_user_billing(response: Response, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           authorization: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    """Get billing information for the authenticated user, optionally for sessions started in a date range"""
     if not authorization or not get_session(authorization):
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
     
     session_user = get_session(authorization)
     user_id = session_user.get("id")
     
+    # Een lopende sessie wordt elke keer tot nu berekend: dan geen ETag
+    etag = None
+    if not billing_utils.has_active_session(user_id):
+        versions = etag_utils.get_versions(("billing", user_id), ("parking_lots", etag_utils.COLLECTION),
+                                           ("payments", etag_utils.COLLECTION))
+        etag = etag_utils.make_etag("billing", user_id, start_date, end_date, versions)
+        if etag_utils.matches(if_none_match, etag):
+            return etag_utils.not_modified(etag)
+    
     try:
-        sessions = billing_utils.get_user_sessions(user_id)
+        sessions = billing_utils.get_user_sessions(user_id, start_date, end_date)
+        if etag:
+            response.headers["ETag"] = etag
         return billing_utils.format_billing_data(sessions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
 @router.get("/billing/{username}")
-async def get_user_billing_by_username(username: str, authorization: Optional[str] = Header(None)):
-    """Get billing information for a specific user (admin only)"""
+async def get_user_billing_by_username(username: str, stream: Optional[str] = None,
+                                       start_date: Optional[str] = None, end_date: Optional[str] = None,
+                                       accept: Optional[str] = Header(None),
+                                       authorization: Optional[str] = Header(None)):
+    """Get billing information for a specific user (admin only), optionally streamed as an export"""
     if not authorization or not get_session(authorization):
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
     
@@ -33,8 +52,19 @@ async def get_user_billing_by_username(username: str, authorization: Optional[st
     if session_user.get('role') != 'ADMIN':
         raise HTTPException(status_code=403, detail="Access denied")
     
+    # Exports: stream billing entries as they are computed
+    fmt = stream_format(stream, accept)
+    if fmt:
+        try:
+            sessions = billing_utils.iter_user_sessions_by_username(username, start_date, end_date)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return stream_rows(billing_utils.iter_billing_data(sessions), fmt)
+    
     try:
-        sessions = billing_utils.get_user_sessions_by_username(username)
+        sessions = billing_utils.get_user_sessions_by_username(username, start_date, end_date)
         return billing_utils.format_billing_data(sessions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
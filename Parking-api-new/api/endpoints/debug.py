@@ -0,0 +1,145 @@
+import os
+from fastapi import APIRouter, HTTPException, Header, Request, Response
+from fastapi.responses import FileResponse
+from typing import Optional
+from utils.session_manager import get_session
+from utils import profiling_utils, memory_utils, tracing_utils
+from utils.tracing_utils import TracedRoute
+
+router = APIRouter(route_class=TracedRoute)
+
+
+def require_admin(authorization: Optional[str]) -> dict:
+    if not authorization or not get_session(authorization):
+        raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
+
+    session_user = get_session(authorization)
+    if session_user.get("role") != "ADMIN":
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    return session_user
+
+
+@router.get("/debug/profiles")
+async def list_profiles(authorization: Optional[str] = Header(None)):
+    """Profiles saved for requests sent with the X-Profile header (admin only)"""
+    require_admin(authorization)
+    return profiling_utils.list_profiles()
+
+
+@router.get("/debug/profiles/{name}")
+async def get_profile(name: str, format: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    """Download a profile (pstats or folded stacks), or ?format=text for a readable summary (admin only)"""
+    require_admin(authorization)
+
+    if format not in (None, "text"):
+        raise HTTPException(status_code=400, detail="format must be text")
+    try:
+        path = profiling_utils.profile_path(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    if format == "text":
+        return Response(content=profiling_utils.profile_summary(path), media_type="text/plain")
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@router.get("/debug/memory")
+async def memory_status(authorization: Optional[str] = Header(None)):
+    """tracemalloc status, snapshots and the size of known in-process structures (admin only)"""
+    require_admin(authorization)
+    return {**memory_utils.status(), "structures": memory_utils.known_structures()}
+
+
+@router.post("/debug/memory/start")
+async def start_memory_tracing(frames: Optional[int] = None, authorization: Optional[str] = Header(None)):
+    """Start tracemalloc (admin only)"""
+    require_admin(authorization)
+    try:
+        return memory_utils.start(frames)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/debug/memory/stop")
+async def stop_memory_tracing(authorization: Optional[str] = Header(None)):
+    """Stop tracemalloc and drop the snapshots (admin only)"""
+    require_admin(authorization)
+    return memory_utils.stop()
+
+
+@router.post("/debug/memory/snapshots", status_code=201)
+async def take_memory_snapshot(limit: int = 20, authorization: Optional[str] = Header(None)):
+    """Take a snapshot and return its biggest allocation sites (admin only)"""
+    require_admin(authorization)
+    try:
+        snapshot = memory_utils.take_snapshot()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**snapshot, "top": memory_utils.top_allocations(snapshot["id"], limit)}
+
+
+@router.get("/debug/memory/snapshots/{snapshot_id}")
+async def get_memory_snapshot(snapshot_id: int, limit: int = 20, group_by: str = "lineno",
+                              authorization: Optional[str] = Header(None)):
+    """Biggest allocation sites of a snapshot, per line, file or traceback (admin only)"""
+    require_admin(authorization)
+    try:
+        top = memory_utils.top_allocations(snapshot_id, limit, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if top is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"id": snapshot_id, "top": top}
+
+
+@router.get("/debug/memory/diff")
+async def diff_memory_snapshots(old: int, new: int, limit: int = 20, group_by: str = "lineno",
+                                authorization: Optional[str] = Header(None)):
+    """Allocation sites that grew the most between two snapshots (admin only)"""
+    require_admin(authorization)
+    try:
+        growth = memory_utils.diff(old, new, limit, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if growth is None:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return {"old": old, "new": new, "diff": growth}
+
+
+@router.get("/debug/traces")
+async def slowest_traces(limit: int = 10, route: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    """Slowest recent traces with their span tree, optionally for one route template (admin only)"""
+    require_admin(authorization)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    return tracing_utils.slowest_traces(limit, route)
+
+
+@router.get("/debug/traces/{trace_id}")
+async def get_trace(trace_id: str, authorization: Optional[str] = Header(None)):
+    """One recent trace in OTLP/JSON format (admin only)"""
+    require_admin(authorization)
+    trace = tracing_utils.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return tracing_utils.to_otlp(trace)
+
+
+@router.get("/debug/jobs")
+async def list_jobs(request: Request, authorization: Optional[str] = Header(None)):
+    """Background jobs: schedule, last run in this worker and the shared lease (admin only)"""
+    require_admin(authorization)
+    return request.app.state.scheduler.status()
+
+
+@router.post("/debug/jobs/{name}/run")
+async def run_job(name: str, request: Request, authorization: Optional[str] = Header(None)):
+    """Run a background job now; skipped when it is already running or leased by another worker (admin only)"""
+    require_admin(authorization)
+    scheduler = request.app.state.scheduler
+    if name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await scheduler.run(name)
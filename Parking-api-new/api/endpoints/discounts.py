@@ -1,13 +1,39 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime, timedelta, timezone
 from utils.session_manager import get_session
 from utils.database_utils import execute_query, get_db_connection
 from models.Discount import Discount
-from utils.discount_utils import get_discount_by_id
+from utils.discount_utils import get_discount_by_id, DISCOUNT_BY_ID_QUERY, DISCOUNT_BY_CODE_QUERY
+from utils.pagination_utils import paginate, iterate, register_page, set_cursor_header, DISCOUNT_STATUSES
+from utils.streaming_utils import stream_format, stream_rows
+from utils.query_registry import register
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
+
+USER_ROLE_QUERY = register("SELECT role FROM users WHERE id = ?")
+MANAGES_LOT_QUERY = register("SELECT parking_lot_id FROM parking_lot_managers WHERE user_id = ? AND parking_lot_id = ?")
+CREATE_DISCOUNT_QUERY = register("""
+        INSERT INTO discounts (code, description, percent, amount, applies_to, starts_at, ends_at, parking_lot_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+UPDATE_DISCOUNT_QUERY = register("UPDATE discounts SET {assignments} WHERE id = ?", assignments="description = ?")
+DELETE_DISCOUNT_QUERY = register("DELETE FROM discounts WHERE id = ?")
+
+LIST_DISCOUNTS_SELECT = """
+        SELECT d.id, d.code, d.description, d.percent, d.amount,
+               d.applies_to, d.starts_at, d.ends_at, d.parking_lot_id
+        FROM discounts d
+    """
+# Parking lot manager ziet alleen discounts van zijn eigen lots (en globale)
+MANAGER_DISCOUNTS_CONDITION = """(d.parking_lot_id IN (
+                SELECT parking_lot_id FROM parking_lot_managers WHERE user_id = ?
+            )
+            OR d.parking_lot_id IS NULL)"""
+register_page(LIST_DISCOUNTS_SELECT, [], key="d.id", allow_scan=True)
+register_page(LIST_DISCOUNTS_SELECT, [MANAGER_DISCOUNTS_CONDITION], key="d.id", allow_scan=True)
 
 
 class CreateDiscountRequest(BaseModel):
@@ -70,10 +96,7 @@ def require_admin_or_parking_lot_manager(authorization: Optional[str]) -> dict:
     # Get current role from database (in case it was updated)
     user_id = session_user.get("id")
     if user_id:
-        db_results = execute_query(
-            "SELECT role FROM users WHERE id = ?",
-            (user_id,)
-        )
+        db_results = execute_query(USER_ROLE_QUERY, (user_id,))
         if db_results:
             db_role = db_results[0].get("role")
             # Update session cache with current role
@@ -106,10 +129,7 @@ def user_manages_parking_lot(user: dict, parking_lot_id: int) -> bool:
     # parking_lot_id would be stored in user profile/session
     # For now, we check the user_id against parking_lot_manager association table
     user_id = user.get("id")
-    results = execute_query(
-        "SELECT parking_lot_id FROM parking_lot_managers WHERE user_id = ? AND parking_lot_id = ?",
-        (user_id, parking_lot_id)
-    )
+    results = execute_query(MANAGES_LOT_QUERY, (user_id, parking_lot_id))
     return len(results) > 0
 
 
@@ -158,10 +178,7 @@ async def create_discount(
         )
     
     # Check if code already exists
-    existing = execute_query(
-        "SELECT * FROM discounts WHERE LOWER(code) = LOWER(?)",
-        (request.code.strip(),)
-    )
+    existing = execute_query(DISCOUNT_BY_CODE_QUERY, (request.code.strip(),))
     if existing:
         raise HTTPException(
             status_code=409,
@@ -179,15 +196,10 @@ async def create_discount(
         ends_at = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
     
     # Insert into database
-    query = """
-        INSERT INTO discounts (code, description, percent, amount, applies_to, starts_at, ends_at, parking_lot_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, (
+            cursor.execute(CREATE_DISCOUNT_QUERY, (
                 request.code.strip(),
                 request.description,
                 request.percent,
@@ -223,40 +235,63 @@ async def create_discount(
 
 @router.get("/discounts")
 async def list_discounts(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    status: Optional[str] = None,
+    stream: Optional[str] = None,
+    accept: Optional[str] = Header(None),
     authorization: Optional[str] = Header(None)
 ):
     """
-    List discount codes.
+    List discount codes, paginated with `cursor`/`limit`.
     - ADMIN: can see all discounts
     - PARKING_LOT_MANAGER: can only see discounts for their parking lots
+    - status: optional filter on active, expired or scheduled discounts
+    - stream=ndjson|json (or Accept: application/x-ndjson): stream all matches instead of a page
     """
     user = require_admin_or_parking_lot_manager(authorization)
     
-    try:
-        if user.get("role") == "ADMIN":
-            # Admin can see all discounts
-            query = "SELECT id, code, description, percent, amount, applies_to, starts_at, ends_at, parking_lot_id FROM discounts"
-            discounts = execute_query(query)
+    select = LIST_DISCOUNTS_SELECT
+    conditions = []
+    params = []
+    
+    if user.get("role") != "ADMIN":
+        # Parking lot manager can only see their discounts
+        conditions.append(MANAGER_DISCOUNTS_CONDITION)
+        params.append(user.get("id"))
+    
+    if status:
+        if status not in DISCOUNT_STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of: {', '.join(DISCOUNT_STATUSES)}")
+        now = datetime.now(timezone.utc).isoformat()
+        if status == "active":
+            conditions.append("(d.starts_at IS NULL OR d.starts_at <= ?) AND (d.ends_at IS NULL OR d.ends_at >= ?)")
+            params.extend([now, now])
+        elif status == "expired":
+            conditions.append("d.ends_at < ?")
+            params.append(now)
         else:
-            # Parking lot manager can only see their discounts
-            user_id = user.get("id")
-            query = """
-                SELECT DISTINCT d.id, d.code, d.description, d.percent, d.amount, 
-                       d.applies_to, d.starts_at, d.ends_at, d.parking_lot_id
-                FROM discounts d
-                WHERE d.parking_lot_id IN (
-                    SELECT parking_lot_id FROM parking_lot_managers WHERE user_id = ?
-                )
-                OR d.parking_lot_id IS NULL
-            """
-            discounts = execute_query(query, (user_id,))
+            conditions.append("d.starts_at > ?")
+            params.append(now)
+    
+    fmt = stream_format(stream, accept)
+    if fmt:
+        return stream_rows(iterate(select, conditions, params, key="d.id"), fmt)
+    
+    try:
+        discounts, next_cursor = paginate(select, conditions, params, cursor, limit, key="d.id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
+    set_cursor_header(response, next_cursor)
     return {
         "status": "success",
         "count": len(discounts),
-        "discounts": discounts
+        "discounts": discounts,
+        "next_cursor": next_cursor
     }
 
 
@@ -353,7 +388,7 @@ async def update_discount(
         raise HTTPException(status_code=400, detail="No fields to update")
     
     params.append(discount_id)
-    update_query = f"UPDATE discounts SET {', '.join(updates)} WHERE id = ?"
+    update_query = UPDATE_DISCOUNT_QUERY.format(assignments=", ".join(updates))
     
     try:
         with get_db_connection() as conn:
@@ -364,7 +399,7 @@ async def update_discount(
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
     # Return updated discount
-    results = execute_query("SELECT * FROM discounts WHERE id = ?", (discount_id,))
+    results = execute_query(DISCOUNT_BY_ID_QUERY, (discount_id,))
     discount_data = results[0] if results else {}
     
     return {
@@ -406,7 +441,7 @@ async def delete_discount(
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("DELETE FROM discounts WHERE id = ?", (discount_id,))
+            cursor.execute(DELETE_DISCOUNT_QUERY, (discount_id,))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     
@@ -1,12 +1,19 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Optional
 from utils.session_manager import get_session
 from models.ParkingLot import ParkingLot
 from utils import parking_lots_utils as db
+from utils.pagination_utils import set_cursor_header
+from utils.streaming_utils import stream_format, stream_rows
+from utils import etag_utils
+from utils.compression_utils import no_compression
+from utils import fields_utils
+import constants
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 class ParkingLotCreateRequest(BaseModel):
     name: str
@@ -39,19 +46,39 @@ class BarrierVerificationRequest(BaseModel):
 
 # GET all parking lots
 @router.get("/parking-lots")
-async def get_all_parking_lots():
-    lots_data = db.get_all_parking_lots()
-    lots = [ParkingLot.from_dict(lot).to_dict() for lot in lots_data]
-    return {"parking_lots": lots}
+async def get_all_parking_lots(response: Response, cursor: Optional[str] = None, limit: Optional[int] = None,
+                               fields: Optional[str] = None, if_none_match: Optional[str] = Header(None)):
+    try:
+        selected = fields_utils.parse_fields(fields, "parking_lots")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Ongewijzigde lots (zelfde versie, pagina en velden): 304 zonder query
+    version, = etag_utils.get_versions(("parking_lots", etag_utils.COLLECTION))
+    etag = etag_utils.make_etag("parking_lots", version, cursor, limit, selected)
+    if etag_utils.matches(if_none_match, etag):
+        return etag_utils.not_modified(etag)
+    try:
+        # Versie in de coalescing key: nooit aansluiten bij een query van voor de laatste wijziging
+        lots_data, next_cursor = await db.get_all_parking_lots_coalesced(cursor, limit, selected,
+                                                                         scope=("parking_lots", version))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_cursor_header(response, next_cursor)
+    response.headers["ETag"] = etag
+    # Rows already have the response shape; no model round trip per lot
+    return {"parking_lots": lots_data, "next_cursor": next_cursor}
 
 # GET single parking lot
 @router.get("/parking-lots/{lot_id}")
-async def get_parking_lot(lot_id: int):
-    lot_data = db.get_parking_lot_by_id(lot_id)
+async def get_parking_lot(lot_id: int, fields: Optional[str] = None):
+    try:
+        selected = fields_utils.parse_fields(fields, "parking_lots")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    lot_data = await db.get_parking_lot_by_id_coalesced(lot_id, selected)
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
-    lot = ParkingLot.from_dict(lot_data)
-    return lot.to_dict()
+    return lot_data.to_dict()
 
 # POST create parking lot (ADMIN only)
 @router.post("/parking-lots")
@@ -137,12 +164,15 @@ async def delete_parking_lot(lot_id: int, authorization: Optional[str] = Header(
 
 # POST start parking session
 @router.post("/parking-lots/{lot_id}/sessions/start")
+@no_compression
 async def start_session(lot_id: int, data: SessionStartRequest, authorization: Optional[str] = Header(None)):
     username = None
+    user_id = None
     if authorization:
         session_user = get_session(authorization)
         if session_user:
             username = session_user["username"]
+            user_id = session_user.get("id")
     
     licenseplate = data.licenseplate.strip()
     if not licenseplate:
@@ -153,8 +183,9 @@ async def start_session(lot_id: int, data: SessionStartRequest, authorization: O
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Resume any expired grace period sessions (stopped >15 mins ago without barrier exit)
-    db.check_and_resume_expired_sessions()
+    # Resume an expired grace period session of this plate (stopped > GRACE_PERIOD_MINUTES ago without barrier exit);
+    # other plates are resumed by the resume_expired_sessions job
+    db.resume_expired_session(lot_id, licenseplate)
     
     # Check if there's already an active session for this plate
     active_session = db.get_active_session_by_licenseplate(lot_id, licenseplate)
@@ -166,18 +197,17 @@ async def start_session(lot_id: int, data: SessionStartRequest, authorization: O
     if grace_period_session:
         raise HTTPException(
             status_code=409, 
-            detail="Cannot start new session: you have a session waiting for exit confirmation. Please exit through the barrier within 15 minutes or the session will resume automatically."
+            detail=f"Cannot start new session: you have a session waiting for exit confirmation. Please exit through the barrier within {constants.GRACE_PERIOD_MINUTES} minutes or the session will resume automatically."
         )
     
     # Check capacity: current sessions + upcoming reservations
     capacity = lot_data.get("capacity", 0)
     active_sessions_count = db.count_active_sessions(lot_id)
-    upcoming_reservations = db.get_upcoming_reservations(lot_id, minutes=15)
+    upcoming_reservations = db.get_upcoming_reservations(lot_id, minutes=constants.UPCOMING_RESERVATION_MINUTES)
     upcoming_reservations_count = len(upcoming_reservations)
     
     # Calculate available spots
-    occupied_spots = active_sessions_count + upcoming_reservations_count
-    available_spots = capacity - occupied_spots
+    available_spots = db.available_spots(capacity, active_sessions_count, upcoming_reservations_count)
     
     if available_spots <= 0:
         if upcoming_reservations_count > 0:
@@ -197,7 +227,8 @@ async def start_session(lot_id: int, data: SessionStartRequest, authorization: O
         "licenseplate": licenseplate,
         "started": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "stopped": None,
-        "user": username
+        "user": username,
+        "user_id": user_id
     }
     
     session_id = db.create_parking_session(new_session)
@@ -207,6 +238,7 @@ async def start_session(lot_id: int, data: SessionStartRequest, authorization: O
 
 # POST stop parking session
 @router.post("/parking-lots/{lot_id}/sessions/stop")
+@no_compression
 async def stop_session(lot_id: int, data: SessionStopRequest, authorization: Optional[str] = Header(None)):
     # Optional authentication - allow anonymous parking
     # (authorization not needed to stop a session, only license plate matters)
@@ -220,27 +252,28 @@ async def stop_session(lot_id: int, data: SessionStopRequest, authorization: Opt
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Resume any expired grace period sessions first
-    db.check_and_resume_expired_sessions()
+    # Resume an expired grace period session of this plate first
+    db.resume_expired_session(lot_id, licenseplate)
     
     # Find active session for this plate
     active_session = db.get_active_session_by_licenseplate(lot_id, licenseplate)
     if not active_session:
         raise HTTPException(status_code=404, detail="Cannot stop session: no active session for this licenseplate")
     
-    # Stop the session - user now has 15 minutes to exit through barrier
+    # Stop the session - user now has GRACE_PERIOD_MINUTES to exit through barrier
     stopped_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     db.update_parking_session(active_session["id"], {"stopped": stopped_time})
     active_session["stopped"] = stopped_time
     
     return {
-        "message": f"Session stopped for: {licenseplate}. You have 15 minutes to exit through the barrier.",
+        "message": f"Session stopped for: {licenseplate}. You have {constants.GRACE_PERIOD_MINUTES} minutes to exit through the barrier.",
         "session": active_session,
-        "grace_period_minutes": 15
+        "grace_period_minutes": constants.GRACE_PERIOD_MINUTES
     }
 
 # POST barrier verification endpoint (called by barrier when vehicle exits)
 @router.post("/parking-lots/{lot_id}/sessions/verify-exit")
+@no_compression
 async def verify_barrier_exit(lot_id: int, data: BarrierVerificationRequest, authorization: Optional[str] = Header(None)):
     """
     Called by the barrier system when a vehicle exits.
@@ -255,8 +288,8 @@ async def verify_barrier_exit(lot_id: int, data: BarrierVerificationRequest, aut
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    # Resume any expired grace period sessions first
-    db.check_and_resume_expired_sessions()
+    # Resume an expired grace period session of this plate first
+    db.resume_expired_session(lot_id, licenseplate)
     
     # Find session in grace period for this license plate
     grace_period_session = db.get_session_in_grace_period(lot_id, licenseplate)
@@ -292,7 +325,11 @@ async def verify_barrier_exit(lot_id: int, data: BarrierVerificationRequest, aut
  
 # GET all sessions for a parking lot
 @router.get("/parking-lots/{lot_id}/sessions")
-async def get_all_sessions(lot_id: int, authorization: Optional[str] = Header(None)):
+async def get_all_sessions(lot_id: int, response: Response, cursor: Optional[str] = None, limit: Optional[int] = None,
+                           start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           status: Optional[str] = None, plate: Optional[str] = None,
+                           stream: Optional[str] = None, fields: Optional[str] = None,
+                           accept: Optional[str] = Header(None), authorization: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Unauthorized: missing token")
     
@@ -305,17 +342,59 @@ async def get_all_sessions(lot_id: int, authorization: Optional[str] = Header(No
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    sessions = db.get_sessions_by_lot_id(lot_id)
+    # Admins see all sessions, users see only their own (filtered in SQL)
+    user_name = None if session_user.get("role") == "ADMIN" else session_user["username"]
+    try:
+        selected = fields_utils.parse_fields(fields, "p_sessions")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Exports: stream every matching session instead of returning a page
+    fmt = stream_format(stream, accept)
+    if fmt:
+        try:
+            rows = db.iter_sessions_by_lot_id(lot_id, start_date, end_date, status, plate, user_name=user_name,
+                                              fields=selected)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return stream_rows(rows, fmt)
+    
+    try:
+        sessions, next_cursor = db.get_sessions_by_lot_id(lot_id, cursor, limit, start_date, end_date,
+                                                          status, plate, user_name=user_name, fields=selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    set_cursor_header(response, next_cursor)
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+# GET own sessions across all parking lots
+@router.get("/me/sessions")
+async def get_my_sessions(response: Response, cursor: Optional[str] = None, limit: Optional[int] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          status: Optional[str] = None, plate: Optional[str] = None,
+                          fields: Optional[str] = None, authorization: Optional[str] = Header(None)):
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Unauthorized: missing token")
     
-    # Admins see all sessions, users see only their own
-    if session_user.get("role") != "ADMIN":
-        sessions = [s for s in sessions if s.get("user_name") == session_user["username"]]
+    session_user = get_session(authorization)
+    if not session_user:
+        raise HTTPException(status_code=401, detail="Unauthorized: invalid session")
+    
+    try:
+        sessions, next_cursor = db.get_sessions_by_user_name(session_user["username"], cursor, limit,
+                                                             start_date, end_date, status, plate,
+                                                             fields_utils.parse_fields(fields, "p_sessions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    return {"sessions": sessions}
+    set_cursor_header(response, next_cursor)
+    return {"sessions": sessions, "next_cursor": next_cursor}
 
 # GET single session
 @router.get("/parking-lots/{lot_id}/sessions/{session_id}")
-async def get_session_details(lot_id: int, session_id: int, authorization: Optional[str] = Header(None)):
+async def get_session_details(lot_id: int, session_id: int, fields: Optional[str] = None,
+                              authorization: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Unauthorized: missing token")
     
@@ -328,7 +407,14 @@ async def get_session_details(lot_id: int, session_id: int, authorization: Optio
     if not lot_data:
         raise HTTPException(status_code=404, detail="Parking lot not found")
     
-    session_data = db.get_parking_session_by_id(session_id)
+    try:
+        selected = fields_utils.parse_fields(fields, "p_sessions")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # De checks hieronder hebben parking_lot_id en user_name nodig, ook als die niet gevraagd zijn
+    session_data = db.get_parking_session_by_id(session_id,
+                                                fields_utils.with_fields(selected, "parking_lot_id", "user_name"))
     if not session_data or session_data.get("parking_lot_id") != lot_id:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -336,7 +422,7 @@ async def get_session_details(lot_id: int, session_id: int, authorization: Optio
     if session_user.get("role") != "ADMIN" and session_user["username"] != session_data.get("user_name"):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return session_data
+    return fields_utils.pick(session_data, selected)
 
 # DELETE session (ADMIN only)
 @router.delete("/parking-lots/{lot_id}/sessions/{session_id}")
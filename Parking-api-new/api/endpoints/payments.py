@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
@@ -10,11 +10,16 @@ from utils.payment_utils import (
     refund_payment_db,
     get_payment_by_external_ref,
     get_user_payments_db,
+    iter_user_payments_db,
     update_payment_db  
 )
 from utils.discount_utils import apply_discount_to_payment, get_discount_by_code
+from utils.pagination_utils import set_cursor_header
+from utils.streaming_utils import stream_format, stream_rows
+from utils.tracing_utils import TracedRoute
+from utils import fields_utils
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 # ---------- Helpers ----------
 
@@ -94,9 +99,23 @@ async def create_payment(
     return response
 
 @router.get("/payments")
-async def get_my_payments(authorization: Optional[str] = Header(None, alias="Authorization")):
+async def get_my_payments(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    fields: Optional[str] = None,
+    authorization: Optional[str] = Header(None, alias="Authorization")
+):
     user = require_auth(authorization)
-    payments = get_my_payments_db(user["id"])
+    try:
+        payments, next_cursor = get_my_payments_db(user["id"], cursor, limit, start_date, end_date, status,
+                                                   fields_utils.parse_fields(fields, "payments"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_cursor_header(response, next_cursor)
     return payments
 
 # ---------- Additional Endpoints (for apiroutes compatibility) ----------
@@ -145,7 +164,19 @@ async def complete_payment(
     return {"status": "success", "message": "Payment completed"}
 
 @router.get("/payments/{username}")
-async def get_user_payments(username: str, authorization: Optional[str] = Header(None, alias="Authorization")):
+async def get_user_payments(
+    username: str,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    stream: Optional[str] = None,
+    fields: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None, alias="Authorization")
+):
     # Require authentication
     user = require_auth(authorization)
     
@@ -153,5 +184,23 @@ async def get_user_payments(username: str, authorization: Optional[str] = Header
     if user.get("role") != "ADMIN":
         raise HTTPException(status_code=403, detail="Access denied: Admins only")
     
-    payments = get_user_payments_db(username)
+    try:
+        selected = fields_utils.parse_fields(fields, "payments")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Exports: stream every matching payment instead of returning a page
+    fmt = stream_format(stream, accept)
+    if fmt:
+        try:
+            rows = iter_user_payments_db(username, start_date, end_date, status, selected)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return stream_rows(rows, fmt)
+    
+    try:
+        payments, next_cursor = get_user_payments_db(username, cursor, limit, start_date, end_date, status, selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    set_cursor_header(response, next_cursor)
     return payments
@@ -5,8 +5,9 @@ from models.User import User
 from utils import database_utils as db
 from utils import auth_utils
 from utils.session_manager import get_session, update_session
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 class ProfileUpdateRequest(BaseModel):
     password: Optional[str] = None
@@ -1,11 +1,14 @@
 from datetime import datetime
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Optional
 from utils.session_manager import get_session
 from utils import reservations_utils as db
+from utils import etag_utils
+from utils import fields_utils
+from utils.tracing_utils import TracedRoute
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 class ReservationCreateRequest(BaseModel):
     parking_lot_id: int
@@ -83,7 +86,8 @@ async def create_reservation(data: ReservationCreateRequest, authorization: Opti
 
 # GET /reservations/{rid} - Get single reservation
 @router.get("/reservations/{rid}")
-async def get_reservation(rid: int, authorization: Optional[str] = Header(None)):
+async def get_reservation(rid: int, response: Response, fields: Optional[str] = None,
+                          authorization: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Unauthorized: missing token")
     
@@ -91,7 +95,17 @@ async def get_reservation(rid: int, authorization: Optional[str] = Header(None))
     if not session_user:
         raise HTTPException(status_code=401, detail="Unauthorized: invalid session")
     
-    reservation = db.get_reservation_by_id(rid)
+    try:
+        selected = fields_utils.parse_fields(fields, "reservations")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Versie voor de query lezen: een wijziging daartussen geeft hooguit een verouderde ETag, nooit verouderde data
+    version, = etag_utils.get_versions(("reservations", rid))
+    etag = etag_utils.make_etag("reservations", rid, version, session_user.get("id"), selected)
+    
+    # user_id is nodig voor de permission check, ook als het niet gevraagd is
+    reservation = db.get_reservation_by_id(rid, fields_utils.with_fields(selected, "user_id"))
     if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
     
@@ -100,7 +114,12 @@ async def get_reservation(rid: int, authorization: Optional[str] = Header(None))
     if session_user.get("role") != "ADMIN" and user_id != reservation.get("user_id"):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    return reservation
+    # Pas na de 404/403: If-None-Match (ook *) mag niets verraden over andermans reserveringen
+    if etag_utils.matches(if_none_match, etag):
+        return etag_utils.not_modified(etag)
+    
+    response.headers["ETag"] = etag
+    return fields_utils.pick(reservation, selected)
 
 # PUT /reservations/{rid} - Update reservation
 @router.put("/reservations/{rid}")
@@ -191,8 +210,8 @@ async def delete_reservation(rid: int, authorization: Optional[str] = Header(Non
     # Delete reservation
     db.delete_reservation(rid)
     
-    # Update parking lot reserved count
-    if parking_lot_id:
+    # Update parking lot reserved count; verlopen, afgeronde en geannuleerde reserveringen tellen daar al niet meer mee
+    if parking_lot_id and reservation.get("status") in db.ACTIVE_STATUSES:
         db.decrement_reserved_count(parking_lot_id)
     
     return {"status": "Deleted"}
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, HTTPException, Header, Response
 from pydantic import BaseModel
 from typing import Optional, List
 from utils import vehicle_utils
 from utils.session_manager import get_session
+from utils.pagination_utils import set_cursor_header
+from utils.tracing_utils import TracedRoute
+from utils.compression_utils import no_compression
+from utils import fields_utils
 
-router = APIRouter()
+router = APIRouter(route_class=TracedRoute)
 
 # Request/Response models
 class CreateVehicleRequest(BaseModel):
@@ -72,6 +76,7 @@ async def create_vehicle(request: CreateVehicleRequest, authorization: Optional[
 
 
 @router.post("/vehicles/{vehicle_id}/entry")
+@no_compression
 async def vehicle_entry(vehicle_id: str, request: VehicleEntryRequest, authorization: Optional[str] = Header(None)):
     """Register vehicle entry to a parking lot"""
     if not authorization or not get_session(authorization):
@@ -156,29 +161,38 @@ async def delete_vehicle(vehicle_id: str, authorization: Optional[str] = Header(
 
 
 @router.get("/vehicles")
-async def get_vehicles(authorization: Optional[str] = Header(None)):
+async def get_vehicles(fields: Optional[str] = None, authorization: Optional[str] = Header(None)):
     """Get all vehicles for the authenticated user"""
     if not authorization or not get_session(authorization):
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
     
     session_user = get_session(authorization)
     user_id = session_user.get("id")
+    try:
+        selected = fields_utils.parse_fields(fields, "vehicles")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     try:
-        vehicles = vehicle_utils.get_vehicles_by_user_id(user_id)
+        vehicles = vehicle_utils.get_vehicles_by_user_id(user_id, selected)
         return vehicles
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
 @router.get("/vehicles/{vehicle_id}/reservations")
-async def get_vehicle_reservations(vehicle_id: str, authorization: Optional[str] = Header(None)):
+async def get_vehicle_reservations(vehicle_id: str, fields: Optional[str] = None,
+                                   authorization: Optional[str] = Header(None)):
     """Get all reservations for a specific vehicle"""
     if not authorization or not get_session(authorization):
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
     
     session_user = get_session(authorization)
     user_id = session_user.get("id")
+    try:
+        selected = fields_utils.parse_fields(fields, "reservations")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Check of voertuig bestaat en bij user hoort
     vehicle = vehicle_utils.get_vehicle_by_id(vehicle_id, user_id)
@@ -186,14 +200,17 @@ async def get_vehicle_reservations(vehicle_id: str, authorization: Optional[str]
         raise HTTPException(status_code=404, detail="Not found!")
     
     try:
-        reservations = vehicle_utils.get_vehicle_reservations(vehicle_id, user_id)
+        reservations = vehicle_utils.get_vehicle_reservations(vehicle_id, user_id, selected)
         return reservations
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
 @router.get("/vehicles/{vehicle_id}/history")
-async def get_vehicle_history(vehicle_id: str, authorization: Optional[str] = Header(None)):
+async def get_vehicle_history(vehicle_id: str, response: Response, cursor: Optional[str] = None,
+                              limit: Optional[int] = None, start_date: Optional[str] = None,
+                              end_date: Optional[str] = None, status: Optional[str] = None,
+                              fields: Optional[str] = None, authorization: Optional[str] = Header(None)):
     """Get history for a specific vehicle"""
     if not authorization or not get_session(authorization):
         raise HTTPException(status_code=401, detail="Unauthorized: Invalid or missing session token")
@@ -207,7 +224,13 @@ async def get_vehicle_history(vehicle_id: str, authorization: Optional[str] = He
         raise HTTPException(status_code=404, detail="Not found!")
     
     try:
-        history = vehicle_utils.get_vehicle_history(vehicle_id, user_id)
-        return history
+        history, next_cursor = vehicle_utils.get_vehicle_history(vehicle_id, user_id, cursor, limit,
+                                                                 start_date, end_date, status,
+                                                                 fields_utils.parse_fields(fields, "p_sessions"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    
+    set_cursor_header(response, next_cursor)
+    return history
@@ -5,6 +5,7 @@ T = TypeVar('T', bound='Discount')
 
 
 class Discount(ModelInterface):
+    __slots__ = ('id', 'code', 'description', 'percent', 'amount', 'applies_to', 'starts_at', 'ends_at', 'parking_lot_id')
 
     def __init__(self, did: int, code: str = None, description: str = None,
                  percent: float = None, amount: float = None, applies_to: str = 'both',
@@ -4,6 +4,8 @@ from typing import TypeVar, Type, Dict, Any
 T = TypeVar('T', bound='ModelInterface')
 
 class ModelInterface(ABC):
+    __slots__ = ()
+
     @classmethod
     @abstractmethod
     def from_dict(cls: Type[T], data: Dict[str, Any]) -> T:
@@ -5,6 +5,7 @@ T = TypeVar('T', bound='ParkingLot')
 
 
 class ParkingLot(ModelInterface):
+    __slots__ = ('id', 'name', 'location', 'address', 'capacity', 'reserved', 'tariff', 'day_tariff', 'created_at', 'lat', 'lng')
 
     def __init__(self, pid: int, name: str, location: str = None, address: str = None,
                  capacity: int = 0, reserved: int = 0, tariff: float = 0.0,
@@ -5,6 +5,7 @@ T = TypeVar('T', bound='Payment')
 
 
 class Payment(ModelInterface):
+    __slots__ = ('id', 'user_id', 'reservation_id', 'p_session_id', 'amount', 'currency', 'method', 'status', 'created_at', 'paid_at', 'external_ref')
 
     def __init__(self, pid: int = None, user_id: int = None, reservation_id: int = None,
                  p_session_id: int = None, amount: float = 0.0, currency: str = 'EUR',
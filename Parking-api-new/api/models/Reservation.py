@@ -5,6 +5,7 @@ T = TypeVar('T', bound='Reservation')
 
 
 class Reservation(ModelInterface):
+    __slots__ = ('id', 'user_id', 'parking_lot_id', 'vehicle_id', 'start_time', 'end_time', 'status', 'created_at', 'cost')
 
     def __init__(self, rid: int, user_id: int = None, parking_lot_id: int = None,
                  vehicle_id: int = None, start_time: str = None, end_time: str = None,
@@ -5,6 +5,7 @@ T = TypeVar('T', bound='PSession')
 
 
 class PSession(ModelInterface):
+    __slots__ = ('id', 'parking_lot_id', 'user_id', 'vehicle_id', 'license_plate', 'user_name', 'started_at', 'stopped_at', 'duration_minutes', 'cost', 'payment_status', 'verified_exit_at')
 
     def __init__(self, sid: int, parking_lot_id: int, user_id: int = None,
                  vehicle_id: int = None, license_plate: str = None, user_name: str = None,
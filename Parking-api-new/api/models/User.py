@@ -5,6 +5,7 @@ T = TypeVar('T', bound='User')
 
 
 class User(ModelInterface):
+    __slots__ = ('id', 'username', 'password_hash', 'name', 'email', 'phone', 'role', 'created_at', 'birth_year', 'active', 'hash_v', 'salt')
 
     def __init__(self, uid: int, username: str, password_hash: str = None, name: str = None,
                  email: str = None, phone: str = None, role: str = 'USER', created_at: str = None,
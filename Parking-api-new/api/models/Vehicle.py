@@ -5,6 +5,7 @@ T = TypeVar('T', bound='Vehicle')
 
 
 class Vehicle(ModelInterface):
+    __slots__ = ('id', 'user_id', 'license_plate', 'make', 'model', 'color', 'year', 'created_at')
 
     def __init__(self, vid: int, user_id: int = None, license_plate: str = None,
                  make: str = None, model: str = None, color: str = None,
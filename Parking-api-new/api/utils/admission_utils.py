@@ -0,0 +1,196 @@
+"""
+Admission control: how many requests of each route class may run at the same time.
+
+Every request is put in a class by method and path (ROUTE_CLASSES, first match
+wins): barrier and payment calls are "critical", admin listings and exports
+are "bulk", everything else is "default". A class has its own concurrency limit
+and the shared classes (all but critical) together also stay under
+ADMISSION_MAX_CONCURRENCY, so reports can never take the slots of the barrier.
+A request that can't start
+right away waits in the queue of its class; when a slot frees up the queues are
+served in priority order, so a waiting barrier call always goes before a
+waiting report. Requests that wait longer than the deadline of their class, or
+find the queue full, get a 503 with Retry-After.
+
+A request holds its slot until the last body chunk has been sent, so a
+streamed export counts for as long as it streams.
+"""
+import asyncio
+import json
+import math
+import re
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import constants
+from utils import metrics_utils
+
+# (methods, path regex, class); paden zonder match zijn "default"
+ROUTE_CLASSES: List[Tuple[Tuple[str, ...], "re.Pattern", Optional[str]]] = [
+    (("GET",), re.compile(r"^/(health|metrics)$"), None),  # nooit in een queue
+    (("POST",), re.compile(r"^/parking-lots/\d+/sessions/(start|stop|verify-exit)$"), "critical"),
+    (("POST",), re.compile(r"^/vehicles/\d+/entry$"), "critical"),
+    (("POST", "PUT"), re.compile(r"^/payments(/[^/]+)?$"), "critical"),
+    (("GET",), re.compile(r"^/billing/[^/]+$"), "bulk"),
+    (("GET",), re.compile(r"^/payments/[^/]+$"), "bulk"),
+    (("GET",), re.compile(r"^/parking-lots/\d+/sessions$"), "bulk"),
+    (("GET",), re.compile(r"^/discounts$"), "bulk"),
+    (("GET", "POST"), re.compile(r"^/debug/"), "bulk"),
+]
+
+ADMISSION_IN_FLIGHT = metrics_utils.Gauge("admission_in_flight", "Admitted requests currently running per class", ("class",))
+ADMISSION_QUEUED = metrics_utils.Gauge("admission_queued", "Requests waiting for admission per class", ("class",))
+ADMISSION_WAIT = metrics_utils.Histogram("admission_wait_seconds", "Time requests waited for admission per class",
+                                         ("class",), metrics_utils.HTTP_BUCKETS)
+ADMISSION_ADMITTED = metrics_utils.Counter("admission_admitted_total", "Admitted requests per class", ("class",))
+ADMISSION_REJECTED = metrics_utils.Counter("admission_rejected_total", "Requests shed with a 503 per class and reason",
+                                           ("class", "reason"))
+
+
+class Rejected(Exception):
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+
+    def __init__(self, name: str, priority: int, limit: int, max_queue: int, deadline: float, shared: bool = True):
+        self.name = name
+        self.priority = priority
+        self.shared = shared
+        self.limit = limit
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.in_flight = 0
+        self.queue: deque = deque()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.deadline))
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Route class of a request; None for requests that are never queued"""
+    for methods, pattern, name in ROUTE_CLASSES:
+        if method in methods and pattern.match(path):
+            return name
+    return "default"
+
+
+class AdmissionController:
+    """
+    Slots per class plus a total for the shared classes. Only used from the event loop thread,
+    so the bookkeeping needs no locks.
+    """
+
+    def __init__(self, classes: Dict[str, Dict], max_concurrency: int):
+        self.classes = {name: RouteClass(name, **settings) for name, settings in classes.items()}
+        # Hoogste prioriteit (laagste getal) eerst
+        self._by_priority = sorted(self.classes.values(), key=lambda route_class: route_class.priority)
+        self.max_concurrency = max_concurrency
+        self.shared_in_flight = 0
+
+    def _has_slot(self, route_class: RouteClass) -> bool:
+        if route_class.in_flight >= route_class.limit:
+            return False
+        return not route_class.shared or self.shared_in_flight < self.max_concurrency
+
+    def _admit(self, route_class: RouteClass) -> None:
+        route_class.in_flight += 1
+        if route_class.shared:
+            self.shared_in_flight += 1
+        ADMISSION_IN_FLIGHT.inc((route_class.name,))
+        ADMISSION_ADMITTED.inc((route_class.name,))
+
+    async def acquire(self, name: str) -> None:
+        """Wait for a slot; raises Rejected when the queue is full or the deadline passes"""
+        route_class = self.classes[name]
+        # Zonder wachtrij in de eigen class direct door (anders eerst achteraan aansluiten)
+        if not route_class.queue and self._has_slot(route_class):
+            self._admit(route_class)
+            ADMISSION_WAIT.observe(0.0, (name,))
+            return
+        if len(route_class.queue) >= route_class.max_queue:
+            ADMISSION_REJECTED.inc((name, "queue_full"))
+            raise Rejected("queue_full", route_class.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.queue.append(waiter)
+        ADMISSION_QUEUED.inc((name,))
+        started = time.perf_counter()
+        try:
+            # Een slot dat net voor de timeout is toegekend, geeft wait_for alsnog terug
+            await asyncio.wait_for(waiter, route_class.deadline)
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTED.inc((name, "deadline"))
+            raise Rejected("deadline", route_class.retry_after)
+        except asyncio.CancelledError:
+            # Client weg terwijl het slot al toegekend was: slot teruggeven
+            if waiter.done() and not waiter.cancelled():
+                self.release(name)
+            raise
+        finally:
+            if waiter in route_class.queue:
+                route_class.queue.remove(waiter)
+                ADMISSION_QUEUED.dec((name,))
+            ADMISSION_WAIT.observe(time.perf_counter() - started, (name,))
+
+    def release(self, name: str) -> None:
+        route_class = self.classes[name]
+        route_class.in_flight -= 1
+        if route_class.shared:
+            self.shared_in_flight -= 1
+        ADMISSION_IN_FLIGHT.dec((name,))
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Give free slots to the waiting requests, highest priority class first"""
+        for route_class in self._by_priority:
+            while route_class.queue and self._has_slot(route_class):
+                waiter = route_class.queue.popleft()
+                ADMISSION_QUEUED.dec((route_class.name,))
+                # Een request dat net over zijn deadline ging, is al geannuleerd
+                if not waiter.done():
+                    self._admit(route_class)
+                    waiter.set_result(None)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware; runs inside MetricsMiddleware so shed requests still show up in the request metrics"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController(constants.ADMISSION_CLASSES,
+                                                            constants.ADMISSION_MAX_CONCURRENCY)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not constants.ADMISSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        name = classify(scope.get("method", ""), scope.get("path", ""))
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire(name)
+        except Rejected as e:
+            await _send_503(send, e)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name)
+
+
+async def _send_503(send, rejected: Rejected) -> None:
+    body = json.dumps({"detail": "Server busy, retry later", "reason": rejected.reason}).encode()
+    await send({"type": "http.response.start", "status": 503, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(rejected.retry_after).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
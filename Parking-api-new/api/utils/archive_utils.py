@@ -0,0 +1,128 @@
+"""
+Archival of old parking sessions to a cold archive database.
+
+Sessions with a verified exit older than ARCHIVE_AFTER_DAYS are moved from
+p_sessions into the p_sessions table of the archive database (attached as
+`archive`), in batches. Session reads use session_source() to decide whether
+they also need to read the archive.
+"""
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from utils import database_utils
+from utils.query_registry import register
+import constants
+from utils import tracing_utils
+
+# Alle sessies: hot tabel plus archief (zelfde kolommen, ids blijven uniek)
+ARCHIVED_SESSIONS_SOURCE = "(SELECT * FROM main.p_sessions UNION ALL SELECT * FROM archive.p_sessions)"
+
+# Loopt in id-volgorde verder vanaf de vorige batch, zodat elke batch maar een stuk scant
+ARCHIVE_BATCH_IDS_QUERY = register("""
+                    SELECT id FROM main.p_sessions
+                    WHERE id > ? AND verified_exit_at IS NOT NULL AND verified_exit_at < ?
+                    ORDER BY id
+                    LIMIT ?
+                """)
+COPY_TO_ARCHIVE_QUERY = register(
+    "INSERT OR REPLACE INTO archive.p_sessions SELECT * FROM main.p_sessions WHERE id IN ({placeholders})",
+    placeholders="?, ?")
+DELETE_ARCHIVED_QUERY = register("DELETE FROM main.p_sessions WHERE id IN ({placeholders})", placeholders="?, ?")
+
+
+def archive_cutoff(older_than_days: Optional[int] = None) -> str:
+    """Timestamp before which verified exits are archived"""
+    days = constants.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def session_source(start_date: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    Table expression to read sessions from for a given date range.
+
+    A session is only archived after its verified exit is older than the cutoff,
+    so a range that starts at or after the cutoff can never contain archived rows.
+
+    Args:
+        start_date: Lower bound of the requested started_at range (None = all history)
+
+    Returns:
+        Tuple of (table expression, whether the archive must be attached)
+    """
+    if start_date and start_date >= archive_cutoff():
+        return "p_sessions", False
+    if not os.path.exists(database_utils.get_archive_db_path()):
+        return "p_sessions", False
+    return ARCHIVED_SESSIONS_SOURCE, True
+
+
+def _ensure_archive_schema(conn: sqlite3.Connection) -> None:
+    """Create archive.p_sessions with the same columns (and order) as the hot table"""
+    columns = []
+    for _, name, col_type, _, _, pk in conn.execute("PRAGMA main.table_info(p_sessions)"):
+        columns.append(f"{name} {col_type}{' PRIMARY KEY' if pk else ''}")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS archive.p_sessions ({', '.join(columns)})")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_lot ON p_sessions(parking_lot_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_started ON p_sessions(started_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_user_lot ON p_sessions(user_name, parking_lot_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_user_id ON p_sessions(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_sessions_vehicle ON p_sessions(vehicle_id)")
+
+
+def archive_sessions(older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Move verified-exit sessions older than the cutoff into the archive database.
+
+    Each batch is copied and deleted in its own transaction, so the hot table is
+    never locked for long and an interrupted run can simply be restarted.
+
+    Args:
+        older_than_days: Override for ARCHIVE_AFTER_DAYS (never less: session_source relies on it)
+        batch_size: Override for ARCHIVE_BATCH_SIZE
+
+    Returns:
+        Number of sessions moved
+
+    Raises:
+        ValueError: If older_than_days is below ARCHIVE_AFTER_DAYS
+    """
+    # Jonger archiveren dan ARCHIVE_AFTER_DAYS: die sessies zou session_source voor recente ranges niet meer vinden
+    if older_than_days is not None and older_than_days < constants.ARCHIVE_AFTER_DAYS:
+        raise ValueError(f"Cannot archive sessions younger than ARCHIVE_AFTER_DAYS ({constants.ARCHIVE_AFTER_DAYS})")
+    cutoff = archive_cutoff(older_than_days)
+    batch_size = batch_size or constants.ARCHIVE_BATCH_SIZE
+    moved = 0
+    last_id = 0
+
+    # foreign_keys blijft uit: payments.p_session_id mag niet op NULL gezet worden bij het verplaatsen
+    conn = database_utils.connect(isolation_level=None)
+    try:
+        conn.execute("ATTACH DATABASE ? AS archive", (database_utils.get_archive_db_path(),))
+        _ensure_archive_schema(conn)
+
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [row[0] for row in conn.execute(ARCHIVE_BATCH_IDS_QUERY, (last_id, cutoff, batch_size))]
+                if not ids:
+                    conn.execute("COMMIT")
+                    break
+
+                placeholders = ",".join("?" * len(ids))
+                conn.execute(COPY_TO_ARCHIVE_QUERY.format(placeholders=placeholders), ids)
+                conn.execute(DELETE_ARCHIVED_QUERY.format(placeholders=placeholders), ids)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            moved += len(ids)
+            last_id = ids[-1]
+    finally:
+        conn.close()
+
+    return moved
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__, exclude=("archive_cutoff", "session_source"))
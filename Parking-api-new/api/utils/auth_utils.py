@@ -3,8 +3,9 @@ from typing import Optional
 import bcrypt
 from cryptography.fernet import Fernet
 from fastapi import HTTPException, Header
-from api import constants
-from api.utils import session_manager
+import constants
+from utils import session_manager
+from utils import tracing_utils
 
 _fernet = Fernet(constants.FERNET_KEY)
 
@@ -38,4 +39,8 @@ def get_current_user(authorization: Optional[str] = Header(None)) -> Optional[di
     """Get current user via FastAPI Header dependency"""
     if not authorization:
         return None
-    return session_manager.get_session(authorization)
\ No newline at end of file
+    return session_manager.get_session(authorization)
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__, exclude=("get_current_user",))
@@ -1,11 +1,12 @@
-from typing import List, Dict, Any
-from api.utils.database_utils import execute_query
-from api.utils import session_calculator
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+from utils.database_utils import execute_query, iter_query
+from utils import session_calculator
+from utils import archive_utils
+from utils import pagination_utils
+from utils.query_registry import register
+from utils import tracing_utils
 
-
-def get_user_sessions(user_id: int) -> List[Dict[str, Any]]:
-    """Haal sessies op voor gebruiker met parking lot info"""
-    query = """
+USER_SESSIONS_QUERY = register("""
         SELECT 
             s.id as session_id,
             s.license_plate as licenseplate,
@@ -15,17 +16,44 @@ def get_user_sessions(user_id: int) -> List[Dict[str, Any]]:
             pl.location,
             pl.tariff,
             pl.day_tariff as daytariff
-        FROM p_sessions s
+        FROM {sessions} s
         JOIN parking_lots pl ON s.parking_lot_id = pl.id
-        WHERE s.user_id = ?
+        WHERE s.user_id = ?{date_range}
         ORDER BY s.started_at DESC
+    """, sessions="p_sessions", date_range="")
+
+
+ACTIVE_SESSION_QUERY = register("SELECT 1 FROM p_sessions WHERE user_id = ? AND stopped_at IS NULL LIMIT 1")
+
+
+def has_active_session(user_id: int) -> bool:
+    """Of de gebruiker een lopende sessie heeft (waarvan het bedrag nog oploopt)"""
+    return bool(execute_query(ACTIVE_SESSION_QUERY, (user_id,)))
+
+
+def _session_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Dict[str, str], List[Any], bool]:
     """
-    return execute_query(query, (user_id,))
+    Query template values for an optional started_at range.
 
+    The archive is only attached when the range reaches past the archive cutoff
+    (see archive_utils.session_source).
 
-def get_user_sessions_by_username(username: str) -> List[Dict[str, Any]]:
-    """Haal sessies op voor specifieke gebruiker met parking lot info"""
-    query = """
+    Returns:
+        Tuple of (format values, params, whether the archive must be attached)
+    """
+    conditions, params = pagination_utils.date_range_conditions("s.started_at", start_date, end_date)
+    source, with_archive = archive_utils.session_source(start_date)
+    return {"sessions": source, "date_range": "".join(f" AND {c}" for c in conditions)}, params, with_archive
+
+
+def get_user_sessions(user_id: int, start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Haal sessies op voor gebruiker met parking lot info"""
+    values, params, with_archive = _session_range(start_date, end_date)
+    return execute_query(USER_SESSIONS_QUERY.format(**values), (user_id, *params), with_archive=with_archive)
+
+
+USER_SESSIONS_BY_USERNAME_QUERY = register("""
         SELECT 
             s.id as session_id,
             s.license_plate as licenseplate,
@@ -35,18 +63,37 @@ def get_user_sessions_by_username(username: str) -> List[Dict[str, Any]]:
             pl.location,
             pl.tariff,
             pl.day_tariff as daytariff
-        FROM p_sessions s
+        FROM {sessions} s
         JOIN parking_lots pl ON s.parking_lot_id = pl.id
         JOIN users u ON s.user_id = u.id
-        WHERE u.username = ?
+        WHERE u.username = ?{date_range}
         ORDER BY s.started_at DESC
-    """
-    return execute_query(query, (username,))
+    """, sessions="p_sessions", date_range="")
+
+
+def get_user_sessions_by_username(username: str, start_date: Optional[str] = None,
+                                  end_date: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Haal sessies op voor specifieke gebruiker met parking lot info"""
+    values, params, with_archive = _session_range(start_date, end_date)
+    return execute_query(USER_SESSIONS_BY_USERNAME_QUERY.format(**values), (username, *params),
+                         with_archive=with_archive)
+
+
+def iter_user_sessions_by_username(username: str, start_date: Optional[str] = None,
+                                   end_date: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream sessies van een gebruiker met parking lot info (voor exports)"""
+    values, params, with_archive = _session_range(start_date, end_date)
+    return iter_query(USER_SESSIONS_BY_USERNAME_QUERY.format(**values), (username, *params),
+                      with_archive=with_archive)
 
 
 def format_billing_data(sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """Format sessie data naar billing response"""
-    data = []
+    return list(iter_billing_data(sessions))
+
+
+def iter_billing_data(sessions: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Format sessie data naar billing entries, een voor een (voor streaming)"""
     for row in sessions:
         # Maak parkinglot en session dicts voor calculate_price
         parkinglot = {
@@ -67,13 +114,19 @@ def format_billing_data(sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         transaction = session_calculator.generate_payment_hash(row["session_id"], session)
         payed = session_calculator.check_payment_amount(transaction)
         
-        data.append({
-            "session": {k: v for k, v in session.items() if k in ["licenseplate", "started", "stopped"]} | {"hours": hours, "days": days},
-            "parking": {k: v for k, v in parkinglot.items() if k in ["name", "location", "tariff", "daytariff"]},
+        # De dicts voor calculate_price zijn meteen de payload (geen extra kopieën per row)
+        session["hours"] = hours
+        session["days"] = days
+        
+        yield {
+            "session": session,
+            "parking": parkinglot,
             "amount": amount,
             "thash": transaction,
             "payed": payed,
             "balance": amount - payed
-        })
-    
-    return data
\ No newline at end of file
+        }
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__)
@@ -0,0 +1,224 @@
+"""
+Response compression (brotli or gzip) negotiated through Accept-Encoding.
+
+Responses smaller than COMPRESSION_MIN_SIZE are sent as they are: for a few
+hundred bytes the headers and CPU cost more than they save. Streamed responses
+(exports) are compressed as they stream; the compressor is flushed every
+COMPRESSION_FLUSH_BYTES of input, so a client on a slow link keeps receiving
+data without a flush per row. Endpoints marked with @no_compression (the tiny
+barrier responses) skip all of this.
+
+When an encoding is negotiated the ETag is made weak (W/"..."), also for
+responses under the threshold and for 304s: the bytes differ per encoding, the
+data does not, and If-None-Match uses weak comparison anyway.
+"""
+import time
+import zlib
+from typing import Callable, List, Optional, Tuple
+import brotli
+import constants
+from utils import metrics_utils
+
+# Content types die de moeite waard zijn (prefix match); afbeeldingen, profielen e.d. niet
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml", "application/javascript",
+                      "application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# Voorkeur van de server bij gelijke q-waarde
+ENCODINGS = ("br", "gzip")
+
+RATIO_BUCKETS = (0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7, 0.9, 1.0)
+
+COMPRESSED_RESPONSES = metrics_utils.Counter("http_compressed_responses_total", "Compressed responses per encoding",
+                                             ("encoding",))
+COMPRESSION_INPUT_BYTES = metrics_utils.Counter("http_compression_input_bytes_total",
+                                                "Response bytes before compression", ("encoding",))
+COMPRESSION_OUTPUT_BYTES = metrics_utils.Counter("http_compression_output_bytes_total",
+                                                 "Response bytes after compression", ("encoding",))
+COMPRESSION_CPU_SECONDS = metrics_utils.Counter("http_compression_cpu_seconds_total",
+                                                "CPU time spent compressing responses", ("encoding",))
+COMPRESSION_RATIO = metrics_utils.Histogram("http_compression_ratio", "Compressed size / original size per route",
+                                            ("route",), RATIO_BUCKETS)
+
+
+def no_compression(endpoint: Callable) -> Callable:
+    """Decorator (below the route decorator): never compress responses of this endpoint"""
+    endpoint.no_compression = True
+    return endpoint
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Best supported encoding in an Accept-Encoding header, None for identity"""
+    if not accept_encoding:
+        return None
+    qualities = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    best = None
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, encoding)
+    return best[1] if best else None
+
+
+class _Compressor:
+    """Incremental compressor for one response; keeps the CPU time it used"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        self.cpu_seconds = 0.0
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=constants.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits 31: gzip header en trailer
+            self._zlib = zlib.compressobj(constants.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        started = time.thread_time()
+        if self.encoding == "br":
+            output = self._brotli.process(data) + (self._brotli.flush() if flush else b"")
+        else:
+            output = self._zlib.compress(data) + (self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+        self.cpu_seconds += time.thread_time() - started
+        return output
+
+    def finish(self) -> bytes:
+        started = time.thread_time()
+        output = self._brotli.finish() if self.encoding == "br" else self._zlib.flush()
+        self.cpu_seconds += time.thread_time() - started
+        return output
+
+
+def header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    """Value of a header in an ASGI header list (name in lower case), None if absent"""
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def weak_etag(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    """Headers with a strong ETag made weak; also used for other re-encodings (msgpack_utils)"""
+    return [(key, b"W/" + value if key.lower() == b"etag" and value.startswith(b'"') else value)
+            for key, value in headers]
+
+
+def _compressible(status: int, headers: List[Tuple[bytes, bytes]]) -> bool:
+    if status < 200 or status in (204, 304) or header(headers, b"content-encoding") is not None:
+        return False
+    content_type = (header(headers, b"content-type") or b"").decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware; the decision is made at the first body chunk, when the
+    route, the headers and (for a single-chunk response) the size are known.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = header(scope.get("headers", []), b"accept-encoding")
+        encoding = choose_encoding(accept_encoding.decode("latin-1") if accept_encoding else None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        pending: List[bytes] = []  # body die nog niet verstuurd is (onder de drempel)
+        compressor: Optional[_Compressor] = None
+        since_flush = 0
+        input_bytes = output_bytes = 0
+
+        async def send_start(headers):
+            await send({**start, "headers": headers})
+
+        async def send_wrapper(message):
+            nonlocal start, compressor, since_flush, input_bytes, output_bytes
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                if message["status"] == 304:
+                    # Zelfde (zwakke) ETag als de 200 die de client onder deze Accept-Encoding kreeg
+                    start = False
+                    await send({**message, "headers": weak_etag(headers)})
+                    return
+                route = scope.get("route")
+                if not _compressible(message["status"], headers) or getattr(getattr(route, "endpoint", None),
+                                                                            "no_compression", False):
+                    start = False
+                    await send(message)
+                    return
+                # Ook onder de drempel zwak, zodat 200 en 304 dezelfde ETag hebben
+                start = {**message, "headers": weak_etag(headers)}
+                return
+            if message["type"] != "http.response.body" or start is False:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                pending.append(body)
+                size = sum(len(chunk) for chunk in pending)
+                if size < constants.COMPRESSION_MIN_SIZE:
+                    if more_body:
+                        return
+                    # Klein antwoord: ongewijzigd versturen
+                    await send_start(start["headers"])
+                    await send({"type": "http.response.body", "body": b"".join(pending)})
+                    return
+                compressor = _Compressor(encoding)
+                body = b"".join(pending)
+                pending.clear()
+                headers = [(key, value) for key, value in start["headers"] if key.lower() != b"content-length"]
+                vary = header(headers, b"vary")
+                headers = [(key, value) for key, value in headers if key.lower() != b"vary"]
+                headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    output = compressor.compress(body) + compressor.finish()
+                    headers.append((b"content-length", str(len(output)).encode()))
+                    await send_start(headers)
+                    await send({"type": "http.response.body", "body": output})
+                    finish(len(body), len(output))
+                    return
+                await send_start(headers)
+
+            input_bytes += len(body)
+            since_flush += len(body)
+            flush = since_flush >= constants.COMPRESSION_FLUSH_BYTES
+            if flush:
+                since_flush = 0
+            output = compressor.compress(body, flush=flush)
+            if not more_body:
+                output += compressor.finish()
+            output_bytes += len(output)
+            if output or not more_body:
+                await send({"type": "http.response.body", "body": output, "more_body": more_body})
+            if not more_body:
+                finish(input_bytes, output_bytes)
+
+        def finish(original: int, compressed: int) -> None:
+            COMPRESSED_RESPONSES.inc((encoding,))
+            COMPRESSION_INPUT_BYTES.inc((encoding,), original)
+            COMPRESSION_OUTPUT_BYTES.inc((encoding,), compressed)
+            COMPRESSION_CPU_SECONDS.inc((encoding,), compressor.cpu_seconds)
+            if original:
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                COMPRESSION_RATIO.observe(compressed / original, (route,))
+
+        await self.app(scope, receive, send_wrapper)
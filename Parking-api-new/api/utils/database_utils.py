@@ -1,11 +1,21 @@
 import sqlite3
 import os
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from contextlib import contextmanager
 from datetime import datetime
+from utils import metrics_utils
+from utils import slowquery_utils
+from utils import tracing_utils
+from utils.query_registry import register
+import constants
 
 def get_db_path():
-    """Geeft database pad (test DB als TEST_MODE=true)"""
+    """Geeft database pad (DATABASE_PATH als die gezet is, anders test DB als TEST_MODE=true)"""
+    # Expliciet pad, bv. een gegenereerde dataset voor benchmarks of load tests
+    if os.environ.get('DATABASE_PATH'):
+        return os.environ['DATABASE_PATH']
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
     
     # Gebruik een test database als TEST_MODE=true
@@ -16,11 +26,64 @@ def get_db_path():
     
     return os.path.join(current_dir, '..', 'data', db_name)
 
+def _statement_timed(conn: sqlite3.Connection, sql: str, parameters, seconds: float) -> None:
+    metrics_utils.observe_query(sql, seconds)
+    tracing_utils.record_statement(sql, seconds)
+    if seconds * 1000 >= constants.SLOW_QUERY_THRESHOLD_MS:
+        slowquery_utils.record(conn, sql, parameters, seconds)
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor die de uitvoertijd van elk statement doorgeeft aan metrics_utils, tracing en het slow-query log"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _statement_timed(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _statement_timed(self.connection, sql, None, time.perf_counter() - started)
+
+class TimedConnection(sqlite3.Connection):
+    """Connectie waarvan cursors (ook die van conn.execute) TimedCursors zijn"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(db_path: Optional[str] = None, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect met query timing; gebruik dit in plaats van sqlite3.connect"""
+    return sqlite3.connect(db_path or get_db_path(), factory=TimedConnection, **kwargs)
+
+def get_archive_db_path():
+    """Geeft pad van de archief database met oude, afgeronde sessies"""
+    return get_db_path().replace('.sqlite3', '_archive.sqlite3')
+
+def attach_archive(conn: sqlite3.Connection) -> bool:
+    """Attach de archief database als 'archive' (alleen als die bestaat), geeft of dat gelukt is"""
+    archive_path = get_archive_db_path()
+    if not os.path.exists(archive_path):
+        return False
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    return True
+
 @contextmanager
-def get_db_connection():
-    """Database connectie context manager"""
-    conn = sqlite3.connect(get_db_path())
+def get_db_connection(with_archive: bool = False):
+    """Database connectie context manager (optioneel met de archief database attached)"""
+    conn = connect()
     conn.row_factory = sqlite3.Row 
+    if with_archive:
+        attach_archive(conn)
     try:
         yield conn
         conn.commit()
@@ -30,13 +93,50 @@ def get_db_connection():
     finally:
         conn.close()
 
-def execute_query(query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+def execute_query(query: str, params: tuple = (), with_archive: bool = False) -> List[Dict[str, Any]]:
     """Voer SELECT query uit, geeft list van dicts"""
-    with get_db_connection() as conn:
+    with get_db_connection(with_archive) as conn:
+        cursor = conn.cursor()
+        # Plain tuples, direct naar dict: geen sqlite3.Row per row die daarna weer gekopieerd wordt
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        if cursor.description is None:
+            return []
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def iter_query(query: str, params: tuple = (), chunk_size: int = 500,
+               with_archive: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Voer SELECT query uit en geef rows een voor een terug (generator).
+    Haalt per fetchmany chunk op zodat het geheugen begrensd blijft, ongeacht het aantal rows.
+    De connectie blijft open tot de generator klaar is of gesloten wordt.
+    """
+    conn = connect()
+    try:
+        if with_archive:
+            attach_archive(conn)
         cursor = conn.cursor()
         cursor.execute(query, params)
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
+        columns = [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+    finally:
+        conn.close()
+
+CREATE_USER_QUERY = register("""
+        INSERT INTO users (username, password_hash, name, email, phone, 
+                          role, birth_year, active, hash_v, salt, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+    """)
+USER_BY_USERNAME_QUERY = register("SELECT * FROM users WHERE username = ?")
+USER_BY_EMAIL_QUERY = register("SELECT * FROM users WHERE email = ?")
+USER_BY_PHONE_QUERY = register("SELECT * FROM users WHERE phone = ?")
+UPDATE_USER_QUERY = register("UPDATE users SET {assignments} WHERE username = ?", assignments="name = ?")
 
 def create_user(username: str, password_hash: str, name: str, email: str, 
                 phone: str, birth_year: int, role: str = 'USER', 
@@ -44,14 +144,9 @@ def create_user(username: str, password_hash: str, name: str, email: str,
     """Maak nieuwe gebruiker, geeft user ID"""
     created_at = datetime.now().strftime("%Y-%m-%dT00:00:00Z")
     
-    query = """
-        INSERT INTO users (username, password_hash, name, email, phone, 
-                          role, birth_year, active, hash_v, salt, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
-    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (username, password_hash, name, email, phone, 
+        cursor.execute(CREATE_USER_QUERY, (username, password_hash, name, email, phone, 
                               role, birth_year, hash_v, salt, created_at))
         return cursor.lastrowid
     
@@ -61,33 +156,25 @@ def create_admin_user(username: str, password_hash: str, name: str, email: str,
     """Maak nieuwe admin, geeft admin ID"""
     created_at = datetime.now().strftime("%Y-%m-%dT00:00:00Z")
     
-    query = """
-        INSERT INTO users (username, password_hash, name, email, phone, 
-                          role, birth_year, active, hash_v, salt, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
-    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (username, password_hash, name, email, phone, 
+        cursor.execute(CREATE_USER_QUERY, (username, password_hash, name, email, phone, 
                               role, birth_year, hash_v, salt, created_at))
         return cursor.lastrowid
 
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
     """Get user by username"""
-    query = "SELECT * FROM users WHERE username = ?"
-    results = execute_query(query, (username,))
+    results = execute_query(USER_BY_USERNAME_QUERY, (username,))
     return results[0] if results else None
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Get user by email"""
-    query = "SELECT * FROM users WHERE email = ?"
-    results = execute_query(query, (email,))
+    results = execute_query(USER_BY_EMAIL_QUERY, (email,))
     return results[0] if results else None
 
 def get_user_by_phone(phone: str) -> Optional[Dict[str, Any]]:
     """Get user by phonenumber"""
-    query = "SELECT * FROM users WHERE phone = ?"
-    results = execute_query(query, (phone,))
+    results = execute_query(USER_BY_PHONE_QUERY, (phone,))
     return results[0] if results else None
 
 def update_user_by_username(username: str, fields: dict) -> int:
@@ -105,12 +192,94 @@ def update_user_by_username(username: str, fields: dict) -> int:
         params.append(v)
 
     params.append(username)
-    query = f"UPDATE users SET {', '.join(cols)} WHERE username = ?"
+    query = UPDATE_USER_QUERY.format(assignments=", ".join(cols))
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(query, tuple(params))
         return cursor.rowcount
+
+ALL_USERS_QUERY = register("SELECT * FROM users ORDER BY created_at DESC", allow_scan=True)
+
 def get_all_users() -> List[Dict[str, Any]]:
     """Get alle users"""
-    query = "SELECT * FROM users ORDER BY created_at DESC"
-    return execute_query(query)
+    return execute_query(ALL_USERS_QUERY)
+
+# Tabellen van de API zelf (niet uit de oorspronkelijke data): leases van achtergrond jobs, dagtotalen per lot
+# en versienummers voor ETags
+def _version_triggers(table: str, entity: str, key: Optional[str]) -> List[str]:
+    """Triggers die bij elke wijziging van `table` de versie van (entity, key kolom of 0) ophogen"""
+    def bump(operation: str, row: str) -> str:
+        entity_id = f"COALESCE({row}.{key}, 0)" if key else "0"
+        # OLD bij een update alleen als de key verandert (anders telt dezelfde versie dubbel)
+        condition = f" WHERE OLD.{key} IS NOT NEW.{key}" if operation == "UPDATE" and row == "OLD" else ""
+        return (f"INSERT INTO entity_versions (entity, entity_id, version) SELECT '{entity}', {entity_id}, 1{condition} "
+                f"ON CONFLICT (entity, entity_id) DO UPDATE SET version = version + 1;")
+    rows = {"INSERT": ("NEW",), "UPDATE": ("OLD", "NEW") if key else ("NEW",), "DELETE": ("OLD",)}
+    return [f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{operation.lower()}_version AFTER {operation} ON {table} "
+            f"BEGIN {' '.join(bump(operation, row) for row in rows[operation])} END"
+            for operation in rows]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS job_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        lease_until TEXT NOT NULL,
+        last_started_at TEXT,
+        last_finished_at TEXT,
+        last_status TEXT,
+        last_error TEXT,
+        last_duration_ms REAL
+    )""",
+    """CREATE TABLE IF NOT EXISTS lot_daily_stats (
+        parking_lot_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        sessions INTEGER NOT NULL,
+        minutes INTEGER NOT NULL,
+        revenue REAL NOT NULL,
+        updated_at TEXT NOT NULL,
+        PRIMARY KEY (parking_lot_id, day)
+    )""",
+    """CREATE TABLE IF NOT EXISTS entity_versions (
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        PRIMARY KEY (entity, entity_id)
+    )""",
+    # Lots en betalingen als geheel (lijst endpoint, billing), reserveringen per id, sessies per user (billing)
+    *_version_triggers("parking_lots", "parking_lots", None),
+    *_version_triggers("reservations", "reservations", "id"),
+    *_version_triggers("p_sessions", "billing", "user_id"),
+    *_version_triggers("payments", "payments", None),
+]
+
+# Indexes die de app nodig heeft; idempotent aangemaakt bij startup
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_lot ON p_sessions(parking_lot_id)",
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_started ON p_sessions(started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_vehicle ON p_sessions(vehicle_id)",
+    # user_name eerst zodat zowel (lot, user) als alle sessies van een user dezelfde index gebruiken
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_user_lot ON p_sessions(user_name, parking_lot_id)",
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_user_id ON p_sessions(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_user ON payments(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_created ON payments(created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_external_ref ON payments(external_ref)",
+    # Sessies die gestopt maar nog niet via de slagboom vertrokken zijn (grace period check); klein, want partieel
+    "CREATE INDEX IF NOT EXISTS idx_p_sessions_pending_exit ON p_sessions(stopped_at) WHERE verified_exit_at IS NULL",
+    "CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)",
+    "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
+    "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
+    "CREATE INDEX IF NOT EXISTS idx_vehicles_user_plate ON vehicles(user_id, license_plate)",
+    "CREATE INDEX IF NOT EXISTS idx_reservations_lot ON reservations(parking_lot_id)",
+    "CREATE INDEX IF NOT EXISTS idx_reservations_vehicle ON reservations(vehicle_id)",
+    # Openstaande reserveringen op eindtijd, voor de reservation lifecycle job
+    "CREATE INDEX IF NOT EXISTS idx_reservations_open_end ON reservations(datetime(end_time)) WHERE status IN ('pending', 'confirmed')",
+    # Expression index voor de hoofdletterongevoelige lookup WHERE LOWER(code) = LOWER(?)
+    "CREATE INDEX IF NOT EXISTS idx_discounts_code_lower ON discounts(LOWER(code))",
+    "CREATE INDEX IF NOT EXISTS idx_parking_lot_managers_user ON parking_lot_managers(user_id, parking_lot_id)",
+]
+
+def ensure_indexes() -> None:
+    """Maak ontbrekende tabellen en indexes aan"""
+    with get_db_connection() as conn:
+        for statement in SCHEMA + INDEXES:
+            conn.execute(statement)
@@ -4,6 +4,12 @@ Discount utilities for validating and applying discount codes
 from datetime import datetime, timezone
 from typing import Optional, Dict, Any
 from utils.database_utils import execute_query
+from utils.query_registry import register
+from utils import tracing_utils
+
+DISCOUNT_BY_ID_QUERY = register("SELECT * FROM discounts WHERE id = ?")
+# Hoofdletterongevoelig: gebruikt de expression index idx_discounts_code_lower
+DISCOUNT_BY_CODE_QUERY = register("SELECT * FROM discounts WHERE LOWER(code) = LOWER(?)")
 
 
 def get_discount_by_id(discount_id: int) -> Optional[Dict[str, Any]]:
@@ -16,10 +22,7 @@ def get_discount_by_id(discount_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Discount record or None if not found
     """
-    results = execute_query(
-        "SELECT * FROM discounts WHERE id = ?",
-        (discount_id,)
-    )
+    results = execute_query(DISCOUNT_BY_ID_QUERY, (discount_id,))
     return results[0] if results else None
 
 
@@ -33,10 +36,7 @@ def get_discount_by_code(code: str) -> Optional[Dict[str, Any]]:
     Returns:
         Discount record or None if not found
     """
-    results = execute_query(
-        "SELECT * FROM discounts WHERE LOWER(code) = LOWER(?)",
-        (code,)
-    )
+    results = execute_query(DISCOUNT_BY_CODE_QUERY, (code,))
     return results[0] if results else None
 
 
@@ -121,3 +121,7 @@ def apply_discount_to_payment(
     final_amount = amount - discount_amount
     
     return True, final_amount, None
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__)
@@ -0,0 +1,57 @@
+"""
+Strong ETags for conditional GETs, based on version counters in the database.
+
+Triggers (database_utils.SCHEMA) raise the version in entity_versions on every
+write to the tables behind an endpoint. An endpoint reads the versions it
+depends on (a primary key lookup each), builds the ETag from them plus
+everything else that shapes the response (query parameters, user), and
+answers a matching If-None-Match with 304 before running its real query.
+
+The ETag is a keyed hash, so a client can't produce a matching tag for data it
+has never been allowed to see.
+"""
+import hashlib
+from typing import Optional, Tuple
+from fastapi import Response
+import constants
+from utils import database_utils, metrics_utils
+from utils.query_registry import register
+
+VERSION_QUERY = register("SELECT version FROM entity_versions WHERE entity = ? AND entity_id = ?")
+
+NOT_MODIFIED = metrics_utils.Counter("http_not_modified_total", "Conditional GETs answered with 304 per route", ("route",))
+
+# De versie van een hele tabel (lijst endpoints) staat onder entity_id 0
+COLLECTION = 0
+
+
+def get_versions(*keys: Tuple[str, int]) -> Tuple[int, ...]:
+    """Current version per (entity, entity_id); 0 for entities that were never written since the triggers exist"""
+    with database_utils.get_db_connection() as conn:
+        versions = []
+        for entity, entity_id in keys:
+            row = conn.execute(VERSION_QUERY, (entity, entity_id)).fetchone()
+            versions.append(row[0] if row else 0)
+        return tuple(versions)
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12, key=constants.FERNET_KEY.encode()[:64])
+    return f'"{digest.hexdigest()}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 prescribes for this header)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    route = metrics_utils.request_route()
+    NOT_MODIFIED.inc((route.split(" ", 1)[1] if route else "unmatched",))
+    return Response(status_code=304, headers={"ETag": etag})
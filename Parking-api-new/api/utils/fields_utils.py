@@ -0,0 +1,72 @@
+"""
+Sparse fieldsets: `?fields=id,name,capacity` on the list and detail endpoints.
+
+Only the requested columns are selected in SQL and only those keys are
+serialized. The allowed names are the columns of the table behind the
+endpoint (read once per table with PRAGMA table_info); anything else is a
+ValueError, so a field name never reaches the SQL unchecked. `id` is always
+included: clients need it and keyset pagination pages over it.
+"""
+from typing import Any, Dict, Mapping, Optional, Tuple
+from utils import database_utils
+
+# Tabel -> kolommen, gevuld bij de eerste fields= op die tabel
+_table_columns: Dict[str, Tuple[str, ...]] = {}
+
+
+def table_columns(table: str) -> Tuple[str, ...]:
+    if table not in _table_columns:
+        with database_utils.get_db_connection() as conn:
+            _table_columns[table] = tuple(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+    return _table_columns[table]
+
+
+def parse_fields(fields: Optional[str], table: str) -> Optional[Tuple[str, ...]]:
+    """
+    Validate a fields= parameter against the columns of a table.
+
+    Returns:
+        The selected columns in request order with id first, or None for all columns
+
+    Raises:
+        ValueError: For an empty list or an unknown field
+    """
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        raise ValueError("fields must name at least one field")
+    columns = table_columns(table)
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}; available: {', '.join(columns)}")
+    return tuple(dict.fromkeys(["id"] + names))
+
+
+def columns(fields: Optional[Tuple[str, ...]], prefix: str = "") -> str:
+    """SELECT list for parsed fields (prefix for a table alias, e.g. "p.")"""
+    if fields is None:
+        return f"{prefix}*"
+    return ", ".join(f"{prefix}{name}" for name in fields)
+
+
+def columns_with_defaults(fields: Optional[Tuple[str, ...]], table: str, defaults: Mapping[str, Any]) -> str:
+    """SELECT list like columns(), with COALESCE(column, default) for the columns in defaults (all columns without fields)"""
+    names = table_columns(table) if fields is None else fields
+    return ", ".join(f"COALESCE({name}, {defaults[name]!r}) AS {name}" if name in defaults else name for name in names)
+
+
+def with_fields(fields: Optional[Tuple[str, ...]], *required: str) -> Optional[Tuple[str, ...]]:
+    """Fields plus the columns an endpoint itself needs (e.g. for a permission check)"""
+    if fields is None:
+        return None
+    return tuple(dict.fromkeys(fields + required))
+
+
+def pick(row: Optional[Mapping[str, Any]], fields: Optional[Tuple[str, ...]]) -> Optional[Dict[str, Any]]:
+    """Only the requested keys of a row; the whole row as a dict without fields"""
+    if row is None:
+        return None
+    if fields is None:
+        return dict(row)
+    return {name: row[name] for name in fields}
@@ -0,0 +1,214 @@
+"""
+Background jobs that run for as long as the app runs (started from the lifespan in apiroutes).
+
+A job runs either every `interval` seconds or once a day at `daily_at` ("HH:MM"),
+with a random delay of up to `jitter` seconds so workers don't all fire at the
+same moment. The work itself runs in a thread (the utils functions are blocking)
+and is abandoned after `timeout` seconds.
+
+With several workers every worker schedules every job, but a run first takes the
+lease of the job in the job_leases table. A lease is held while the job runs and
+for half a period afterwards, so each period only one worker does the work.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from utils import database_utils, metrics_utils
+from utils.query_registry import register
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+JOB_RUNS = metrics_utils.Counter("job_runs_total", "Background job runs per job and outcome", ("job", "status"))
+JOB_DURATION = metrics_utils.Histogram("job_duration_seconds", "Background job run time", ("job",),
+                                       (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+JOB_ITEMS = metrics_utils.Counter("job_items_total", "Rows handled by background jobs", ("job",))
+
+# Het lease wordt alleen overgenomen als het verlopen is (of al van ons is)
+ACQUIRE_LEASE_QUERY = register("""
+        INSERT INTO job_leases (name, owner, lease_until, last_started_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner = excluded.owner, lease_until = excluded.lease_until, last_started_at = excluded.last_started_at
+        WHERE job_leases.lease_until < ? OR job_leases.owner = excluded.owner
+    """)
+FINISH_LEASE_QUERY = register("""
+        UPDATE job_leases
+        SET lease_until = ?, last_finished_at = ?, last_status = ?, last_error = ?, last_duration_ms = ?
+        WHERE name = ? AND owner = ?
+    """)
+LEASES_QUERY = register("SELECT * FROM job_leases", allow_scan=True)
+
+log = logging.getLogger("Jobs")
+
+# Identificeert deze worker in job_leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+class Job:
+
+    def __init__(self, name: str, func: Callable[[], Any], interval: Optional[float] = None,
+                 daily_at: Optional[str] = None, jitter: float = 0, timeout: float = 300):
+        if (interval is None) == (daily_at is None):
+            raise ValueError("a job needs either an interval or daily_at")
+        if daily_at is not None:
+            datetime.strptime(daily_at, "%H:%M")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.daily_at = daily_at
+        self.jitter = jitter
+        self.timeout = timeout
+        self.next_run_at: Optional[datetime] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._running: Optional[asyncio.Future] = None
+
+    @property
+    def period(self) -> float:
+        return self.interval if self.interval is not None else 24 * 3600
+
+    @property
+    def running(self) -> bool:
+        return self._running is not None and not self._running.done()
+
+    def schedule_next(self, now: datetime) -> datetime:
+        """Next planned run after `now`, including a random jitter"""
+        if self.interval is not None:
+            planned = now + timedelta(seconds=self.interval)
+        else:
+            hour, minute = map(int, self.daily_at.split(":"))
+            planned = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if planned <= now:
+                planned += timedelta(days=1)
+        self.next_run_at = planned + timedelta(seconds=random.uniform(0, self.jitter))
+        return self.next_run_at
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "schedule": f"every {self.interval:g}s" if self.interval is not None else f"daily at {self.daily_at}",
+            "jitter_seconds": self.jitter,
+            "timeout_seconds": self.timeout,
+            "running": self.running,
+            "next_run_at": self.next_run_at.strftime(TIME_FORMAT) if self.next_run_at else None,
+            "last_run": self.last_run,
+        }
+
+
+class Scheduler:
+
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"job {job.name} is already registered")
+        self.jobs[job.name] = job
+        return job
+
+    def start(self) -> None:
+        """Start a loop per job on the running event loop"""
+        now = _now()
+        for job in self.jobs.values():
+            job.schedule_next(now)
+            self._tasks.append(asyncio.get_running_loop().create_task(self._loop(job), name=f"job-{job.name}"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(max(0.0, (job.next_run_at - datetime.now()).total_seconds()))
+            try:
+                await self.run(job.name)
+            except Exception:
+                log.exception("Job %s could not be run", job.name)
+            job.schedule_next(_now())
+
+    async def run(self, name: str) -> Dict[str, Any]:
+        """
+        Run a job now if this worker can take its lease.
+
+        Returns:
+            The outcome, also stored as job.last_run (status success, error, timeout,
+            or skipped when it is still running or another worker holds the lease)
+
+        Raises:
+            KeyError: For an unknown job
+        """
+        job = self.jobs[name]
+        started = _now()
+        if job.running:
+            return self._record(job, started, "skipped", 0, error="previous run still running")
+        if not await asyncio.to_thread(acquire_lease, job.name, started + timedelta(seconds=job.timeout)):
+            return self._record(job, started, "skipped", 0, error="lease held by another worker")
+
+        job._running = asyncio.ensure_future(asyncio.to_thread(job.func))
+        began = time.perf_counter()
+        result, error, status = None, None, "success"
+        try:
+            # shield: bij een timeout loopt de thread door, maar wachten we er niet meer op
+            result = await asyncio.wait_for(asyncio.shield(job._running), job.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"no result after {job.timeout:g}s"
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            log.error("Job %s failed: %s", job.name, error)
+        duration = time.perf_counter() - began
+
+        JOB_DURATION.observe(duration, (job.name,))
+        if isinstance(result, int) and not isinstance(result, bool):
+            JOB_ITEMS.inc((job.name,), result)
+        # Het lease blijft een halve periode staan, zodat andere workers deze periode overslaan
+        await asyncio.to_thread(finish_lease, job.name, started + timedelta(seconds=job.period / 2),
+                                status, error, duration)
+        return self._record(job, started, status, duration, error=error, result=result)
+
+    def _record(self, job: Job, started: datetime, status: str, duration: float,
+                error: Optional[str] = None, result: Any = None) -> Dict[str, Any]:
+        JOB_RUNS.inc((job.name, status))
+        outcome = {"status": status, "started_at": started.strftime(TIME_FORMAT),
+                   "duration_ms": round(duration * 1000, 1)}
+        if error:
+            outcome["error"] = error
+        if result is not None:
+            outcome["result"] = result
+        if status != "skipped" or job.last_run is None:
+            job.last_run = outcome
+        return outcome
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Local schedule per job plus the lease row that all workers share"""
+        leases = {lease["name"]: lease for lease in get_leases()}
+        return [{**job.describe(), "lease": leases.get(job.name)} for job in self.jobs.values()]
+
+
+def acquire_lease(name: str, until: datetime) -> bool:
+    """Take the lease of a job for this worker; False if another worker holds it"""
+    now = _now().strftime(TIME_FORMAT)
+    with database_utils.get_db_connection() as conn:
+        cursor = conn.execute(ACQUIRE_LEASE_QUERY, (name, WORKER_ID, until.strftime(TIME_FORMAT), now, now))
+        return cursor.rowcount == 1
+
+
+def finish_lease(name: str, until: datetime, status: str, error: Optional[str], duration: float) -> None:
+    with database_utils.get_db_connection() as conn:
+        conn.execute(FINISH_LEASE_QUERY, (until.strftime(TIME_FORMAT), _now().strftime(TIME_FORMAT), status, error,
+                                          round(duration * 1000, 1), name, WORKER_ID))
+
+
+def get_leases() -> List[Dict[str, Any]]:
+    return database_utils.execute_query(LEASES_QUERY)
@@ -0,0 +1,118 @@
+"""
+Event loop lag monitor.
+
+A task on the event loop sleeps for a fixed interval and measures how late it
+wakes up (the lag). A watchdog thread watches the heartbeat of that task: when
+the loop has not come back for longer than the threshold, something is blocking
+it (sqlite, bcrypt, ...), so the watchdog samples the stack of the loop thread
+and logs the blocking frame, e.g. auth_utils.verify_password.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+import constants
+from utils import metrics_utils
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules die zelf niet blokkeren maar wel bovenaan elke stack staan
+_SKIP_MODULES = ("database_utils", "metrics_utils", "slowquery_utils", "looplag_utils", "customlogger")
+
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+EVENT_LOOP_LAG = metrics_utils.Histogram("event_loop_lag_seconds", "How late the event loop monitor woke up",
+                                         (), LAG_BUCKETS)
+EVENT_LOOP_BLOCKED = metrics_utils.Counter("event_loop_blocked_total",
+                                           "Event loop stalls over the threshold per blocking function", ("function",))
+EVENT_LOOP_BLOCKED_SECONDS = metrics_utils.Counter("event_loop_blocked_seconds_total",
+                                                   "Time the event loop was stalled per blocking function", ("function",))
+
+log = logging.getLogger("LoopLag")
+
+
+def blocking_frame(frame) -> Optional[str]:
+    """Diepste frame in de API code (bv. parking_lots_utils.get_sessions_by_lot_id), None als er geen is"""
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        module = os.path.splitext(os.path.basename(filename))[0]
+        if filename.startswith(API_DIR + os.sep) and module not in _SKIP_MODULES:
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class LoopLagMonitor:
+
+    def __init__(self, interval: float = None, threshold: float = None):
+        self.interval = interval if interval is not None else constants.LOOP_LAG_INTERVAL_MS / 1000
+        self.threshold = threshold if threshold is not None else constants.LOOP_LAG_THRESHOLD_MS / 1000
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        # Functie die de huidige stall veroorzaakt (gezet door de watchdog, afgerond door de loop task)
+        self._stall_function = None
+
+    def start(self) -> None:
+        """Start the monitor task on the running loop and the watchdog thread"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join()
+
+    async def _measure(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._heartbeat = now
+            EVENT_LOOP_LAG.observe(lag)
+            function = self._stall_function
+            if function is not None:
+                self._stall_function = None
+                EVENT_LOOP_BLOCKED_SECONDS.inc((function,), lag)
+                log.warning("Event loop blocked for %.0f ms by %s", lag * 1000, function)
+
+    def _watch(self) -> None:
+        """Draait in een eigen thread: de loop kan zichzelf niet meten terwijl hij blokkeert"""
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            if heartbeat == reported or time.monotonic() - heartbeat - self.interval < self.threshold:
+                continue
+            # Een keer per stall samplen
+            reported = heartbeat
+            self.sample()
+
+    def sample(self) -> Optional[str]:
+        """Sample the loop thread's stack, log the blocking frame and count it"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        function = blocking_frame(frame) or "unknown"
+        stack = "".join(traceback.format_stack(frame, limit=constants.LOOP_LAG_STACK_DEPTH))
+        del frame
+        self._stall_function = function
+        EVENT_LOOP_BLOCKED.inc((function,))
+        log.warning("Event loop stalled over %.0f ms in %s\n%s", self.threshold * 1000, function, stack)
+        return function
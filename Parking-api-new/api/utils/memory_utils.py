@@ -0,0 +1,195 @@
+"""
+Memory profiling for the admin debug endpoints.
+
+tracemalloc is only started on request (it slows every allocation down), after
+which snapshots can be taken and compared; the biggest growth between two
+snapshots points at the leak. known_structures() reports the size of the
+in-process state that can grow while a worker runs (sessions, caches, metric
+series, in-flight calls, logging) and works without tracemalloc.
+"""
+import gc
+import logging
+import sys
+import threading
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import constants
+
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Allocaties van tracemalloc zelf en van imports zeggen niets over de API
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# id -> (taken_at, snapshot), oudste eerst
+_snapshots: "OrderedDict[int, tuple]" = OrderedDict()
+_next_id = 1
+_lock = threading.Lock()
+
+
+def start(frames: int = None) -> Dict[str, Any]:
+    """Start tracing allocations (with `frames` frames per traceback); no-op when already tracing"""
+    frames = frames or constants.MEMORY_TRACE_FRAMES
+    if frames < 1 or frames > 100:
+        raise ValueError("frames must be between 1 and 100")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return status()
+
+
+def stop() -> Dict[str, Any]:
+    """Stop tracing and drop the snapshots"""
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+    return status()
+
+
+def status() -> Dict[str, Any]:
+    tracing = tracemalloc.is_tracing()
+    current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+    with _lock:
+        snapshots = [{"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in _snapshots.items()]
+    return {
+        "tracing": tracing,
+        "frames": tracemalloc.get_traceback_limit() if tracing else 0,
+        "traced_bytes": current,
+        "peak_traced_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory() if tracing else 0,
+        "snapshots": snapshots,
+    }
+
+
+def take_snapshot() -> Dict[str, Any]:
+    """Take a snapshot (keeping the last MEMORY_MAX_SNAPSHOTS); ValueError when not tracing"""
+    global _next_id
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not running, start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+    taken_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _lock:
+        snapshot_id = _next_id
+        _next_id += 1
+        _snapshots[snapshot_id] = (taken_at, snapshot)
+        while len(_snapshots) > constants.MEMORY_MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return {"id": snapshot_id, "taken_at": taken_at, "traced_bytes": sum(trace.size for trace in snapshot.traces)}
+
+
+def _get(snapshot_id: int):
+    with _lock:
+        entry = _snapshots.get(snapshot_id)
+    return entry[1] if entry else None
+
+
+def _check_group_by(group_by: str) -> None:
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+
+
+def _location(traceback: tracemalloc.Traceback, group_by: str):
+    if group_by == "traceback":
+        # Nieuwste frame eerst, zoals een gewone stack trace van onder naar boven
+        return [f"{frame.filename}:{frame.lineno}" for frame in reversed(traceback)]
+    frame = traceback[0]
+    return frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+
+
+def top_allocations(snapshot_id: int, limit: int = 20, group_by: str = "lineno") -> Optional[List[Dict[str, Any]]]:
+    """Biggest allocation sites of a snapshot; None if the snapshot doesn't exist"""
+    _check_group_by(group_by)
+    snapshot = _get(snapshot_id)
+    if snapshot is None:
+        return None
+    return [
+        {"location": _location(stat.traceback, group_by), "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def diff(old_id: int, new_id: int, limit: int = 20, group_by: str = "lineno") -> Optional[List[Dict[str, Any]]]:
+    """Allocation sites that grew the most between two snapshots; None if one of them doesn't exist"""
+    _check_group_by(group_by)
+    old, new = _get(old_id), _get(new_id)
+    if old is None or new is None:
+        return None
+    return [
+        {
+            "location": _location(stat.traceback, group_by),
+            "size_bytes": stat.size,
+            "size_diff_bytes": stat.size_diff,
+            "count": stat.count,
+            "count_diff": stat.count_diff,
+        }
+        for stat in new.compare_to(old, group_by)[:limit]
+    ]
+
+
+def deep_sizeof(obj, seen=None) -> int:
+    """Approximate size of an object including the containers and values it holds"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in list(obj.items()))
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in list(obj))
+    elif hasattr(obj, "__dict__") and not isinstance(obj, type):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def _structure(obj, items: int) -> Dict[str, Any]:
+    return {"items": items, "size_bytes": deep_sizeof(obj)}
+
+
+def known_structures() -> Dict[str, Any]:
+    """Sizes of the in-process state that can grow over the lifetime of a worker"""
+    structures = {}
+
+    module = sys.modules.get("utils.session_manager")
+    if module is not None:
+        structures["utils.session_manager.sessions"] = _structure(module.sessions, len(module.sessions))
+
+    from utils import (looplag_utils, metrics_utils, profiling_utils, query_registry, singleflight_utils,
+                       slowquery_utils)
+    cache = metrics_utils.query_labels.cache_info()
+    structures["metrics_utils.query_labels cache"] = {"items": cache.currsize, "max_items": cache.maxsize,
+                                                      "hits": cache.hits, "misses": cache.misses}
+    structures["metrics_utils.REGISTRY series"] = {
+        "items": sum(len(metric._series) for metric in metrics_utils.REGISTRY),
+        "metrics": len(metrics_utils.REGISTRY),
+        "thread_cells": sum(series.cell_count() for metric in metrics_utils.REGISTRY
+                            for series in list(metric._series.values())),
+    }
+    structures["query_registry.REGISTRY"] = _structure(query_registry.REGISTRY, len(query_registry.REGISTRY))
+    structures["slowquery_utils explained statements"] = _structure(slowquery_utils._explained,
+                                                                    len(slowquery_utils._explained))
+    structures["singleflight_utils in-flight calls"] = _structure(singleflight_utils._calls,
+                                                                  len(singleflight_utils._calls))
+    # Een series per functie die de event loop blokkeerde
+    structures["looplag_utils blocked functions"] = {"items": len(looplag_utils.EVENT_LOOP_BLOCKED._series)}
+    samplers = list(profiling_utils.running_samplers)
+    structures["profiling_utils stack samples"] = {"items": sum(len(sampler.samples) for sampler in samplers),
+                                                   "samplers": len(samplers)}
+
+    loggers = [logging.getLogger()] + [logger for logger in logging.Logger.manager.loggerDict.values()
+                                        if isinstance(logger, logging.Logger)]
+    structures["logging"] = {
+        "loggers": len(loggers),
+        "handlers": sum(len(logger.handlers) for logger in loggers),
+        "queued_records": sum(handler.queue.qsize() for handler in logging.getLogger().handlers
+                              if hasattr(handler, "queue")),
+        "dropped_records": sum(getattr(handler, "dropped", 0) for handler in logging.getLogger().handlers),
+    }
+
+    structures["gc_objects"] = len(gc.get_objects())
+    return structures
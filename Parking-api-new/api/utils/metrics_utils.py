@@ -0,0 +1,269 @@
+"""
+In-process metrics (counters, gauges, histograms) in Prometheus text format.
+
+Recording is lock-free: every thread writes to its own preallocated cell
+(a list of bucket counts), so the hot path is a bisect and two additions.
+Cells are only summed when /metrics is scraped; cells of threads that have
+ended are then folded into a per-series base total and dropped.
+"""
+import contextvars
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Buckets in seconden
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Scope van het request dat nu afgehandeld wordt (gezet door MetricsMiddleware), bv. voor het slow-query log.
+# Endpoints in de threadpool krijgen een kopie van de context, dus ook daar is hij bekend.
+CURRENT_REQUEST: contextvars.ContextVar = contextvars.ContextVar("current_request", default=None)
+# Id van dat request (X-Request-ID van de client of zelf gegenereerd), komt in de log regels en de response header
+CURRENT_REQUEST_ID: contextvars.ContextVar = contextvars.ContextVar("current_request_id", default=None)
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class _Series:
+    """
+    One label combination; every thread gets its own cell of `size` numbers.
+
+    Cells of threads that have ended are folded into a base total at the next
+    collection, so short-lived threads (asyncio.to_thread, streams) don't pile up.
+    """
+    __slots__ = ("_size", "_local", "_cells", "_base", "_lock")
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: Dict[threading.Thread, list] = {}
+        self._base = [0] * size
+        self._lock = threading.Lock()
+
+    def cell(self) -> list:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self._size
+            # dict assignment is atomic; alleen de eerste keer per thread
+            self._cells[threading.current_thread()] = cell
+            return cell
+
+    def totals(self) -> list:
+        with self._lock:
+            for thread, cell in list(self._cells.items()):
+                # Een beeindigde thread schrijft niet meer: veilig op te tellen bij de basis
+                if not thread.is_alive():
+                    del self._cells[thread]
+                    for index, value in enumerate(cell):
+                        self._base[index] += value
+            totals = list(self._base)
+        for cell in list(self._cells.values()):
+            for index, value in enumerate(cell):
+                totals[index] += value
+        return totals
+
+    def cell_count(self) -> int:
+        return len(self._cells)
+
+
+class _Metric:
+    kind = ""
+    size = 1
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[tuple, _Series] = {}
+        REGISTRY.append(self)
+
+    def series(self, labels: tuple = ()) -> _Series:
+        series = self._series.get(labels)
+        if series is None:
+            # setdefault: twee threads die tegelijk aanmaken krijgen dezelfde series
+            series = self._series.setdefault(labels, _Series(self.size))
+        return series
+
+    def _label_text(self, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, series in sorted(self._series.items()):
+            lines.extend(self._render_series(labels, series.totals()))
+        return lines
+
+    def _render_series(self, labels: tuple, totals: list) -> List[str]:
+        return [f"{self.name}{self._label_text(labels)} {_number(totals[0])}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self.series(labels).cell()[0] += amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self.series(labels).cell()[0] -= amount
+
+
+class Histogram(_Metric):
+    """Cumulative histogram; cell layout is [count per bucket..., +Inf count, sum]"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=HTTP_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.size = len(self.buckets) + 2
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        cell = self.series(labels).cell()
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def _render_series(self, labels: tuple, totals: list) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), totals):
+            cumulative += count
+            le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+            lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(labels)} {_number(totals[-1])}")
+        lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY: List[_Metric] = []
+
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "HTTP request latency per route",
+                                  ("method", "route"), HTTP_BUCKETS)
+HTTP_RESPONSES = Counter("http_responses_total", "HTTP responses per route and status code",
+                         ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQLite statement execution time per operation and table",
+                              ("operation", "table"), DB_BUCKETS)
+
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# Database hook
+# ---------------------------
+
+_STATEMENT_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN|ON)\s+([\w.]+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def query_labels(sql: str) -> Tuple[str, str]:
+    """(operation, table) of a statement, as low-cardinality labels"""
+    words = sql.split(None, 1)
+    operation = words[0].upper() if words else "UNKNOWN"
+    match = _STATEMENT_TABLE.search(sql)
+    return operation, match.group(1).split(".")[-1].lower() if match else ""
+
+
+def observe_query(sql: str, seconds: float) -> None:
+    DB_QUERY_DURATION.observe(seconds, query_labels(sql))
+
+
+def request_route() -> Optional[str]:
+    """Method en route template van het huidige request (bv. "GET /parking-lots/{lot_id}"), None buiten een request"""
+    scope = CURRENT_REQUEST.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+def _request_id(scope) -> str:
+    for name, value in scope.get("headers", ()):
+        if name == REQUEST_ID_HEADER:
+            # Alleen korte, printbare ids overnemen; anders een eigen id
+            request_id = value.decode("latin-1")
+            if 0 < len(request_id) <= 128 and request_id.isprintable():
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+# ---------------------------
+# ASGI middleware
+# ---------------------------
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware, so streaming responses are not buffered).
+    Latency runs until the last body chunk has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        HTTP_IN_FLIGHT.inc()
+        token = CURRENT_REQUEST.set(scope)
+        request_id = _request_id(scope)
+        id_token = CURRENT_REQUEST_ID.set(request_id)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(REQUEST_ID_HEADER, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            CURRENT_REQUEST_ID.reset(id_token)
+            CURRENT_REQUEST.reset(token)
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # Route template (bv. /parking-lots/{lot_id}) in plaats van het pad: begrensd aantal labels
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, (method, path))
+            HTTP_RESPONSES.inc((method, path, str(status)))
+
+
+def metric_value(metric: _Metric, labels: tuple = ()) -> Optional[float]:
+    """Current total of a counter/gauge (count for a histogram); None if the series doesn't exist"""
+    series = metric._series.get(labels)
+    if series is None:
+        return None
+    totals = series.totals()
+    return sum(totals[:-1]) if isinstance(metric, Histogram) else totals[0]
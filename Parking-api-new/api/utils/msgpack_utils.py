@@ -0,0 +1,202 @@
+"""
+MessagePack as an alternative to JSON, for request and response bodies.
+
+A client that prefers application/msgpack in its Accept header gets the JSON
+response of any endpoint re-encoded as MessagePack (same keys, same values).
+A request body sent as application/msgpack is decoded and handed to FastAPI as
+JSON, so it is validated by exactly the same pydantic models; the OpenAPI
+schema lists the MessagePack media type next to JSON with the same schema.
+
+Streamed responses (NDJSON exports, chunked JSON arrays) stay as they are: the
+client chose those formats explicitly.
+"""
+import json
+from typing import Any, Dict, Optional, Tuple
+import msgpack
+from utils import metrics_utils
+from utils.compression_utils import header, weak_etag
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+# Ook geaccepteerd (oudere clients gebruiken nog x-msgpack)
+MSGPACK_MEDIA_TYPES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+JSON_MEDIA_TYPES = ("application/json", "application/*", "*/*")
+
+MSGPACK_MESSAGES = metrics_utils.Counter("http_msgpack_messages_total",
+                                         "Bodies converted between JSON and MessagePack per direction",
+                                         ("direction",))
+
+
+def _media_types(accept: str) -> Dict[str, float]:
+    """Media type -> q value from an Accept header"""
+    qualities = {}
+    for part in accept.split(","):
+        media_type, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[media_type.strip().lower()] = quality
+    return qualities
+
+
+def wants_msgpack(accept: Optional[str]) -> Optional[str]:
+    """The MessagePack media type the client asked for, if it prefers it to JSON"""
+    if not accept:
+        return None
+    qualities = _media_types(accept)
+    best = max(((qualities[media_type], media_type) for media_type in MSGPACK_MEDIA_TYPES if media_type in qualities),
+               default=None)
+    if best is None or best[0] <= 0:
+        return None
+    json_quality = max((qualities.get(media_type, 0.0) for media_type in JSON_MEDIA_TYPES))
+    # Bij gelijke q wint MessagePack: wie het noemt, kan het lezen
+    return best[1] if best[0] >= json_quality else None
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.split(";", 1)[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def packb(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    Decode a MessagePack request body to JSON compatible values.
+
+    Raises:
+        ValueError: For invalid MessagePack or values JSON has no equivalent for (binary, extension types)
+    """
+    try:
+        value = msgpack.unpackb(data, raw=False)
+        json.dumps(value, allow_nan=False)
+    except (ValueError, TypeError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise ValueError(f"Invalid MessagePack body: {e}")
+    return value
+
+
+def add_to_openapi(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Offer application/msgpack wherever the schema offers application/json, with the same schema object"""
+    for path in schema.get("paths", {}).values():
+        for operation in path.values():
+            bodies = [operation.get("requestBody", {})] + list(operation.get("responses", {}).values())
+            for body in bodies:
+                content = body.get("content", {})
+                if "application/json" in content:
+                    content.setdefault(MSGPACK_MEDIA_TYPE, content["application/json"])
+    return schema
+
+
+def _replace_headers(headers, **replacements: bytes) -> list:
+    names = {name.replace("_", "-").encode() for name in replacements}
+    return [(key, value) for key, value in headers if key.lower() not in names] + \
+        [(name.replace("_", "-").encode(), value) for name, value in replacements.items()]
+
+
+async def _read_body(receive) -> Tuple[bytes, Dict[str, Any]]:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return b"".join(chunks), message
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks), message
+
+
+async def _send_400(send, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": 400, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class MessagePackMiddleware:
+    """
+    Pure ASGI middleware; converts MessagePack request bodies to JSON before routing
+    and JSON responses to MessagePack when the Accept header prefers it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = scope.get("headers", [])
+
+        content_type = header(headers, b"content-type")
+        if content_type and is_msgpack(content_type.decode("latin-1")):
+            body, last = await _read_body(receive)
+            if last["type"] == "http.disconnect":
+                return
+            try:
+                body = json.dumps(unpackb(body)).encode() if body else b""
+            except ValueError as e:
+                await _send_400(send, str(e))
+                return
+            MSGPACK_MESSAGES.inc(("request",))
+            scope = {**scope, "headers": _replace_headers(headers, content_type=b"application/json",
+                                                          content_length=str(len(body)).encode())}
+            received = False
+
+            async def receive_json():
+                nonlocal received
+                if received:
+                    return await receive()
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            receive = receive_json
+
+        accept = header(headers, b"accept")
+        media_type = wants_msgpack(accept.decode("latin-1") if accept else None)
+        start = None
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                response_headers = list(message.get("headers", ()))
+                response_type = (header(response_headers, b"content-type") or b"").decode("latin-1")
+                is_json = response_type.split(";", 1)[0].strip() == "application/json"
+                if is_json:
+                    # Het antwoord hangt af van Accept (ook voor clients die JSON vragen, i.v.m. caches)
+                    response_headers = _replace_headers(response_headers, vary=_vary(response_headers))
+                if media_type and (is_json or message["status"] == 304):
+                    # Andere representatie, dus een zwakke ETag (net als bij compressie)
+                    response_headers = weak_etag(response_headers)
+                message = {**message, "headers": response_headers}
+                if not (media_type and is_json):
+                    start = False
+                    await send(message)
+                    return
+                start = message
+                return
+            if message["type"] != "http.response.body" or not start:
+                await send(message)
+                return
+            if message.get("more_body", False):
+                # Gestreamd antwoord: ongewijzigd doorsturen
+                await send(start)
+                start = False
+                await send(message)
+                return
+            body = packb(json.loads(message.get("body", b"") or b"null"))
+            MSGPACK_MESSAGES.inc(("response",))
+            await send({**start, "headers": _replace_headers(start["headers"], content_type=media_type.encode(),
+                                                             content_length=str(len(body)).encode())})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def _vary(headers) -> bytes:
+    vary = header(headers, b"vary")
+    return vary + b", Accept" if vary else b"Accept"
@@ -0,0 +1,170 @@
+"""
+Shared keyset pagination and filter helpers for the list endpoints
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Union
+from utils.database_utils import execute_query, iter_query
+from utils import query_registry
+import constants
+
+SESSION_STATUSES = ("active", "stopped", "completed")
+PAYMENT_STATUSES = ("initiated", "authorized", "paid", "failed", "refunded", "void")
+DISCOUNT_STATUSES = ("active", "expired", "scheduled")
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Geeft een geldige page size terug (default als niets is opgegeven, nooit boven de max)"""
+    if limit is None:
+        return constants.PAGINATION_DEFAULT_LIMIT
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return min(limit, constants.PAGINATION_MAX_LIMIT)
+
+
+def encode_cursor(last_key: Any) -> str:
+    """Maak een opaque cursor van de laatste key van een pagina"""
+    raw = json.dumps({"k": last_key}, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    """Lees de key uit een cursor, ValueError als de cursor ongeldig is"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["k"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def date_range_conditions(column: str, start_date: Optional[str], end_date: Optional[str]) -> Tuple[List[str], List[Any]]:
+    """
+    Build conditions for a date range on a text timestamp column.
+
+    Args:
+        column: Column to filter on
+        start_date: Inclusive lower bound (date or datetime string)
+        end_date: Upper bound; a plain date (YYYY-MM-DD) includes that whole day
+
+    Returns:
+        Tuple of (conditions, params)
+    """
+    conditions, params = [], []
+    if start_date:
+        conditions.append(f"{column} >= ?")
+        params.append(start_date)
+    if end_date:
+        if len(end_date) == 10:
+            try:
+                end_date = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            except ValueError:
+                raise ValueError("end_date must be YYYY-MM-DD or a full timestamp")
+            conditions.append(f"{column} < ?")
+        else:
+            conditions.append(f"{column} <= ?")
+        params.append(end_date)
+    return conditions, params
+
+
+def session_status_condition(status: Optional[str], prefix: str = "") -> List[str]:
+    """Vertaal een sessie status filter naar een SQL conditie"""
+    if not status:
+        return []
+    if status not in SESSION_STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(SESSION_STATUSES)}")
+    if status == "active":
+        return [f"{prefix}stopped_at IS NULL"]
+    if status == "stopped":
+        return [f"{prefix}stopped_at IS NOT NULL", f"{prefix}verified_exit_at IS NULL"]
+    return [f"{prefix}verified_exit_at IS NOT NULL"]
+
+
+def paginate(select: str, conditions: List[str], params: List[Any], cursor: Optional[str] = None,
+             limit: Optional[int] = None, key: Union[str, Tuple[str, ...]] = "id", descending: bool = False,
+             with_archive: bool = False,
+             unpaginated_descending: Optional[bool] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Run a keyset-paginated SELECT.
+
+    Without cursor and limit every row is returned (next_cursor None), like the
+    listings did before they were paginated; clients opt in with limit. Listings
+    that had no ORDER BY then pass unpaginated_descending=False, so that list
+    keeps its old oldest-first (rowid) order while pages run newest first.
+
+    Args:
+        select: SELECT ... FROM ... part of the query, without WHERE/ORDER BY/LIMIT
+        conditions: WHERE conditions, joined with AND
+        params: Parameters for the conditions
+        cursor: Cursor returned by the previous page (None for the first page)
+        limit: Requested page size, clamped to PAGINATION_MAX_LIMIT (PAGINATION_DEFAULT_LIMIT with only a cursor)
+        key: Indexed, unique column to page over (may be table-qualified), or a tuple of columns
+             ending in a unique one, e.g. ("started_at", "id")
+        descending: Page from newest to oldest
+        with_archive: Attach the archive database (for queries that read archive.p_sessions)
+        unpaginated_descending: Order of the full list without cursor and limit (None: same as descending)
+
+    Returns:
+        Tuple of (rows, next_cursor); next_cursor is None on the last page
+
+    Raises:
+        ValueError: For an invalid cursor or limit
+    """
+    if cursor is None and limit is None:
+        full_descending = descending if unpaginated_descending is None else unpaginated_descending
+        return execute_query(_ordered_query(select, conditions, key, full_descending), tuple(params),
+                             with_archive=with_archive), None
+
+    page_size = clamp_limit(limit)
+    conditions = list(conditions)
+    params = list(params)
+    columns = (key,) if isinstance(key, str) else tuple(key)
+
+    if cursor:
+        last_key = decode_cursor(cursor)
+        values = [last_key] if isinstance(key, str) else last_key
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("Invalid cursor")
+        # Row value vergelijking: (started_at, id) < (?, ?)
+        conditions.append(f"({', '.join(columns)}) {'<' if descending else '>'} ({', '.join('?' * len(columns))})")
+        params.extend(values)
+
+    query = _ordered_query(select, conditions, key, descending) + " LIMIT ?"
+    params.append(page_size + 1)
+
+    rows = execute_query(query, tuple(params), with_archive=with_archive)
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    last = [rows[-1][column.split(".")[-1]] for column in columns]
+    return rows, encode_cursor(last[0] if isinstance(key, str) else last)
+
+
+def iterate(select: str, conditions: List[str], params: List[Any], key: Union[str, Tuple[str, ...]] = "id",
+            descending: bool = False, with_archive: bool = False) -> Iterator[Dict[str, Any]]:
+    """Stream every row matching the filters in page order, without materializing the result"""
+    return iter_query(_ordered_query(select, conditions, key, descending), tuple(params),
+                      with_archive=with_archive)
+
+
+def register_page(select: str, conditions: List[str], key: Union[str, Tuple[str, ...]] = "id", descending: bool = False,
+                  allow_scan: bool = False) -> str:
+    """Registreer de query die paginate() voor deze select en condities bouwt (voor de plan audit)"""
+    return query_registry.register(_ordered_query(select, conditions, key, descending) + " LIMIT ?",
+                                   allow_scan=allow_scan, depth=2)
+
+
+def _ordered_query(select: str, conditions: List[str], key: Union[str, Tuple[str, ...]], descending: bool) -> str:
+    query = select
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    columns = (key,) if isinstance(key, str) else key
+    direction = "DESC" if descending else "ASC"
+    return query + " ORDER BY " + ", ".join(f"{column} {direction}" for column in columns)
+
+
+def set_cursor_header(response, next_cursor: Optional[str]) -> None:
+    """Zet de volgende cursor als response header zodat list bodies ongewijzigd blijven"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
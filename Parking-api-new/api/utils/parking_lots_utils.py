@@ -1,45 +1,116 @@
 import sqlite3
 import os
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
 from utils import database_utils
+from utils import row_types
+from utils import pagination_utils
+from utils import archive_utils
+from utils.query_registry import register
+import constants
+from utils import tracing_utils
+from utils import singleflight_utils
+from utils import fields_utils
 
 DATABASE_PATH = database_utils.get_db_path()
 
-def get_all_parking_lots():
-    """Get all parking lots"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM parking_lots")
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        conn.close()
+# NULL in deze kolommen leest als 0, zoals het ParkingLot model altijd deed
+LOT_DEFAULTS = {"capacity": 0, "reserved": 0, "tariff": 0.0, "day_tariff": 0.0}
 
-def get_parking_lot_by_id(lot_id: int):
-    """Get parking lot by ID"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+PARKING_LOT_BY_ID_QUERY = register("SELECT {columns} FROM parking_lots WHERE id = ?", columns="*")
+CREATE_PARKING_LOT_QUERY = register("""
+            INSERT INTO parking_lots (name, location, address, capacity, reserved, tariff, day_tariff, created_at, lat, lng)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """)
+UPDATE_PARKING_LOT_QUERY = register("""
+            UPDATE parking_lots
+            SET name=?, location=?, address=?, capacity=?, reserved=?, tariff=?, day_tariff=?, lat=?, lng=?
+            WHERE id=?
+        """)
+DELETE_PARKING_LOT_QUERY = register("DELETE FROM parking_lots WHERE id = ?")
+ACTIVE_SESSION_BY_PLATE_QUERY = register(
+    "SELECT * FROM p_sessions WHERE parking_lot_id = ? AND license_plate = ? AND stopped_at IS NULL")
+SESSION_BY_ID_QUERY = register("SELECT {columns} FROM p_sessions WHERE id = ?", columns="*")
+CREATE_SESSION_QUERY = register("""
+            INSERT INTO p_sessions (parking_lot_id, license_plate, started_at, stopped_at, user_name, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """)
+UPDATE_SESSION_QUERY = register("UPDATE p_sessions SET {assignments} WHERE id=?", assignments="stopped_at=?")
+DELETE_SESSION_QUERY = register("DELETE FROM p_sessions WHERE id = ?")
+COUNT_ACTIVE_SESSIONS_QUERY = register(
+    "SELECT COUNT(*) FROM p_sessions WHERE parking_lot_id = ? AND (stopped_at IS NULL OR verified_exit_at IS NULL)")
+# localtime in plaats van 'now', zelfde formaat als bij het aanmaken van reserveringen
+UPCOMING_RESERVATIONS_QUERY = register("""
+            SELECT * FROM reservations 
+            WHERE parking_lot_id = ? 
+            AND status IN ('pending', 'confirmed')
+            AND datetime(start_time) <= datetime('now', 'localtime', '+' || ? || ' minutes')
+            AND datetime(start_time) >= datetime('now', 'localtime')
+        """)
+SESSION_IN_GRACE_PERIOD_QUERY = register("""
+            SELECT * FROM p_sessions 
+            WHERE parking_lot_id = ? 
+            AND license_plate = ? 
+            AND stopped_at IS NOT NULL 
+            AND verified_exit_at IS NULL
+            AND datetime(stopped_at, '+' || ? || ' minutes') >= datetime('now', 'localtime')
+        """)
+RESUME_EXPIRED_SESSIONS_QUERY = register("""
+            UPDATE p_sessions 
+            SET stopped_at = NULL 
+            WHERE stopped_at IS NOT NULL 
+            AND verified_exit_at IS NULL
+            AND datetime(stopped_at, '+' || ? || ' minutes') < datetime('now', 'localtime')
+        """)
+RESUME_EXPIRED_SESSION_BY_PLATE_QUERY = register("""
+            UPDATE p_sessions 
+            SET stopped_at = NULL 
+            WHERE parking_lot_id = ?
+            AND license_plate = ?
+            AND stopped_at IS NOT NULL 
+            AND verified_exit_at IS NULL
+            AND datetime(stopped_at, '+' || ? || ' minutes') < datetime('now', 'localtime')
+        """)
+# Dagtotalen per lot; de laatste dagen worden steeds opnieuw berekend omdat er nog sessies bij kunnen komen
+ROLLUP_DAILY_STATS_QUERY = register("""
+            INSERT OR REPLACE INTO lot_daily_stats (parking_lot_id, day, sessions, minutes, revenue, updated_at)
+            SELECT parking_lot_id, date(started_at), COUNT(*), COALESCE(SUM(duration_minutes), 0),
+                   COALESCE(SUM(cost), 0), datetime('now', 'localtime')
+            FROM p_sessions
+            WHERE started_at >= ?
+            GROUP BY parking_lot_id, date(started_at)
+        """)
+
+# Pagina queries van de sessie overzichten (zie get_sessions_by_*)
+pagination_utils.register_page("SELECT * FROM parking_lots", [], allow_scan=True)
+pagination_utils.register_page("SELECT * FROM p_sessions", ["parking_lot_id = ?"], descending=True)
+pagination_utils.register_page("SELECT * FROM p_sessions", ["parking_lot_id = ?", "user_name = ?"], descending=True)
+pagination_utils.register_page("SELECT * FROM p_sessions", ["user_name = ?"], descending=True)
+
+def get_all_parking_lots(cursor: Optional[str] = None, limit: Optional[int] = None,
+                         fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get parking lots per pagina, geeft (lots, next_cursor); fields (fields_utils.parse_fields) beperkt de kolommen"""
+    columns = fields_utils.columns_with_defaults(fields, "parking_lots", LOT_DEFAULTS)
+    return pagination_utils.paginate(f"SELECT {columns} FROM parking_lots", [], [], cursor, limit)
+
+def get_parking_lot_by_id(lot_id: int, fields: Optional[Tuple[str, ...]] = None) -> Optional[row_types.Row]:
+    """Get parking lot by ID (as a read-only slotted row, with only `fields` if given)"""
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM parking_lots WHERE id = ?", (lot_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        columns = fields_utils.columns_with_defaults(fields, "parking_lots", LOT_DEFAULTS)
+        cursor.execute(PARKING_LOT_BY_ID_QUERY.format(columns=columns), (lot_id,))
+        return row_types.fetch_one(cursor)
     finally:
         conn.close()
 
 def create_parking_lot(data: dict):
     """Create new parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO parking_lots (name, location, address, capacity, reserved, tariff, day_tariff, created_at, lat, lng)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (data["name"], data.get("location"), data["address"], data["capacity"], data.get("reserved", 0),
+        cursor.execute(CREATE_PARKING_LOT_QUERY, (data["name"], data.get("location"), data["address"], data["capacity"], data.get("reserved", 0),
               data["tariff"], data.get("day_tariff", 0), data.get("created_at"), data.get("lat"), data.get("lng")))
         conn.commit()
         return cursor.lastrowid
@@ -48,14 +119,10 @@ def create_parking_lot(data: dict):
 
 def update_parking_lot(lot_id: int, data: dict):
     """Update parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE parking_lots
-            SET name=?, location=?, address=?, capacity=?, reserved=?, tariff=?, day_tariff=?, lat=?, lng=?
-            WHERE id=?
-        """, (data["name"], data.get("location"), data["address"], data["capacity"], data.get("reserved", 0),
+        cursor.execute(UPDATE_PARKING_LOT_QUERY, (data["name"], data.get("location"), data["address"], data["capacity"], data.get("reserved", 0),
               data["tariff"], data.get("day_tariff", 0), data.get("lat"), data.get("lng"), lot_id))
         conn.commit()
     finally:
@@ -63,48 +130,89 @@ def update_parking_lot(lot_id: int, data: dict):
 
 def delete_parking_lot(lot_id: int):
     """Delete parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM parking_lots WHERE id = ?", (lot_id,))
+        cursor.execute(DELETE_PARKING_LOT_QUERY, (lot_id,))
         conn.commit()
     finally:
         conn.close()
 
-def get_sessions_by_lot_id(lot_id: int):
-    """Get all sessions for a parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    try:
-        cursor.execute("SELECT * FROM p_sessions WHERE parking_lot_id = ?", (lot_id,))
-        rows = cursor.fetchall()
-        return [dict(row) for row in rows]
-    finally:
-        conn.close()
+def _session_filters(start_date: Optional[str], end_date: Optional[str], status: Optional[str],
+                     plate: Optional[str]) -> Tuple[List[str], List[Any]]:
+    """Shared date range / status / plate filters for session listings"""
+    conditions, params = pagination_utils.date_range_conditions("started_at", start_date, end_date)
+    conditions += pagination_utils.session_status_condition(status)
+    if plate:
+        conditions.append("license_plate = ?")
+        params.append(plate)
+    return conditions, params
+
+def get_sessions_by_lot_id(lot_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                           start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           status: Optional[str] = None, plate: Optional[str] = None,
+                           user_name: Optional[str] = None,
+                           fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Get sessions for a parking lot per pagina (nieuwste eerst), geeft (sessions, next_cursor).
+    Zonder cursor en limit de hele lijst oudste eerst, zoals voor de paginering.
+    Met user_name worden alleen de sessies van die gebruiker opgehaald (via idx_p_sessions_user_lot).
+    """
+    conditions, params = _lot_session_filters(lot_id, start_date, end_date, status, plate, user_name)
+    source, with_archive = archive_utils.session_source(start_date)
+    return pagination_utils.paginate(f"SELECT {fields_utils.columns(fields)} FROM {source}", conditions, params, cursor, limit,
+                                     descending=True, with_archive=with_archive, unpaginated_descending=False)
+
+def iter_sessions_by_lot_id(lot_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            status: Optional[str] = None, plate: Optional[str] = None,
+                            user_name: Optional[str] = None,
+                            fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict]:
+    """Stream all matching sessions for a parking lot (nieuwste eerst) for exports"""
+    conditions, params = _lot_session_filters(lot_id, start_date, end_date, status, plate, user_name)
+    source, with_archive = archive_utils.session_source(start_date)
+    return pagination_utils.iterate(f"SELECT {fields_utils.columns(fields)} FROM {source}", conditions, params, descending=True,
+                                    with_archive=with_archive)
+
+def _lot_session_filters(lot_id: int, start_date: Optional[str], end_date: Optional[str], status: Optional[str],
+                         plate: Optional[str], user_name: Optional[str]) -> Tuple[List[str], List[Any]]:
+    conditions, params = _session_filters(start_date, end_date, status, plate)
+    conditions = ["parking_lot_id = ?"] + conditions
+    params = [lot_id] + params
+    if user_name is not None:
+        conditions.append("user_name = ?")
+        params.append(user_name)
+    return conditions, params
+
+def get_sessions_by_user_name(user_name: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                              start_date: Optional[str] = None, end_date: Optional[str] = None,
+                              status: Optional[str] = None, plate: Optional[str] = None,
+                              fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get sessions of a user across all parking lots per pagina (nieuwste eerst; zonder cursor en limit oudste eerst)"""
+    conditions, params = _session_filters(start_date, end_date, status, plate)
+    source, with_archive = archive_utils.session_source(start_date)
+    return pagination_utils.paginate(f"SELECT {fields_utils.columns(fields)} FROM {source}", ["user_name = ?"] + conditions,
+                                     [user_name] + params, cursor, limit, descending=True, with_archive=with_archive,
+                                     unpaginated_descending=False)
 
 def get_active_session_by_licenseplate(lot_id: int, licenseplate: str):
     """Get active session for licenseplate (stopped_at is NULL)"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT * FROM p_sessions WHERE parking_lot_id = ? AND license_plate = ? AND stopped_at IS NULL",
-            (lot_id, licenseplate)
-        )
+        cursor.execute(ACTIVE_SESSION_BY_PLATE_QUERY, (lot_id, licenseplate))
         row = cursor.fetchone()
         return dict(row) if row else None
     finally:
         conn.close()
 
-def get_parking_session_by_id(session_id: int):
-    """Get parking session by ID"""
-    conn = sqlite3.connect(DATABASE_PATH)
+def get_parking_session_by_id(session_id: int, fields: Optional[Tuple[str, ...]] = None):
+    """Get parking session by ID (with only `fields` if given)"""
+    conn = database_utils.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM p_sessions WHERE id = ?", (session_id,))
+        cursor.execute(SESSION_BY_ID_QUERY.format(columns=fields_utils.columns(fields)), (session_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
     finally:
@@ -112,13 +220,10 @@ def get_parking_session_by_id(session_id: int):
 
 def create_parking_session(data: dict):
     """Create new parking session"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO p_sessions (parking_lot_id, license_plate, started_at, stopped_at, user_name)
-            VALUES (?, ?, ?, ?, ?)
-        """, (data["lot_id"], data["licenseplate"], data["started"], data.get("stopped"), data["user"]))
+        cursor.execute(CREATE_SESSION_QUERY, (data["lot_id"], data["licenseplate"], data["started"], data.get("stopped"), data["user"], data.get("user_id")))
         conn.commit()
         return cursor.lastrowid
     finally:
@@ -126,7 +231,7 @@ def create_parking_session(data: dict):
 
 def update_parking_session(session_id: int, data: dict):
     """Update parking session"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
         # Build dynamic update query based on provided fields
@@ -145,7 +250,7 @@ def update_parking_session(session_id: int, data: dict):
             return  # Nothing to update
         
         values.append(session_id)
-        query = f"UPDATE p_sessions SET {', '.join(update_fields)} WHERE id=?"
+        query = UPDATE_SESSION_QUERY.format(assignments=", ".join(update_fields))
         cursor.execute(query, values)
         conn.commit()
     finally:
@@ -153,43 +258,37 @@ def update_parking_session(session_id: int, data: dict):
 
 def delete_parking_session(session_id: int):
     """Delete parking session"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM p_sessions WHERE id = ?", (session_id,))
+        cursor.execute(DELETE_SESSION_QUERY, (session_id,))
         conn.commit()
     finally:
         conn.close()
 
 def count_active_sessions(lot_id: int) -> int:
     """Count active sessions (not yet stopped and not yet verified exit) in parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute(
-            "SELECT COUNT(*) FROM p_sessions WHERE parking_lot_id = ? AND (stopped_at IS NULL OR verified_exit_at IS NULL)",
-            (lot_id,)
-        )
+        cursor.execute(COUNT_ACTIVE_SESSIONS_QUERY, (lot_id,))
         count = cursor.fetchone()[0]
         return count
     finally:
         conn.close()
 
-def get_upcoming_reservations(lot_id: int, minutes: int = 15) -> List[Dict]:
+def available_spots(capacity: int, active_sessions: int, upcoming_reservations: int) -> int:
+    """Vrije plekken: actieve sessies (incl. grace period) en binnenkort beginnende reserveringen tellen als bezet"""
+    return capacity - (active_sessions + upcoming_reservations)
+
+def get_upcoming_reservations(lot_id: int, minutes: int = constants.UPCOMING_RESERVATION_MINUTES) -> List[Dict]:
     """Get reservations starting within the next X minutes"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     try:
         # Get reservations that start within the next X minutes and are pending or confirmed
-        # Use localtime instead of 'now' to match the format used when creating reservations
-        cursor.execute("""
-            SELECT * FROM reservations 
-            WHERE parking_lot_id = ? 
-            AND status IN ('pending', 'confirmed')
-            AND datetime(start_time) <= datetime('now', 'localtime', '+' || ? || ' minutes')
-            AND datetime(start_time) >= datetime('now', 'localtime')
-        """, (lot_id, minutes))
+        cursor.execute(UPCOMING_RESERVATIONS_QUERY, (lot_id, minutes))
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
     finally:
@@ -197,21 +296,14 @@ def get_upcoming_reservations(lot_id: int, minutes: int = 15) -> List[Dict]:
 
 def get_session_in_grace_period(lot_id: int, licenseplate: str):
     """
-    Get session that is in grace period (stopped but not verified within 15 minutes)
+    Get session that is in grace period (stopped but not verified within GRACE_PERIOD_MINUTES)
     """
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     try:
         # Get session that's stopped but not verified
-        cursor.execute("""
-            SELECT * FROM p_sessions 
-            WHERE parking_lot_id = ? 
-            AND license_plate = ? 
-            AND stopped_at IS NOT NULL 
-            AND verified_exit_at IS NULL
-            AND datetime(stopped_at, '+15 minutes') >= datetime('now', 'localtime')
-        """, (lot_id, licenseplate))
+        cursor.execute(SESSION_IN_GRACE_PERIOD_QUERY, (lot_id, licenseplate, constants.GRACE_PERIOD_MINUTES))
         row = cursor.fetchone()
         return dict(row) if row else None
     finally:
@@ -219,20 +311,48 @@ def get_session_in_grace_period(lot_id: int, licenseplate: str):
 
 def check_and_resume_expired_sessions():
     """
-    Automatically resume sessions where stopped_at was more than 15 minutes ago
+    Automatically resume sessions where stopped_at was more than GRACE_PERIOD_MINUTES ago
     and verified_exit_at is still NULL. Returns count of resumed sessions.
     """
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE p_sessions 
-            SET stopped_at = NULL 
-            WHERE stopped_at IS NOT NULL 
-            AND verified_exit_at IS NULL
-            AND datetime(stopped_at, '+15 minutes') < datetime('now', 'localtime')
-        """)
+        cursor.execute(RESUME_EXPIRED_SESSIONS_QUERY, (constants.GRACE_PERIOD_MINUTES,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def resume_expired_session(lot_id: int, licenseplate: str) -> int:
+    """
+    Same as check_and_resume_expired_sessions, but only for one license plate in one lot.
+    The request path uses this; all other plates are handled by the resume_expired_sessions job.
+    """
+    conn = database_utils.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(RESUME_EXPIRED_SESSION_BY_PLATE_QUERY, (lot_id, licenseplate, constants.GRACE_PERIOD_MINUTES))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def rollup_daily_stats(days: Optional[int] = None) -> int:
+    """Recalculate lot_daily_stats for today and the previous days; returns the number of (lot, day) rows written"""
+    since = (datetime.now() - timedelta(days=(days or constants.ROLLUP_DAYS) - 1)).strftime("%Y-%m-%d")
+    conn = database_utils.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(ROLLUP_DAILY_STATS_QUERY, (since,))
         conn.commit()
         return cursor.rowcount
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+
+# Spans voor request tracing (pure rekenhulpjes niet, die worden ook in tight loops gebruikt)
+tracing_utils.instrument_module(__name__, exclude=("available_spots",))
+
+# Drukke lot reads: gelijktijdige identieke aanroepen delen een query (na instrument_module, zodat de spans blijven)
+get_all_parking_lots_coalesced = singleflight_utils.coalesced(get_all_parking_lots)
+get_parking_lot_by_id_coalesced = singleflight_utils.coalesced(get_parking_lot_by_id)
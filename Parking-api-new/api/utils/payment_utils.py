@@ -1,7 +1,26 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from datetime import datetime, timezone
-from api.utils.database_utils import get_db_connection, execute_query
+from utils.database_utils import get_db_connection, execute_query
+from utils import pagination_utils
+from utils.query_registry import register
 import uuid
+from utils import tracing_utils
+from utils import fields_utils
+
+CREATE_PAYMENT_QUERY = register("""
+        INSERT INTO payments
+        (user_id, reservation_id, p_session_id, amount, currency, method, status, created_at, external_ref)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """)
+REFUND_PAYMENT_QUERY = register("UPDATE payments SET status = ? WHERE external_ref = ?")
+PAYMENT_BY_EXTERNAL_REF_QUERY = register("SELECT * FROM payments WHERE external_ref = ?")
+UPDATE_PAYMENT_STATUS_QUERY = register("UPDATE payments SET status = ?, paid_at = ? WHERE external_ref = ?")
+
+# {columns}: p.* of de kolommen uit fields= (fields_utils.columns met prefix "p.")
+MY_PAYMENTS_SELECT = "SELECT {columns} FROM payments p"
+USER_PAYMENTS_SELECT = "SELECT {columns} FROM payments p JOIN users u ON u.id = p.user_id"
+pagination_utils.register_page(MY_PAYMENTS_SELECT.format(columns="p.*"), ["p.user_id = ?"], key="p.id", descending=True)
+pagination_utils.register_page(USER_PAYMENTS_SELECT.format(columns="p.*"), ["u.username = ?"], key="p.id", descending=True)
 
 def generate_external_ref() -> str:
     return f"pay_{uuid.uuid4().hex}"
@@ -11,14 +30,9 @@ def create_payment_db(user_id: int, reservation_id: Optional[int], amount: float
     created_at = datetime.now(timezone.utc).isoformat()
     external_ref = generate_external_ref()
 
-    query = """
-        INSERT INTO payments
-        (user_id, reservation_id, p_session_id, amount, currency, method, status, created_at, external_ref)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (
+        cursor.execute(CREATE_PAYMENT_QUERY, (
             user_id,
             reservation_id,
             p_session_id,
@@ -40,38 +54,70 @@ def create_payment_db(user_id: int, reservation_id: Optional[int], amount: float
         "p_session_id": p_session_id
     }
 
-def get_my_payments_db(user_id: int) -> List[Dict[str, Any]]:
-    """DB logic for retrieving user's payments"""
-    query = "SELECT * FROM payments WHERE user_id = ?"
-    return execute_query(query, (user_id,))
+def _payment_filters(start_date: Optional[str], end_date: Optional[str], status: Optional[str]) -> Tuple[List[str], List[Any]]:
+    """Shared date range / status filters for payment listings"""
+    conditions, params = pagination_utils.date_range_conditions("p.created_at", start_date, end_date)
+    if status:
+        if status not in pagination_utils.PAYMENT_STATUSES:
+            raise ValueError(f"status must be one of: {', '.join(pagination_utils.PAYMENT_STATUSES)}")
+        conditions.append("p.status = ?")
+        params.append(status)
+    return conditions, params
+
+def get_my_payments_db(user_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                       start_date: Optional[str] = None, end_date: Optional[str] = None,
+                       status: Optional[str] = None,
+                       fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """DB logic for retrieving a page of the user's payments (newest first; without cursor and limit all, oldest first)"""
+    conditions, params = _payment_filters(start_date, end_date, status)
+    return pagination_utils.paginate(
+        MY_PAYMENTS_SELECT.format(columns=fields_utils.columns(fields, "p.")),
+        ["p.user_id = ?"] + conditions, [user_id] + params,
+        cursor, limit, key="p.id", descending=True, unpaginated_descending=False
+    )
 
 def refund_payment_db(external_ref: str) -> bool:
     """DB logic for refunding a payment"""
-    query = "UPDATE payments SET status = ? WHERE external_ref = ?"
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, ("refunded", external_ref))
+        cursor.execute(REFUND_PAYMENT_QUERY, ("refunded", external_ref))
         return cursor.rowcount > 0
 
 def get_payment_by_external_ref(external_ref: str) -> Optional[Dict[str, Any]]:
     """DB logic for fetching a payment by external_ref"""
-    query = "SELECT * FROM payments WHERE external_ref = ?"
-    results = execute_query(query, (external_ref,))
+    results = execute_query(PAYMENT_BY_EXTERNAL_REF_QUERY, (external_ref,))
     return results[0] if results else None
 
-def get_user_payments_db(username: str) -> List[Dict[str, Any]]:
-    """DB logic for fetching payments by username"""
-    query = """
-        SELECT p.*
-        FROM payments p
-        JOIN users u ON u.id = p.user_id
-        WHERE u.username = ?
-    """
-    return execute_query(query, (username,))
+def get_user_payments_db(username: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+                         start_date: Optional[str] = None, end_date: Optional[str] = None,
+                         status: Optional[str] = None,
+                         fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """DB logic for fetching a page of payments by username (newest first; without cursor and limit all, oldest first)"""
+    conditions, params = _payment_filters(start_date, end_date, status)
+    return pagination_utils.paginate(
+        USER_PAYMENTS_SELECT.format(columns=fields_utils.columns(fields, "p.")),
+        ["u.username = ?"] + conditions, [username] + params,
+        cursor, limit, key="p.id", descending=True, unpaginated_descending=False
+    )
+
+def iter_user_payments_db(username: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          status: Optional[str] = None,
+                          fields: Optional[Tuple[str, ...]] = None) -> Iterator[Dict[str, Any]]:
+    """DB logic for streaming all payments of a username (newest first) for exports"""
+    conditions, params = _payment_filters(start_date, end_date, status)
+    return pagination_utils.iterate(
+        USER_PAYMENTS_SELECT.format(columns=fields_utils.columns(fields, "p.")),
+        ["u.username = ?"] + conditions, [username] + params,
+        key="p.id", descending=True
+    )
+
 def update_payment_db(external_ref: str, status: str, paid_at: datetime) -> bool:
     """DB logic for updating a payment's status and paid_at"""
-    query = "UPDATE payments SET status = ?, paid_at = ? WHERE external_ref = ?"
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (status, paid_at.isoformat(), external_ref))
+        cursor.execute(UPDATE_PAYMENT_STATUS_QUERY, (status, paid_at.isoformat(), external_ref))
         return cursor.rowcount > 0
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__)
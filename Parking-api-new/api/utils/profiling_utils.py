@@ -0,0 +1,242 @@
+"""
+On-demand profiling of single requests.
+
+An admin sends `X-Profile: cprofile` (deterministic, pstats file) or
+`X-Profile: sample` (sampling, folded stacks for flamegraph tools) with any
+request. The request runs under that profiler and the profile is saved in
+constants.PROFILES_DIR with a small JSON file describing the request; the
+response gets the profile name in X-Profile-Id. Only the newest
+constants.PROFILES_KEEP profiles are kept. Requests without the header
+only pay for a scan of the header list.
+
+cProfile sees the event loop thread, which is where the (async) endpoints and
+their utils calls run. Other requests handled at the same time show up in the
+same profile, and work done in the threadpool (streamed exports) only shows up
+in the sampling profile.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+import constants
+from utils import metrics_utils, session_manager
+
+PROFILE_HEADER = b"x-profile"
+PROFILERS = ("cprofile", "sample")
+EXTENSIONS = {"cprofile": ".prof", "sample": ".folded"}
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROFILE_NAME = re.compile(r"^[\w-]+$")
+
+# cProfile kan maar een profiel per thread tegelijk draaien; een tweede geprofileerd request loopt gewoon zonder
+_busy = threading.Lock()
+# Lopende samplers, voor memory_utils.known_structures
+running_samplers: Set["StackSampler"] = set()
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _name_part(request_id: Optional[str]) -> str:
+    """Request id for the profile name; X-Request-ID comes from the client, so an unsafe one becomes a random id"""
+    if request_id and len(request_id) <= 64 and _PROFILE_NAME.match(request_id):
+        return request_id
+    return os.urandom(8).hex()
+
+
+def _is_admin(scope) -> bool:
+    token = _header(scope, b"authorization")
+    user = session_manager.get_session(token) if token else None
+    return bool(user) and user.get("role") == "ADMIN"
+
+
+class StackSampler:
+    """Samplet in een eigen thread de stacks van alle threads die API code uitvoeren"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        running_samplers.add(self)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        running_samplers.discard(self)
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                in_api = False
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.splitext(os.path.basename(code.co_filename))[0]}.{code.co_name}")
+                    in_api = in_api or code.co_filename.startswith(API_DIR)
+                    frame = frame.f_back
+                # Wachtende threads (threadpool, watchdog) zitten niet in API code
+                if in_api:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Folded stacks ("a;b;c count"), the input format of flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware; must run inside MetricsMiddleware so the request id is known"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiler = _header(scope, PROFILE_HEADER)
+        if profiler is None:
+            await self.app(scope, receive, send)
+            return
+
+        profiler = profiler.strip().lower() or "cprofile"
+        if profiler not in PROFILERS or not _is_admin(scope) or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_id = metrics_utils.CURRENT_REQUEST_ID.get()
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{_name_part(request_id)}"
+        status = 500
+        finished = False
+
+        if profiler == "cprofile":
+            active = cProfile.Profile()
+        else:
+            active = StackSampler(constants.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            duration = time.perf_counter() - started
+            if profiler == "cprofile":
+                active.disable()
+            else:
+                active.stop()
+            save_profile(name, profiler, active, {
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "route": getattr(scope.get("route"), "path", None),
+                "request_id": request_id,
+                "status": status,
+                "duration_ms": round(duration * 1000, 1),
+            })
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(b"x-profile-id", name.encode("latin-1"))]
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # Opslaan voor het laatste stuk body: als de client het antwoord heeft, staat het profiel er ook
+                finish()
+            await send(message)
+
+        try:
+            started = time.perf_counter()
+            if profiler == "cprofile":
+                active.enable()
+            else:
+                active.start()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                finish()
+        finally:
+            _busy.release()
+
+
+def save_profile(name: str, profiler: str, active, info: Dict[str, Any]) -> None:
+    os.makedirs(constants.PROFILES_DIR, exist_ok=True)
+    path = os.path.join(constants.PROFILES_DIR, name + EXTENSIONS[profiler])
+    if profiler == "cprofile":
+        active.dump_stats(path)
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(active.folded())
+    info = {"name": name, "profiler": profiler, "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **info}
+    with open(os.path.join(constants.PROFILES_DIR, name + ".json"), "w", encoding="utf-8") as file:
+        json.dump(info, file)
+    prune_profiles(keep=name)
+
+
+def prune_profiles(keep: Optional[str] = None) -> None:
+    """Delete all but the newest PROFILES_KEEP profiles (profile and JSON file together)"""
+    entries = []
+    for filename in os.listdir(constants.PROFILES_DIR):
+        if filename.endswith(".json") and filename[:-5] != keep:
+            try:
+                entries.append((os.stat(os.path.join(constants.PROFILES_DIR, filename)).st_mtime_ns, filename[:-5]))
+            except FileNotFoundError:
+                continue
+    # Het net opgeslagen profiel telt mee maar wordt nooit verwijderd, de client heeft zijn naam al
+    excess = len(entries) + (keep is not None) - constants.PROFILES_KEEP
+    for _, old in sorted(entries)[:max(0, excess)]:
+        for extension in (*EXTENSIONS.values(), ".json"):
+            try:
+                os.remove(os.path.join(constants.PROFILES_DIR, old + extension))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Saved profiles, newest first"""
+    if not os.path.isdir(constants.PROFILES_DIR):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(constants.PROFILES_DIR), reverse=True):
+        if filename.endswith(".json"):
+            with open(os.path.join(constants.PROFILES_DIR, filename), encoding="utf-8") as file:
+                profiles.append(json.load(file))
+    return profiles
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a saved profile, None if it doesn't exist; ValueError for an invalid name"""
+    if not _PROFILE_NAME.match(name):
+        raise ValueError("Invalid profile name")
+    for extension in EXTENSIONS.values():
+        path = os.path.join(constants.PROFILES_DIR, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def profile_summary(path: str, limit: int = 50) -> str:
+    """Readable top functions by cumulative time of a cProfile file (a folded file is returned as is)"""
+    if not path.endswith(".prof"):
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+    output = io.StringIO()
+    pstats.Stats(path, stream=output).sort_stats("cumulative").print_stats(limit)
+    return output.getvalue()
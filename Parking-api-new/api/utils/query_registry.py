@@ -0,0 +1,51 @@
+"""
+Central registry of the SQL statements the API runs.
+
+Modules register their statements at import time with register() (or
+pagination_utils.register_page for keyset-paginated listings). The plan audit
+(tools/audit_query_plans.py) imports those modules and runs EXPLAIN QUERY PLAN
+on every registered statement to find full table scans.
+"""
+import os
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RegisteredQuery(NamedTuple):
+    sql: str          # statement zoals de audit hem plant (templates ingevuld)
+    location: str     # bestand:regel waar hij geregistreerd is
+    allow_scan: bool  # bewuste full scan, bv. een overzicht van alle rows
+
+
+# (location, sql) -> query; een module die onder twee namen geimporteerd wordt telt maar een keer
+REGISTRY: Dict[Tuple[str, str], RegisteredQuery] = {}
+
+
+def register(sql: str, allow_scan: bool = False, depth: int = 1, **audit_format) -> str:
+    """
+    Register a statement for the plan audit and return it unchanged.
+
+    Args:
+        sql: The statement, or a str.format template (e.g. with {sessions})
+        allow_scan: The statement is meant to read the whole table
+        depth: Stack depth of the caller whose location is recorded
+        **audit_format: Values to fill in a template for the audit
+
+    Returns:
+        sql, so the registration can be the module level constant itself
+    """
+    frame = sys._getframe(depth)
+    location = f"{os.path.relpath(frame.f_code.co_filename, API_DIR)}:{frame.f_lineno}"
+    audit_sql = sql.format(**audit_format) if audit_format else sql
+    REGISTRY.setdefault((location, audit_sql), RegisteredQuery(audit_sql, location, allow_scan))
+    return sql
+
+
+def registered_queries() -> List[RegisteredQuery]:
+    """All registered statements, ordered by location"""
+    def sort_key(query: RegisteredQuery):
+        path, _, line = query.location.rpartition(":")
+        return path, int(line)
+    return sorted(REGISTRY.values(), key=sort_key)
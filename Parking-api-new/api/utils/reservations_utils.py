@@ -1,16 +1,65 @@
 import sqlite3
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from utils import database_utils
+from utils import row_types
+from utils.query_registry import register
+from utils import tracing_utils
+from utils import fields_utils
 
 DATABASE_PATH = database_utils.get_db_path()
 
-def get_reservation_by_id(reservation_id: int) -> Optional[Dict[str, Any]]:
-    """Get reservation by ID"""
-    conn = sqlite3.connect(DATABASE_PATH)
+RESERVATION_BY_ID_QUERY = register("SELECT {columns} FROM reservations WHERE id = ?", columns="*")
+CREATE_RESERVATION_QUERY = register("""
+            INSERT INTO reservations (user_id, parking_lot_id, vehicle_id, start_time, end_time, status, cost, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
+        """)
+UPDATE_RESERVATION_QUERY = register("UPDATE reservations SET {assignments} WHERE id=?", assignments="status=?")
+DELETE_RESERVATION_QUERY = register("DELETE FROM reservations WHERE id = ?")
+PARKING_LOT_BY_ID_QUERY = register("SELECT * FROM parking_lots WHERE id = ?")
+INCREMENT_RESERVED_QUERY = register("""
+            UPDATE parking_lots
+            SET reserved = COALESCE(reserved, 0) + 1
+            WHERE id = ?
+        """)
+# Reserveringen die een plek vasthouden (en in parking_lots.reserved meetellen)
+ACTIVE_STATUSES = ("pending", "confirmed")
+
+DECREMENT_RESERVED_QUERY = register("""
+            UPDATE parking_lots
+            SET reserved = MAX(0, COALESCE(reserved, 1) - 1)
+            WHERE id = ?
+        """)
+# Twee periodes overlappen als: start1 < end2 AND start2 < end1
+OVERLAPPING_RESERVATIONS_QUERY = register("""
+            SELECT COUNT(*) FROM reservations 
+            WHERE parking_lot_id = ? 
+            AND status IN ('pending', 'confirmed')
+            AND datetime(start_time) < datetime(?)
+            AND datetime(end_time) > datetime(?)
+        """)
+# Afgelopen reserveringen: een bevestigde is gebruikt (completed), een die nog pending was is verlopen
+EXPIRE_PAST_RESERVATIONS_QUERY = register("""
+            UPDATE reservations
+            SET status = CASE status WHEN 'confirmed' THEN 'completed' ELSE 'expired' END
+            WHERE status IN ('pending', 'confirmed')
+            AND datetime(end_time) < datetime('now', 'localtime')
+        """)
+# Zet parking_lots.reserved gelijk aan het aantal openstaande reserveringen (alleen lots waar het afwijkt)
+RECONCILE_RESERVED_QUERY = register("""
+            UPDATE parking_lots
+            SET reserved = (SELECT COUNT(*) FROM reservations r
+                            WHERE r.parking_lot_id = parking_lots.id AND r.status IN ('pending', 'confirmed'))
+            WHERE COALESCE(reserved, -1) != (SELECT COUNT(*) FROM reservations r
+                                             WHERE r.parking_lot_id = parking_lots.id AND r.status IN ('pending', 'confirmed'))
+        """, allow_scan=True)
+
+def get_reservation_by_id(reservation_id: int, fields: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, Any]]:
+    """Get reservation by ID (with only `fields` if given)"""
+    conn = database_utils.connect(DATABASE_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM reservations WHERE id = ?", (reservation_id,))
+        cursor.execute(RESERVATION_BY_ID_QUERY.format(columns=fields_utils.columns(fields)), (reservation_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
     finally:
@@ -18,13 +67,10 @@ def get_reservation_by_id(reservation_id: int) -> Optional[Dict[str, Any]]:
 
 def create_reservation(data: dict) -> int:
     """Create new reservation"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            INSERT INTO reservations (user_id, parking_lot_id, vehicle_id, start_time, end_time, status, cost, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'))
-        """, (data["user_id"], data["parking_lot_id"], data["vehicle_id"], data["start_time"], data["end_time"], data.get("status", "pending"), data.get("cost")))
+        cursor.execute(CREATE_RESERVATION_QUERY, (data["user_id"], data["parking_lot_id"], data["vehicle_id"], data["start_time"], data["end_time"], data.get("status", "pending"), data.get("cost")))
         conn.commit()
         return cursor.lastrowid
     finally:
@@ -32,7 +78,7 @@ def create_reservation(data: dict) -> int:
 
 def update_reservation(reservation_id: int, data: dict):
     """Update reservation - only updates provided fields"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
         # Build dynamic update query
@@ -46,7 +92,7 @@ def update_reservation(reservation_id: int, data: dict):
         if not update_fields:
             return  # Nothing to update
         
-        query = f"UPDATE reservations SET {', '.join(update_fields)} WHERE id=?"
+        query = UPDATE_RESERVATION_QUERY.format(assignments=", ".join(update_fields))
         values.append(reservation_id)
         cursor.execute(query, values)
         conn.commit()
@@ -55,68 +101,51 @@ def update_reservation(reservation_id: int, data: dict):
 
 def delete_reservation(reservation_id: int):
     """Delete reservation"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM reservations WHERE id = ?", (reservation_id,))
+        cursor.execute(DELETE_RESERVATION_QUERY, (reservation_id,))
         conn.commit()
     finally:
         conn.close()
 
-def get_parking_lot_by_id(lot_id: int) -> Optional[Dict[str, Any]]:
+def get_parking_lot_by_id(lot_id: int) -> Optional[row_types.Row]:
     """Get parking lot by ID (used for validation)"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM parking_lots WHERE id = ?", (lot_id,))
-        row = cursor.fetchone()
-        return dict(row) if row else None
+        cursor.execute(PARKING_LOT_BY_ID_QUERY, (lot_id,))
+        return row_types.fetch_one(cursor)
     finally:
         conn.close()
 
 def increment_reserved_count(lot_id: int):
     """Increment the reserved count for a parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE parking_lots
-            SET reserved = COALESCE(reserved, 0) + 1
-            WHERE id = ?
-        """, (lot_id,))
+        cursor.execute(INCREMENT_RESERVED_QUERY, (lot_id,))
         conn.commit()
     finally:
         conn.close()
 
 def decrement_reserved_count(lot_id: int):
     """Decrement the reserved count for a parking lot"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
-        cursor.execute("""
-            UPDATE parking_lots
-            SET reserved = MAX(0, COALESCE(reserved, 1) - 1)
-            WHERE id = ?
-        """, (lot_id,))
+        cursor.execute(DECREMENT_RESERVED_QUERY, (lot_id,))
         conn.commit()
     finally:
         conn.close()
 
 def get_overlapping_reservations(lot_id: int, start_time: str, end_time: str, exclude_reservation_id: int = None) -> int:
     """Count reservations that overlap with the given time range"""
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = database_utils.connect(DATABASE_PATH)
     cursor = conn.cursor()
     try:
         # Count reservations that overlap with the requested time period
-        # Two time ranges overlap if: start1 < end2 AND start2 < end1
-        query = """
-            SELECT COUNT(*) FROM reservations 
-            WHERE parking_lot_id = ? 
-            AND status IN ('pending', 'confirmed')
-            AND datetime(start_time) < datetime(?)
-            AND datetime(end_time) > datetime(?)
-        """
+        query = OVERLAPPING_RESERVATIONS_QUERY
         params = [lot_id, end_time, start_time]
         
         # Exclude a specific reservation (for updates)
@@ -128,4 +157,30 @@ def get_overlapping_reservations(lot_id: int, start_time: str, end_time: str, ex
         count = cursor.fetchone()[0]
         return count
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def expire_past_reservations() -> int:
+    """Close reservations whose end time has passed; returns the number of reservations updated"""
+    conn = database_utils.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(EXPIRE_PAST_RESERVATIONS_QUERY)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def reconcile_reserved_counts() -> int:
+    """Repair reserved counters that drifted from the open reservations; returns the number of lots fixed"""
+    conn = database_utils.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(RECONCILE_RESERVED_QUERY)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__)
@@ -0,0 +1,89 @@
+"""
+Compact row types for query results.
+
+Row types are generated from the column names of a result set (cursor.description)
+and use __slots__, so a row costs one small object instead of
+a sqlite3.Row plus a dict copy. They support read-only dict-style access
+(row["capacity"], row.get("capacity")) so callers can use them like the dict rows
+returned by database_utils.execute_query.
+"""
+import sqlite3
+from typing import Dict, Any, Tuple, Type, Optional, List
+
+_row_types: Dict[Tuple[str, ...], Type["Row"]] = {}
+
+
+class Row:
+    """Base class for generated row types"""
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def keys(self) -> Tuple[str, ...]:
+        return self.__slots__
+
+    def values(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.__slots__]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Response payload for this row (the only copy made)"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Row):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+def row_type(columns: Tuple[str, ...], name: str = "QueryRow") -> Type[Row]:
+    """Get (or generate) the slotted row type for a set of column names"""
+    row_cls = _row_types.get(columns)
+    if row_cls is None:
+        row_cls = type(name, (Row,), {"__slots__": columns})
+        _row_types[columns] = row_cls
+    return row_cls
+
+
+def columns_of(cursor: sqlite3.Cursor) -> Tuple[str, ...]:
+    """Column names of the current result set"""
+    return tuple(column[0] for column in cursor.description)
+
+
+def fetch_one(cursor: sqlite3.Cursor) -> Optional[Row]:
+    """Fetch a single row from an executed cursor as a slotted row"""
+    values = cursor.fetchone()
+    if values is None:
+        return None
+    return row_type(columns_of(cursor))(*values)
+
+
+def fetch_all(cursor: sqlite3.Cursor) -> List[Row]:
+    """Fetch all rows from an executed cursor as slotted rows (type resolved once)"""
+    row_cls = row_type(columns_of(cursor))
+    return [row_cls(*values) for values in cursor.fetchall()]
@@ -1,8 +1,16 @@
 from datetime import datetime
-from api.utils.database_utils import execute_query
+from utils.database_utils import execute_query
+from utils.query_registry import register
 import math
 import uuid
 import hashlib
+from utils import tracing_utils
+
+PAID_AMOUNT_QUERY = register("""
+        SELECT SUM(amount) as total 
+        FROM payments 
+        WHERE external_ref = ? AND status = 'completed'
+    """)
 
 def calculate_price(parkinglot, sid, data):
     """Bereken prijs voor parking sessie - uit session_calculator.py"""
@@ -14,6 +22,12 @@ def calculate_price(parkinglot, sid, data):
     else:
         end = datetime.now()
 
+    return price_for_period(parkinglot, start, end)
+
+
+def price_for_period(parkinglot, start: datetime, end: datetime):
+    """Prijs, uren en dagen voor een parkeerperiode (zelfde regels als calculate_price, zonder string parsing)"""
+    price = 0
     diff = end - start
     hours = math.ceil(diff.total_seconds() / 3600)
 
@@ -42,10 +56,9 @@ def generate_transaction_validation_hash():
 
 def check_payment_amount(hash):
     """Check betaald bedrag voor transactie - aangepast voor database"""
-    query = """
-        SELECT SUM(amount) as total 
-        FROM payments 
-        WHERE external_ref = ? AND status = 'completed'
-    """
-    result = execute_query(query, (hash,))
+    result = execute_query(PAID_AMOUNT_QUERY, (hash,))
     return float(result[0]['total']) if result and result[0]['total'] else 0
+
+
+# Spans voor request tracing (pure rekenhulpjes niet, die worden ook in tight loops gebruikt)
+tracing_utils.instrument_module(__name__, exclude=("price_for_period",))
@@ -0,0 +1,64 @@
+"""
+Single-flight request coalescing for hot read endpoints.
+
+When many clients ask for the same thing at the same moment (a lot opens, or
+every client reconnects after a restart), only the first request runs the
+utils read function; the others wait for that call and get the same result
+(or the same exception). The key is the route, the function, its arguments and
+the auth scope of the caller, so results are only shared between requests that
+would have received exactly the same data.
+
+The call runs in a thread, so the event loop stays free to accept the other
+requests that are going to share it. The result object is shared between all
+waiters and must not be modified.
+"""
+import asyncio
+import functools
+from typing import Any, Callable, Dict, Hashable, Tuple
+from utils import metrics_utils
+
+COALESCED_CALLS = metrics_utils.Counter("singleflight_calls_total",
+                                        "Coalesced reads per function; leader ran the query, shared reused it",
+                                        ("function", "outcome"))
+COALESCED_IN_FLIGHT = metrics_utils.Gauge("singleflight_in_flight", "Reads currently running per function", ("function",))
+
+# key -> task van de lopende aanroep; alleen gebruikt vanuit de event loop thread
+_calls: Dict[Tuple[Hashable, ...], asyncio.Future] = {}
+
+
+async def do(name: str, key: Tuple[Hashable, ...], func: Callable, *args, **kwargs) -> Any:
+    """Run func(*args, **kwargs) in a thread, or wait for the identical call that is already running"""
+    task = _calls.get(key)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        _calls[key] = task
+        COALESCED_IN_FLIGHT.inc((name,))
+        task.add_done_callback(functools.partial(_finished, name, key))
+        COALESCED_CALLS.inc((name, "leader"))
+    else:
+        COALESCED_CALLS.inc((name, "shared"))
+    # shield: een request dat afbreekt, annuleert de query niet voor de anderen
+    return await asyncio.shield(task)
+
+
+def _finished(name: str, key: Tuple[Hashable, ...], task: asyncio.Future) -> None:
+    if _calls.get(key) is task:
+        del _calls[key]
+    COALESCED_IN_FLIGHT.dec((name,))
+    # Exception ophalen, ook als alle wachtende requests al weg zijn
+    if not task.cancelled():
+        task.exception()
+
+
+def coalesced(func: Callable) -> Callable:
+    """
+    Async version of a utils read function whose concurrent identical calls share one execution.
+    Pass `scope` for data that depends on the caller (e.g. the user id); public data uses the default.
+    """
+    name = f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+    @functools.wraps(func)
+    async def wrapper(*args, scope: Hashable = "public", **kwargs):
+        key = (metrics_utils.request_route(), name, args, tuple(sorted(kwargs.items())), scope)
+        return await do(name, key, func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,115 @@
+"""
+Slow-query log.
+
+database_utils.TimedCursor reports every statement that takes longer than
+SLOW_QUERY_THRESHOLD_MS to record(). The entry holds the normalized SQL, the
+parameter shape, the calling endpoint and function, and (once per distinct
+statement) the EXPLAIN QUERY PLAN output. Entries go to a dedicated log file in
+systemlogs/, not to the main log.
+"""
+import logging
+import logging.handlers
+import re
+import sqlite3
+import sys
+import threading
+from typing import Any, Optional
+from utils import metrics_utils
+import constants
+
+# Statements waarvoor EXPLAIN QUERY PLAN zinvol is
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+_explained = set()
+_explained_lock = threading.Lock()
+_logger: Optional[logging.Logger] = None
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL zonder literals en met een enkele ? voor placeholder lijsten, zodat gelijke statements samenvallen"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("?, ...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def parameter_shape(parameters: Any) -> str:
+    """Types van de parameters (nooit de waarden zelf, die kunnen persoonsgegevens bevatten)"""
+    if parameters is None:
+        return "executemany"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+def current_endpoint() -> str:
+    return metrics_utils.request_route() or "-"
+
+
+def calling_function() -> str:
+    """Eerste functie buiten de database laag (bv. parking_lots_utils.get_sessions_by_lot_id)"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if not module.endswith(("database_utils", "slowquery_utils")) and module != "sqlite3":
+            return f"{module.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "-"
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    if _logger is None:
+        logger = logging.getLogger("SlowQueries")
+        if not logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                filename=constants.SLOW_QUERY_LOG_PATH,
+                maxBytes=constants.MAX_LOG_SIZE,
+                backupCount=constants.MAX_BACKUPS,
+                mode='a'
+            )
+            handler.setFormatter(logging.Formatter('[%(asctime)s] - [%(name)s] -- %(message)s'))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        # Niet ook in het hoofdlog
+        logger.propagate = False
+        _logger = logger
+    return _logger
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters: Any) -> str:
+    try:
+        # Gewone sqlite3.Cursor: het EXPLAIN statement zelf wordt niet getimed
+        rows = sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+    except sqlite3.Error as e:
+        return f"unavailable ({e})"
+    return "; ".join(row[3] for row in rows)
+
+
+def record(conn: sqlite3.Connection, sql: str, parameters: Any, seconds: float) -> None:
+    """Write a slow statement to the slow-query log (with its plan the first time it is seen)"""
+    normalized = normalize_sql(sql)
+    parts = [f"{seconds * 1000:.1f} ms", current_endpoint(), calling_function(),
+             f"params {parameter_shape(parameters)}", normalized]
+
+    first_time = False
+    with _explained_lock:
+        if normalized not in _explained:
+            _explained.add(normalized)
+            first_time = True
+    # Bij executemany is er geen enkele parameter set om mee te plannen
+    if first_time and parameters is not None and normalized.split(" ", 1)[0].upper() in _EXPLAINABLE:
+        parts.append(f"plan: {_explain(conn, sql, parameters)}")
+
+    try:
+        _get_logger().info(" | ".join(parts))
+    except OSError:
+        # Loggen mag een query nooit laten falen
+        pass
@@ -0,0 +1,131 @@
+"""
+Streaming responses (NDJSON / chunked JSON array) for large result sets
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable, Iterator, AsyncIterator, Dict, Any
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_FORMATS = ("ndjson", "json")
+
+# Aantal rows per geschreven chunk bij een JSON array
+ROWS_PER_CHUNK = 500
+
+# Zoveel tekens aan chunks per stap van de stream thread (een thread wissel per row is te duur)
+BATCH_BYTES = 64 * 1024
+# Gedeelde threads voor export cursors (elke stream houdt er een bezet tot hij klaar is, de rest wacht)
+STREAM_WORKERS = 8
+# Zoveel batches mag een stream thread vooruit lopen op de client
+STREAM_QUEUE_BATCHES = 2
+
+_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="stream")
+
+
+def stream_format(stream: Optional[str], accept: Optional[str]) -> Optional[str]:
+    """
+    Determine whether and how a listing should be streamed.
+
+    Args:
+        stream: Value of the `stream` query parameter (ndjson or json)
+        accept: Accept header of the request
+
+    Returns:
+        "ndjson", "json" or None for a regular (paginated) response
+    """
+    if stream:
+        if stream not in STREAM_FORMATS:
+            raise HTTPException(status_code=400, detail=f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+        return stream
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        return "ndjson"
+    return None
+
+
+def _ndjson_chunks(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+
+def _json_array_chunks(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    yield "["
+    buffer = []
+    first = True
+    for row in rows:
+        buffer.append(json.dumps(row, default=str))
+        if len(buffer) >= ROWS_PER_CHUNK:
+            yield ("" if first else ",") + ",".join(buffer)
+            first = False
+            buffer = []
+    if buffer:
+        yield ("" if first else ",") + ",".join(buffer)
+    yield "]"
+
+
+def _next_batch(chunks: Iterator[str]) -> str:
+    """Encoded chunks up to about BATCH_BYTES; an empty string when the rows are exhausted"""
+    batch, size = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= BATCH_BYTES:
+            break
+    return "".join(batch)
+
+
+def _drain(chunks: Iterator[str], queue: "asyncio.Queue", loop: asyncio.AbstractEventLoop, stop: threading.Event) -> None:
+    """Runs on a stream worker: hands batches to the event loop until the rows are exhausted or the client is gone"""
+    try:
+        while not stop.is_set():
+            batch = _next_batch(chunks)
+            # Wacht tot er plek is in de queue, zo loopt de query niet verder vooruit dan de client leest
+            asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+            if not batch:
+                return
+    except BaseException as e:
+        if not stop.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(e), loop).result()
+    finally:
+        # Ook bij een afgebroken download: de generator (en zijn connectie) op dezelfde thread sluiten
+        chunks.close()
+
+
+async def _on_one_thread(chunks: Iterator[str]) -> AsyncIterator[str]:
+    """
+    Advance a sync chunk generator on one worker of the shared stream executor.
+
+    The sqlite connection of iter_query may only be used by the thread that
+    opened it, while Starlette would run every next() on any threadpool worker,
+    so the whole generator is drained by a single task.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_BATCHES)
+    stop = threading.Event()
+    _executor.submit(_drain, chunks, queue, loop, stop)
+    try:
+        while True:
+            batch = await queue.get()
+            if isinstance(batch, BaseException):
+                raise batch
+            if not batch:
+                break
+            yield batch
+    finally:
+        stop.set()
+        # Een worker die nog op een volle queue wacht vrijmaken, hij ziet daarna de stop en sluit af
+        while not queue.empty():
+            queue.get_nowait()
+
+
+def stream_rows(rows: Iterable[Dict[str, Any]], fmt: str) -> StreamingResponse:
+    """
+    Wrap a row iterator (e.g. from database_utils.iter_query) in a StreamingResponse.
+    Rows are encoded as they are read, so memory stays bounded regardless of result size.
+    """
+    # rows niet zelf vasthouden: alleen de chunk generator, zodat die hem op de stream thread opruimt
+    if fmt == "ndjson":
+        return StreamingResponse(_on_one_thread(_ndjson_chunks(rows)), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(_on_one_thread(_json_array_chunks(rows)), media_type="application/json")
@@ -0,0 +1,364 @@
+"""
+Lightweight in-process request tracing.
+
+Every request gets a trace (TracingMiddleware, the SERVER span). Below it are
+spans for the endpoint handler (TracedRoute), for every function of the
+instrumented utils modules (instrument_module) and for every SQL statement
+(hook in database_utils). Finished traces go to an in-memory ring buffer and,
+when TRACE_EXPORT_PATH is set, are appended to that file by a background
+thread, one OTLP/JSON ExportTraceServiceRequest per line.
+
+Outside a trace (scripts, tests, background work) the wrappers only do a
+context variable lookup.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.routing import APIRoute
+import constants
+from utils import metrics_utils
+
+SERVICE_NAME = "parking-api"
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, kind: int, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """De spans van een request; spans boven TRACE_MAX_SPANS worden alleen geteld"""
+    __slots__ = ("trace_id", "spans", "dropped_spans", "_lock")
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.dropped_spans = 0
+        # Gestreamde responses lopen (deels) in de threadpool
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> Span:
+        with self._lock:
+            if len(self.spans) < constants.TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+        return span
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+
+CURRENT_SPAN: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+# Laatst afgeronde traces, oudste eerst
+_finished: deque = deque(maxlen=constants.TRACE_BUFFER_SIZE)
+
+
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes) -> Optional[Span]:
+    """Start a child of the current span; None outside a trace"""
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        return None
+    return parent.trace.add(Span(parent.trace, name, kind, parent.span_id, attributes))
+
+
+def traced(name: str) -> Callable:
+    """Decorator: a span around every call, but only inside a trace"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                span = start_span(name)
+                if span is None:
+                    return await func(*args, **kwargs)
+                token = CURRENT_SPAN.set(span)
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException as e:
+                    span.error = type(e).__name__
+                    raise
+                finally:
+                    span.end_ns = time.time_ns()
+                    CURRENT_SPAN.reset(token)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            span = start_span(name)
+            if span is None:
+                return func(*args, **kwargs)
+            token = CURRENT_SPAN.set(span)
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                span.error = type(e).__name__
+                raise
+            finally:
+                span.end_ns = time.time_ns()
+                CURRENT_SPAN.reset(token)
+        return wrapper
+    return decorator
+
+
+def instrument_module(module_name: str, exclude: tuple = ()) -> None:
+    """
+    Wrap the public functions defined in a module with traced(), except those in `exclude`.
+    Called at the bottom of a utils module, before other modules import its functions.
+    """
+    module = sys.modules[module_name]
+    short_name = module_name.rsplit(".", 1)[-1]
+    for attribute, value in list(vars(module).items()):
+        if (attribute.startswith("_") or attribute in exclude or not inspect.isfunction(value)
+                or value.__module__ != module_name):
+            continue
+        # Generators (iter_*) en context managers niet: die lopen pas na de aanroep
+        if inspect.isgeneratorfunction(inspect.unwrap(value)):
+            continue
+        setattr(module, attribute, traced(f"{short_name}.{attribute}")(value))
+
+
+def record_statement(sql: str, seconds: float) -> None:
+    """Span for an SQL statement that just finished (called from database_utils)"""
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        return
+    operation, table = metrics_utils.query_labels(sql)
+    span = Span(parent.trace, f"{operation} {table}".strip(), KIND_CLIENT, parent.span_id,
+                {"db.system": "sqlite", "db.statement": " ".join(sql.split())})
+    span.end_ns = time.time_ns()
+    span.start_ns = span.end_ns - int(seconds * 1e9)
+    parent.trace.add(span)
+
+
+# ---------------------------
+# Endpoint handler span
+# ---------------------------
+
+class TracedRoute(APIRoute):
+    """APIRoute met een span om de handler (validatie, endpoint en serialisatie)"""
+
+    def get_route_handler(self) -> Callable:
+        return traced(f"handler {self.endpoint.__module__.rsplit('.', 1)[-1]}.{self.endpoint.__name__}")(
+            super().get_route_handler())
+
+
+# ---------------------------
+# ASGI middleware
+# ---------------------------
+
+def _parent_from_header(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"traceparent":
+            match = _TRACEPARENT.match(value.decode("latin-1").strip())
+            if match and match.group(1) != "0" * 32:
+                return match.group(1), match.group(2)
+            break
+    return None, None
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware; starts a trace per request (continuing a W3C traceparent
+    header when present) and returns the trace id in X-Trace-Id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not constants.TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, remote_parent = _parent_from_header(scope)
+        trace = Trace(trace_id)
+        root = trace.add(Span(trace, f"{scope.get('method', '')} {scope.get('path', '')}", KIND_SERVER,
+                              remote_parent, {"http.method": scope.get("method"), "http.target": scope.get("path")}))
+        request_id = metrics_utils.CURRENT_REQUEST_ID.get()
+        if request_id:
+            root.attributes["request.id"] = request_id
+        token = CURRENT_SPAN.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            CURRENT_SPAN.reset(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope.get('method', '')} {route}"
+                root.attributes["http.route"] = route
+            root.end_ns = time.time_ns()
+            finish_trace(trace)
+
+
+# ---------------------------
+# Export
+# ---------------------------
+
+_export_queue: Optional[queue.Queue] = None
+_export_lock = threading.Lock()
+
+
+def finish_trace(trace: Trace) -> None:
+    _finished.append(trace)
+    if constants.TRACE_EXPORT_PATH:
+        _exporter().put(trace)
+
+
+def _exporter() -> queue.Queue:
+    """Queue van de export thread, die bij de eerste trace gestart wordt"""
+    global _export_queue
+    if _export_queue is None:
+        with _export_lock:
+            if _export_queue is None:
+                export_queue = queue.Queue()
+                threading.Thread(target=_export_loop, args=(export_queue,), name="trace-exporter", daemon=True).start()
+                _export_queue = export_queue
+    return _export_queue
+
+
+def _export_loop(export_queue: queue.Queue) -> None:
+    while True:
+        traces = [export_queue.get()]
+        # Alles wat al klaar staat in een keer schrijven
+        while not export_queue.empty() and len(traces) < 100:
+            traces.append(export_queue.get_nowait())
+        try:
+            with open(constants.TRACE_EXPORT_PATH, "a", encoding="utf-8") as file:
+                for trace in traces:
+                    file.write(json.dumps(to_otlp(trace), separators=(",", ":")) + "\n")
+        except OSError:
+            pass
+
+
+def _otlp_value(value) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON zet 64-bit integers als string
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """A trace as an OTLP/JSON ExportTraceServiceRequest (importable in Jaeger, Tempo, ...)"""
+    spans = []
+    for span in list(trace.spans):
+        otlp_span = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()
+                           if value is not None],
+            # 1 = OK, 2 = ERROR
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing_utils"}, "spans": spans}],
+    }]}
+
+
+# ---------------------------
+# Ring buffer queries
+# ---------------------------
+
+def _summary(trace: Trace) -> Dict[str, Any]:
+    root = trace.root
+    return {
+        "trace_id": trace.trace_id,
+        "name": root.name,
+        "status": root.attributes.get("http.status_code"),
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(root.start_ns / 1e9)),
+        "duration_ms": round(root.duration_ms, 2),
+        "spans": len(trace.spans),
+        "dropped_spans": trace.dropped_spans,
+    }
+
+
+def _tree(trace: Trace) -> List[Dict[str, Any]]:
+    """Spans in start volgorde met hun diepte, voor een leesbaar overzicht"""
+    children: Dict[Optional[str], List[Span]] = {}
+    for span in trace.spans:
+        children.setdefault(span.parent_id, []).append(span)
+    root = trace.root
+    rows = []
+
+    def walk(span: Span, depth: int) -> None:
+        rows.append({
+            "depth": depth,
+            "name": span.name,
+            "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 2),
+            "duration_ms": round(span.duration_ms, 2),
+            **({"error": span.error} if span.error else {}),
+            **({"statement": span.attributes["db.statement"]} if "db.statement" in span.attributes else {}),
+        })
+        for child in sorted(children.get(span.span_id, []), key=lambda child: child.start_ns):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return rows
+
+
+def slowest_traces(limit: int = 10, route: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Slowest traces in the ring buffer (optionally for one route template), with their span tree"""
+    traces = [trace for trace in list(_finished)
+              if route is None or trace.root.attributes.get("http.route") == route]
+    traces.sort(key=lambda trace: trace.root.duration_ms, reverse=True)
+    return [{**_summary(trace), "tree": _tree(trace)} for trace in traces[:limit]]
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    for trace in list(_finished):
+        if trace.trace_id == trace_id:
+            return trace
+    return None
@@ -1,25 +1,46 @@
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
-from api.utils.database_utils import get_db_connection, execute_query
+from utils.database_utils import get_db_connection, execute_query
+from utils import pagination_utils
+from utils import archive_utils
+from utils.query_registry import register
+from utils import tracing_utils
+from utils import fields_utils
+
+VEHICLES_BY_USER_QUERY = register("SELECT {columns} FROM vehicles WHERE user_id = ?", columns="*")
+VEHICLE_BY_ID_QUERY = register("SELECT * FROM vehicles WHERE id = ? AND user_id = ?")
+VEHICLE_BY_PLATE_QUERY = register("SELECT * FROM vehicles WHERE license_plate = ? AND user_id = ?")
+CREATE_VEHICLE_QUERY = register("""
+        INSERT INTO vehicles (user_id, license_plate, make, model, color, year, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """)
+UPDATE_VEHICLE_QUERY = register("UPDATE vehicles SET {assignments} WHERE id = ? AND user_id = ?", assignments="make = ?")
+DELETE_VEHICLE_QUERY = register("DELETE FROM vehicles WHERE id = ? AND user_id = ?")
+VEHICLE_RESERVATIONS_QUERY = register("""
+        SELECT {columns} FROM reservations 
+        WHERE vehicle_id = ? AND user_id = ?
+        ORDER BY start_time DESC
+    """, columns="*")
+# Geschiedenis op started_at (zoals voor de paginering), id maakt de cursor uniek
+HISTORY_KEY = ("started_at", "id")
+pagination_utils.register_page("SELECT * FROM p_sessions", ["vehicle_id = ?", "user_id = ?"], key=HISTORY_KEY,
+                               descending=True)
 
 
-def get_vehicles_by_user_id(user_id: int) -> List[Dict[str, Any]]:
-    """Get all vehicles for a specific user"""
-    query = "SELECT * FROM vehicles WHERE user_id = ?"
-    return execute_query(query, (user_id,))
+def get_vehicles_by_user_id(user_id: int, fields: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+    """Get all vehicles for a specific user (with only `fields` if given)"""
+    return execute_query(VEHICLES_BY_USER_QUERY.format(columns=fields_utils.columns(fields)), (user_id,))
 
 
 def get_vehicle_by_id(vehicle_id: str, user_id: int) -> Optional[Dict[str, Any]]:
     """Get a specific vehicle by ID for a user"""
-    query = "SELECT * FROM vehicles WHERE id = ? AND user_id = ?"
-    results = execute_query(query, (vehicle_id, user_id))
+    results = execute_query(VEHICLE_BY_ID_QUERY, (vehicle_id, user_id))
     return results[0] if results else None
 
 
 def get_vehicle_by_license_plate(license_plate: str, user_id: int) -> Optional[Dict[str, Any]]:
     """Check if vehicle with license plate exists for user"""
-    query = "SELECT * FROM vehicles WHERE license_plate = ? AND user_id = ?"
-    results = execute_query(query, (license_plate, user_id))
+    results = execute_query(VEHICLE_BY_PLATE_QUERY, (license_plate, user_id))
     return results[0] if results else None
 
 
@@ -27,13 +48,9 @@ def create_vehicle(user_id: int, license_plate: str, make: str = None, model: st
     """Create a new vehicle for a user"""
     created_at = datetime.now().strftime("%Y-%m-%d")
     
-    query = """
-        INSERT INTO vehicles (user_id, license_plate, make, model, color, year, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (user_id, license_plate, make, model, color, year, created_at))
+        cursor.execute(CREATE_VEHICLE_QUERY, (user_id, license_plate, make, model, color, year, created_at))
         return cursor.lastrowid
 
 
@@ -59,7 +76,7 @@ def update_vehicle(vehicle_id: str, user_id: int, make: str = None, model: str =
         return False
     
     params.extend([vehicle_id, user_id])
-    query = f"UPDATE vehicles SET {', '.join(updates)} WHERE id = ? AND user_id = ?"
+    query = UPDATE_VEHICLE_QUERY.format(assignments=", ".join(updates))
     
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -69,40 +86,37 @@ def update_vehicle(vehicle_id: str, user_id: int, make: str = None, model: str =
 
 def delete_vehicle(vehicle_id: str, user_id: int) -> bool:
     """Delete a vehicle"""
-    query = "DELETE FROM vehicles WHERE id = ? AND user_id = ?"
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute(query, (vehicle_id, user_id))
+        cursor.execute(DELETE_VEHICLE_QUERY, (vehicle_id, user_id))
         return cursor.rowcount > 0
 
 
-def get_vehicle_reservations(vehicle_id: str, user_id: int) -> List[Dict[str, Any]]:
-    """Get all reservations for a specific vehicle"""
-    # Query reservations table for this vehicle
-    query = """
-        SELECT r.* FROM reservations r
-        WHERE r.vehicle_id = ? AND r.user_id = ?
-        ORDER BY r.start_time DESC
-    """
-    return execute_query(query, (vehicle_id, user_id))
-
-
-def get_vehicle_history(vehicle_id: str, user_id: int) -> List[Dict[str, Any]]:
-    """Get history for a specific vehicle"""
+def get_vehicle_history(vehicle_id: str, user_id: int, cursor: Optional[str] = None, limit: Optional[int] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None,
+                        status: Optional[str] = None,
+                        fields: Optional[Tuple[str, ...]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Get a page of history for a specific vehicle (newest started_at first)"""
     # Query p_sessions (parking sessions) for this vehicle
-    query = """
-        SELECT * FROM p_sessions
-        WHERE vehicle_id = ? AND user_id = ?
-        ORDER BY started_at DESC
-    """
-    return execute_query(query, (vehicle_id, user_id))
-
-
-def get_vehicle_reservations(vehicle_id: str, user_id: int) -> List[Dict[str, Any]]:
-    """Get all reservations for a specific vehicle"""
-    query = """
-        SELECT * FROM reservations 
-        WHERE vehicle_id = ? AND user_id = ?
-        ORDER BY start_time DESC
-    """
-    return execute_query(query, (vehicle_id, user_id))
+    conditions, params = pagination_utils.date_range_conditions("started_at", start_date, end_date)
+    conditions = ["vehicle_id = ?", "user_id = ?"] + conditions + pagination_utils.session_status_condition(status)
+    params = [vehicle_id, user_id] + params
+    source, with_archive = archive_utils.session_source(start_date)
+    # started_at is nodig voor de cursor, ook als het niet gevraagd is
+    columns = fields_utils.columns(fields_utils.with_fields(fields, "started_at"))
+    history, next_cursor = pagination_utils.paginate(f"SELECT {columns} FROM {source}", conditions, params, cursor,
+                                                     limit, key=HISTORY_KEY, descending=True,
+                                                     with_archive=with_archive)
+    if fields is not None:
+        history = [fields_utils.pick(row, fields) for row in history]
+    return history, next_cursor
+
+
+def get_vehicle_reservations(vehicle_id: str, user_id: int,
+                             fields: Optional[Tuple[str, ...]] = None) -> List[Dict[str, Any]]:
+    """Get all reservations for a specific vehicle (with only `fields` if given)"""
+    return execute_query(VEHICLE_RESERVATIONS_QUERY.format(columns=fields_utils.columns(fields)), (vehicle_id, user_id))
+
+
+# Spans voor request tracing
+tracing_utils.instrument_module(__name__)
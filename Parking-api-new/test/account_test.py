@@ -146,3 +146,11 @@ def test_logout_invalid_token():
     res2 = requests.get(f"{BASE_URL}/logout", headers={"Authorization": "fake-token"})
     assert res2.status_code == 400
     assert b"Invalid session token" in res2.content
+
+def test_get_all_users_lists_newest_first():
+    # database_utils.get_all_users: een lijst van alle users, nieuwste (created_at) eerst
+    from utils import database_utils
+    users = database_utils.get_all_users()
+    assert isinstance(users, list) and any(user["username"] == "admin" for user in users)
+    created = [user["created_at"] or "" for user in users]
+    assert created == sorted(created, reverse=True)
@@ -0,0 +1,296 @@
+"""
+Benchmark suite for hot utility functions and the session start/stop endpoints.
+
+Every dataset size is generated once with create_test_db.generate_dataset (cached
+in the temp directory) and benchmarked in its own process against a copy, so
+the benchmark writes never change the cached dataset. Results are written as
+JSON; --compare prints a report against a baseline and exits with 1 on a regression.
+
+    python test/benchmark.py --sizes small,medium --output test/benchmarks/baseline.json
+    python test/benchmark.py --sizes small,medium --compare test/benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.abspath(os.path.join(test_dir, '..'))
+api_dir = os.path.join(project_dir, 'api')
+
+# Dataset groottes (zie create_test_db.generate_dataset)
+DATASET_SIZES = {
+    "small": {"users": 1000, "lots": 10, "sessions": 50000, "reservations": 5000, "payments": 20000, "discounts": 100},
+    "medium": {"users": 10000, "lots": 100, "sessions": 500000, "reservations": 50000, "payments": 200000, "discounts": 1000},
+    "large": {"users": 100000, "lots": 1000, "sessions": 5000000, "reservations": 500000, "payments": 2000000, "discounts": 10000},
+}
+DATASET_SEED = 42
+DATASET_DAYS = 90
+# Vaste "nu" van de datasets, zodat elke machine dezelfde rijen genereert
+DATASET_END = datetime(2025, 1, 1)
+DATASET_CACHE_DIR = os.path.join(tempfile.gettempdir(), "parking-benchmark-datasets")
+
+# Een benchmark geldt als regressie als de mediaan meer dan dit deel trager is
+DEFAULT_THRESHOLD = 0.10
+
+
+# ---------------------------
+# Meten
+# ---------------------------
+
+def measure(func, rounds=7, number=None, target_seconds=0.2):
+    """
+    Time func() in rounds of `number` calls and return per-call statistics in microseconds.
+    Without `number` it is calibrated so one round takes about target_seconds.
+    """
+    func()  # warmup
+    if number is None:
+        number = 1
+        while True:
+            started = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - started >= target_seconds / 4 or number >= 100000:
+                break
+            number *= 4
+
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number * 1e6)
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "min_us": round(samples[0], 3),
+        "max_us": round(samples[-1], 3),
+        "rounds": rounds,
+        "number": number,
+    }
+
+
+class AsgiClient:
+    """Minimal in-process ASGI client: calls the app directly, without sockets or a server"""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+
+    def request(self, method, path, body=None, headers=None):
+        return self.loop.run_until_complete(self._request(method, path, body, headers or {}))
+
+    async def _request(self, method, path, body, headers):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        raw_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())]
+        raw_headers += [(key.lower().encode(), value.encode()) for key, value in headers.items()]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": raw_headers, "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+        }
+        received = False
+        status = None
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await self.app(scope, receive, send)
+        return status
+
+    def close(self):
+        self.loop.close()
+
+
+# ---------------------------
+# Benchmarks (draait in een worker process per dataset)
+# ---------------------------
+
+def run_benchmarks(db_path, quick=False):
+    """Run all benchmarks against one dataset; returns {name: stats}"""
+    os.environ["DATABASE_PATH"] = db_path
+    for path in (project_dir, api_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    import sqlite3
+    from utils import session_calculator, billing_utils, auth_utils, reservations_utils, parking_lots_utils
+    from apiroutes import run as create_app
+
+    rounds = 3 if quick else 7
+    conn = sqlite3.connect(db_path)
+    # Drukste lot (Zipf: de eerste gegenereerde) en drukste gebruiker
+    lot = dict(zip(("id", "tariff", "day_tariff"), conn.execute(
+        "SELECT parking_lot_id, tariff, day_tariff FROM p_sessions JOIN parking_lots pl ON pl.id = parking_lot_id "
+        "GROUP BY parking_lot_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()))
+    username = conn.execute(
+        "SELECT user_name FROM p_sessions WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    user = conn.execute("SELECT password_hash, hash_v FROM users WHERE username = ?", (username,)).fetchone()
+    conn.close()
+
+    results = {}
+    session = {"started": "2024-12-01 08:15:00", "stopped": "2024-12-01 11:40:00"}
+    results["calculate_price"] = measure(lambda: session_calculator.calculate_price(lot, 1, session), rounds)
+
+    billing_sessions = billing_utils.get_user_sessions_by_username(username)
+    results["format_billing_data"] = measure(lambda: billing_utils.format_billing_data(billing_sessions), rounds)
+
+    # bcrypt is bewust traag: vast aantal calls in plaats van kalibreren
+    results["verify_password"] = measure(
+        lambda: auth_utils.verify_password("password", user[0], user[1]), rounds, number=3)
+
+    window_start = (DATASET_END - timedelta(days=3)).strftime("%Y-%m-%d %H:%M:%S")
+    window_end = (DATASET_END - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S")
+    results["get_overlapping_reservations"] = measure(
+        lambda: reservations_utils.get_overlapping_reservations(lot["id"], window_start, window_end), rounds)
+    results["count_active_sessions"] = measure(lambda: parking_lots_utils.count_active_sessions(lot["id"]), rounds)
+
+    # Endpoints in-process; elke start krijgt een nieuw kenteken, stop stopt de oudste open sessie
+    client = AsgiClient(create_app())
+    plates = (f"BENCH-{index:06d}" for index in range(10 ** 6))
+    started_plates = []
+
+    def start_session():
+        plate = next(plates)
+        status = client.request("POST", f"/parking-lots/{lot['id']}/sessions/start", {"licenseplate": plate})
+        if status != 200:
+            raise RuntimeError(f"session start returned {status}")
+        started_plates.append(plate)
+
+    def stop_session():
+        if not started_plates:
+            start_session()
+        status = client.request("POST", f"/parking-lots/{lot['id']}/sessions/stop",
+                                {"licenseplate": started_plates.pop(0)})
+        if status != 200:
+            raise RuntimeError(f"session stop returned {status}")
+
+    results["endpoint_session_start"] = measure(start_session, rounds, number=20)
+    results["endpoint_session_stop"] = measure(stop_session, rounds, number=20)
+    client.close()
+    return results
+
+
+# ---------------------------
+# Datasets, rapport en CLI
+# ---------------------------
+
+def ensure_dataset(size):
+    """Path of the cached dataset for a size, generated on first use"""
+    if test_dir not in sys.path:
+        sys.path.insert(0, test_dir)
+    import create_test_db
+    from create_test_db import generate_dataset
+    # De wachtwoorden zijn met FERNET_KEY versleuteld: een andere key heeft een eigen dataset nodig
+    key_fingerprint = hashlib.sha256(create_test_db.FERNET_KEY.encode()).hexdigest()[:12]
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    path = os.path.join(DATASET_CACHE_DIR, f"{size}-seed{DATASET_SEED}-key{key_fingerprint}.sqlite3")
+    if not os.path.exists(path):
+        print(f"Generating {size} dataset ...", file=sys.stderr)
+        generate_dataset(path + ".tmp", days=DATASET_DAYS, seed=DATASET_SEED, end=DATASET_END, **DATASET_SIZES[size])
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def benchmark_size(size, quick=False):
+    """Run the benchmarks for one size in a fresh process, against a copy of the dataset"""
+    dataset = ensure_dataset(size)
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, "benchmark.sqlite3")
+        shutil.copyfile(dataset, db_path)
+        command = [sys.executable, os.path.abspath(__file__), "--worker", db_path] + (["--quick"] if quick else [])
+        output = subprocess.run(command, check=True, capture_output=True, text=True,
+                                env={**os.environ, "TEST_MODE": "true"}).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare medians per size/benchmark; returns (report lines, regression count)"""
+    lines = [f"{'size':<8} {'benchmark':<30} {'baseline':>12} {'current':>12} {'change':>8}"]
+    regressions = 0
+    for size, benchmarks in current["sizes"].items():
+        for name, stats in benchmarks.items():
+            base = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not base:
+                lines.append(f"{size:<8} {name:<30} {'-':>12} {stats['median_us']:>10.1f}us {'new':>8}")
+                continue
+            change = stats["median_us"] / base["median_us"] - 1
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            elif change < -threshold:
+                flag = "  faster"
+            lines.append(f"{size:<8} {name:<30} {base['median_us']:>10.1f}us {stats['median_us']:>10.1f}us "
+                         f"{change:>+7.1%}{flag}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot utility functions and endpoints")
+    parser.add_argument("--sizes", default="small", help=f"Comma separated dataset sizes ({', '.join(DATASET_SIZES)})")
+    parser.add_argument("--output", help="Write results as JSON (e.g. a new baseline)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit code 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown of the median counted as a regression (default 0.10)")
+    parser.add_argument("--quick", action="store_true", help="Fewer rounds (smoke test, noisy numbers)")
+    parser.add_argument("--worker", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_benchmarks(args.worker, args.quick)))
+        return
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in DATASET_SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+
+    results = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sizes": {},
+    }
+    for size in sizes:
+        results["sizes"][size] = benchmark_size(size, args.quick)
+        for name, stats in results["sizes"][size].items():
+            print(f"{size:<8} {name:<30} {stats['median_us']:>10.1f}us (min {stats['min_us']:.1f}us)")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        lines, regressions = compare(results, baseline, args.threshold)
+        print("\n" + "\n".join(lines))
+        if regressions:
+            print(f"\n{regressions} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -58,6 +58,25 @@ def test_user_can_get_own_billing(register_and_login):
         assert all("session" in b for b in data)
 
 
+def test_own_billing_etag(register_and_login):
+    token = register_and_login("etaguser", "test123", "ETag User", "etaguser@test.local", "+3111111177", 1990)
+    headers = {"Authorization": token}
+    etag = requests.get(f"{BASE_URL}/billing", headers=headers).headers["ETag"]
+    assert requests.get(f"{BASE_URL}/billing", headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    lot = requests.post(f"{BASE_URL}/parking-lots", json={"name": "Billing ETag Lot", "address": "Street", "capacity": 5,
+                                                          "tariff": 1.0}, headers={"Authorization": get_admin_token()})
+    lot_id = lot.json()["lot_id"]
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "ET-01-AG"}, headers=headers)
+    # Het bedrag van een lopende sessie loopt op: geen ETag
+    running = requests.get(f"{BASE_URL}/billing", headers={**headers, "If-None-Match": etag})
+    assert running.status_code == 200 and "ETag" not in running.headers and len(running.json()) == 1
+
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/stop", json={"licenseplate": "ET-01-AG"}, headers=headers)
+    stopped = requests.get(f"{BASE_URL}/billing", headers={**headers, "If-None-Match": etag})
+    assert stopped.status_code == 200 and stopped.headers["ETag"] != etag
+
+
 # Test 2: User cannot get other user's billing
 def test_user_cannot_get_other_user_billing(register_and_login):
     register_and_login("alice_b", "test123", "Alice B", "alice_b@test.local", "+3111111112", 1990)
@@ -91,6 +110,58 @@ def test_admin_can_get_specific_user_billing(register_and_login):
         assert all("session" in b and "amount" in b for b in data)
 
 
+def test_billing_attaches_archive_only_for_old_ranges(register_and_login, monkeypatch):
+    """Gearchiveerde sessies tellen mee, maar een recente range leest alleen de hot table"""
+    import uuid
+    from datetime import datetime
+    from utils import archive_utils
+    username = f"archived_{uuid.uuid4().hex[:8]}"
+    token = register_and_login(username, "pass123", "Archived", f"{username}@test.local",
+                               f"+31{uuid.uuid4().int % 10**9:09d}", 1990)
+    admin = {"Authorization": get_admin_token()}
+    lot = requests.post(f"{BASE_URL}/parking-lots", json={"name": "Billing Archive Lot", "address": "Street",
+                                                          "capacity": 5, "tariff": 1.0}, headers=admin)
+    lot_id = lot.json()["lot_id"]
+
+    conn = sqlite3.connect(get_test_db_path())
+    user_id = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+    conn.execute("""
+        INSERT INTO p_sessions (parking_lot_id, user_id, license_plate, started_at, stopped_at, verified_exit_at)
+        VALUES (?, ?, 'ARCH-BL', '2000-01-01 08:00:00', '2000-01-01 10:00:00', '2000-01-01 10:05:00')
+    """, (lot_id, user_id))
+    conn.commit()
+    conn.close()
+    assert archive_utils.archive_sessions(older_than_days=9000) >= 1
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "HOT-BL"},
+                  headers={"Authorization": token})
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/stop", json={"licenseplate": "HOT-BL"},
+                  headers={"Authorization": token})
+
+    sources = []
+    session_source = archive_utils.session_source
+
+    def recording_session_source(start_date=None):
+        sources.append(session_source(start_date))
+        return sources[-1]
+
+    monkeypatch.setattr(archive_utils, "session_source", recording_session_source)
+
+    res = requests.get(f"{BASE_URL}/billing/{username}", headers=admin)
+    assert res.status_code == 200
+    assert sorted(b["session"]["licenseplate"] for b in res.json()) == ["ARCH-BL", "HOT-BL"]
+    assert sources[-1][1] is True
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    for path, headers in ((f"/billing/{username}", admin), ("/billing", {"Authorization": token})):
+        res = requests.get(f"{BASE_URL}{path}", params={"start_date": today}, headers=headers)
+        assert res.status_code == 200
+        assert [b["session"]["licenseplate"] for b in res.json()] == ["HOT-BL"]
+        assert sources[-1] == ("p_sessions", False)
+
+    res = requests.get(f"{BASE_URL}/billing", params={"end_date": "2000-13-01"}, headers={"Authorization": token})
+    assert res.status_code == 400
+
+
 # Test 5: Admin cannot access billing with invalid token
 def test_admin_cannot_access_billing_with_invalid_token():
     headers = {"Authorization": "invalid-token-123"}
@@ -1,9 +1,20 @@
 """
 Script to create test database with proper schema and test data.
+
+With --generate it builds a large, deterministic synthetic dataset instead
+(see generate_dataset), e.g. for reproducing production-sized query plans:
+
+    python test/create_test_db.py --generate --users 1000000 --lots 10000 --sessions 100000000
 """
+import argparse
+import itertools
+import math
+import random
 import sqlite3
 import os
 import sys
+import time
+from array import array
 from datetime import datetime, timedelta
 import bcrypt
 from cryptography.fernet import Fernet
@@ -236,6 +247,319 @@ def insert_test_data(cursor):
     """, (yesterday, next_week))
 
 
+# ===========================
+# Generator mode: grote synthetische datasets
+# ===========================
+
+GENERATED_PASSWORD = "password"
+GENERATE_BATCH_SIZE = 50000
+
+# Relatieve drukte per uur van de dag (ochtend- en avondspits)
+HOURLY_ARRIVALS = [1, 1, 1, 1, 2, 4, 9, 16, 18, 14, 11, 11, 12, 11, 11, 12, 14, 16, 13, 9, 7, 5, 3, 2]
+# Relatieve drukte per weekdag (ma..zo)
+WEEKDAY_ARRIVALS = [1.0, 1.0, 1.0, 1.05, 1.15, 0.9, 0.7]
+# Parkeerduur in minuten: lognormaal rond ~2 uur, afgekapt op 3 minuten en 3 dagen
+DWELL_MEDIAN_MINUTES = 120
+DWELL_SIGMA = 0.9
+DWELL_MAX_MINUTES = 3 * 24 * 60
+# Aandeel sessies zonder account (alleen kenteken)
+ANONYMOUS_SESSION_SHARE = 0.3
+
+FIRST_NAMES = ["Anna", "Bram", "Chloe", "Daan", "Emma", "Finn", "Julia", "Lars", "Noah", "Sophie", "Sem", "Tess"]
+LAST_NAMES = ["de Jong", "Jansen", "de Vries", "van den Berg", "Bakker", "Visser", "Smit", "Meijer", "Mulder", "Bos"]
+CITIES = [("Amsterdam", 52.3676, 4.9041), ("Rotterdam", 51.9244, 4.4777), ("Utrecht", 52.0907, 5.1214),
+          ("Den Haag", 52.0705, 4.3007), ("Eindhoven", 51.4416, 5.4697), ("Groningen", 53.2194, 6.5665)]
+MAKES = [("Toyota", "Corolla"), ("Volkswagen", "Golf"), ("Kia", "Niro"), ("Renault", "Clio"), ("Tesla", "Model 3")]
+COLORS = ["Black", "White", "Grey", "Blue", "Red", "Silver"]
+PAYMENT_METHODS = ["card", "ideal", "paypal", "apple_pay"]
+
+
+def _zipf_cum_weights(n, exponent=0.8):
+    """Cumulatieve gewichten voor een paar populaire en veel rustige items (lots, gebruikers)"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def _license_plate(rng):
+    letters = "BDFGHJKLNPRSTVXZ"
+    return (f"{rng.choice(letters)}{rng.choice(letters)}-{rng.randrange(100, 1000)}-"
+            f"{rng.choice(letters)}{rng.choice(letters)}")
+
+
+class _Clock:
+    """Snelle timestamp formatting: minuten sinds het begin van de periode -> 'YYYY-MM-DD HH:MM:SS'"""
+
+    def __init__(self, start, days):
+        self.start = start
+        # Ruim genoeg voor toekomstige reserveringen en kortingen na het einde van de periode
+        self.day_prefixes = [(start + timedelta(days=d)).strftime("%Y-%m-%d ") for d in range(days + 120)]
+
+    def format(self, minute):
+        day, minute_of_day = divmod(int(minute), 1440)
+        hour, minute_of_hour = divmod(minute_of_day, 60)
+        return f"{self.day_prefixes[day]}{hour:02d}:{minute_of_hour:02d}:00"
+
+
+def _session_cost(minutes, tariff, day_tariff, crosses_midnight, days):
+    """Zelfde regels als session_calculator.calculate_price, zonder datetime parsing per rij"""
+    if minutes < 3:
+        return 0.0
+    if crosses_midnight:
+        return round(day_tariff * (days + 1), 2)
+    return round(min(tariff * math.ceil(minutes / 60), day_tariff), 2)
+
+
+def _insert_batches(cursor, sql, rows, label, total):
+    """executemany per batch, met voortgang en rows/s"""
+    started = time.perf_counter()
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(rows, GENERATE_BATCH_SIZE))
+        if not batch:
+            break
+        cursor.executemany(sql, batch)
+        inserted += len(batch)
+        if inserted % (GENERATE_BATCH_SIZE * 20) == 0:
+            elapsed = time.perf_counter() - started
+            print(f"    {label}: {inserted:,}/{total:,} ({inserted / elapsed:,.0f} rows/s)")
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"  - {label}: {inserted:,} rows in {elapsed:.1f}s ({inserted / elapsed:,.0f} rows/s)")
+    return inserted
+
+
+def generate_dataset(db_path, users=10000, lots=100, sessions=1000000, reservations=100000,
+                     payments=500000, discounts=1000, days=365, seed=42, end=None):
+    """
+    Build a synthetic dataset of the requested size in a fresh database.
+
+    The same seed and sizes always give the same rows: every table has its own
+    random.Random(f"{seed}-<table>"), so changing one count does not shift the
+    others. The regular test users (admin, testuser, manager) are inserted first;
+    generated users are user<id> with password GENERATED_PASSWORD.
+
+    Sessions are spread over the last `days` days with hourly/weekday arrival
+    profiles, lognormal dwell times and Zipf-like lot and user popularity, and are
+    written in chronological (id) order like production data. Pass `end` (the
+    "current" time of the dataset) to get byte-identical timestamps across runs.
+    """
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    # Alleen voor het genereren: geen journal en geen fsync
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    cursor = conn.cursor()
+    for schema in get_schemas():
+        cursor.execute(schema)
+    insert_test_data(cursor)
+
+    def next_id(table):
+        return cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+    print(f"\nGenerating dataset (seed {seed}):")
+    now = (end or datetime.now()).replace(second=0, microsecond=0)
+    period_start = (now - timedelta(days=days)).replace(hour=0, minute=0)
+    now_minute = int((now - period_start).total_seconds() // 60)
+    clock = _Clock(period_start, days)
+
+    # Eén keer hashen: bcrypt per gebruiker zou bij 1M gebruikers dagen duren
+    password_hash, password_salt = hash_password(GENERATED_PASSWORD)
+
+    # Users
+    first_user = next_id("users")
+    user_rng = random.Random(f"{seed}-users")
+
+    def user_rows():
+        for user_id in range(first_user, first_user + users):
+            first, last = user_rng.choice(FIRST_NAMES), user_rng.choice(LAST_NAMES)
+            yield (user_id, f"user{user_id}", password_hash, f"{first} {last}", f"user{user_id}@example.com",
+                   f"+316{user_id:08d}", "USER", clock.format(user_rng.randrange(days * 1440)),
+                   user_rng.randint(1940, 2006), 1, "bcrypt", password_salt)
+
+    _insert_batches(cursor, """
+        INSERT INTO users (id, username, password_hash, name, email, phone, role, created_at, birth_year, active, hash_v, salt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, user_rows(), "users", users)
+
+    # Vehicles: één per gebruiker, een op de vijf heeft er twee
+    vehicle_rng = random.Random(f"{seed}-vehicles")
+    first_vehicle = next_id("vehicles")
+    user_vehicle = array("q", [0]) * users
+    vehicle_plates = {}
+
+    def vehicle_rows():
+        vehicle_id = first_vehicle
+        for index in range(users):
+            for _ in range(2 if vehicle_rng.random() < 0.2 else 1):
+                plate = _license_plate(vehicle_rng)
+                if not user_vehicle[index]:
+                    user_vehicle[index] = vehicle_id
+                    vehicle_plates[vehicle_id] = plate
+                make, model = vehicle_rng.choice(MAKES)
+                yield (vehicle_id, first_user + index, plate, make, model, vehicle_rng.choice(COLORS),
+                       vehicle_rng.randint(2005, now.year), clock.format(vehicle_rng.randrange(days * 1440)))
+                vehicle_id += 1
+
+    _insert_batches(cursor, """
+        INSERT INTO vehicles (id, user_id, license_plate, make, model, color, year, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, vehicle_rows(), "vehicles", int(users * 1.2))
+
+    # Parking lots
+    lot_rng = random.Random(f"{seed}-lots")
+    first_lot = next_id("parking_lots")
+    lot_tariffs = []
+
+    def lot_rows():
+        for lot_id in range(first_lot, first_lot + lots):
+            city, lat, lng = lot_rng.choice(CITIES)
+            capacity = int(min(5000, max(20, lot_rng.lognormvariate(math.log(250), 0.8))))
+            tariff = round(lot_rng.uniform(1.5, 5.0), 2)
+            day_tariff = round(tariff * lot_rng.uniform(6, 10), 2)
+            lot_tariffs.append((tariff, day_tariff))
+            yield (lot_id, f"{city} P{lot_id}", city, f"Parkeerstraat {lot_id}, {city}", capacity, 0, tariff,
+                   day_tariff, clock.format(0), round(lat + lot_rng.uniform(-0.05, 0.05), 6),
+                   round(lng + lot_rng.uniform(-0.05, 0.05), 6))
+
+    _insert_batches(cursor, """
+        INSERT INTO parking_lots (id, name, location, address, capacity, reserved, tariff, day_tariff, created_at, lat, lng)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, lot_rows(), "parking lots", lots)
+
+    lot_weights = _zipf_cum_weights(lots)
+    user_weights = _zipf_cum_weights(users, exponent=0.5) if users else []
+
+    # Sessions (+ payments voor betaalde sessies), dag voor dag in chronologische volgorde
+    session_rng = random.Random(f"{seed}-sessions")
+    payment_rng = random.Random(f"{seed}-payments")
+    first_session = next_id("p_sessions")
+    registered_sessions = sessions * (1 - ANONYMOUS_SESSION_SHARE) if users else 0
+    payment_chance = min(1.0, payments / registered_sessions) if registered_sessions else 0.0
+    payment_rows = []
+    weekday_total = sum(WEEKDAY_ARRIVALS[(period_start + timedelta(days=d)).weekday()] for d in range(days))
+    hour_weights = list(itertools.accumulate(HOURLY_ARRIVALS))
+    dwell_mu = math.log(DWELL_MEDIAN_MINUTES)
+
+    def session_rows():
+        session_id = first_session
+        assigned = 0
+        for day in range(days):
+            weight = WEEKDAY_ARRIVALS[(period_start + timedelta(days=day)).weekday()]
+            day_count = sessions - assigned if day == days - 1 else round(sessions * weight / weekday_total)
+            assigned += day_count
+            hours = session_rng.choices(range(24), cum_weights=hour_weights, k=day_count)
+            starts = sorted(day * 1440 + hour * 60 + session_rng.randrange(60) for hour in hours)
+            lot_indexes = session_rng.choices(range(lots), cum_weights=lot_weights, k=day_count)
+            user_indexes = session_rng.choices(range(users), cum_weights=user_weights, k=day_count) if users else []
+            for start, lot_index, user_index in itertools.zip_longest(starts, lot_indexes, user_indexes):
+                dwell = int(min(DWELL_MAX_MINUTES, max(1, session_rng.lognormvariate(dwell_mu, DWELL_SIGMA))))
+                stop = start + dwell
+                if users and session_rng.random() >= ANONYMOUS_SESSION_SHARE:
+                    user_id = first_user + user_index
+                    vehicle_id = user_vehicle[user_index]
+                    plate, user_name = vehicle_plates[vehicle_id], f"user{user_id}"
+                else:
+                    user_id = vehicle_id = user_name = None
+                    plate = _license_plate(session_rng)
+
+                tariff, day_tariff = lot_tariffs[lot_index]
+                if stop >= now_minute:
+                    # Staat nog geparkeerd
+                    yield (session_id, first_lot + lot_index, user_id, vehicle_id, plate, user_name,
+                           clock.format(start), None, None, None, "unpaid", None)
+                else:
+                    days_parked = stop // 1440 - start // 1440
+                    cost = _session_cost(dwell, tariff, day_tariff, days_parked > 0, days_parked)
+                    paid = user_id is not None and payment_rng.random() < payment_chance
+                    stopped_at = clock.format(stop)
+                    yield (session_id, first_lot + lot_index, user_id, vehicle_id, plate, user_name,
+                           clock.format(start), stopped_at, dwell, cost, "paid" if paid else "unpaid",
+                           clock.format(stop + session_rng.randint(1, 10)))
+                    if paid:
+                        payment_rows.append((user_id, session_id, cost, payment_rng.choice(PAYMENT_METHODS),
+                                             stopped_at, stopped_at))
+                session_id += 1
+
+    session_iter = session_rows()
+    started = time.perf_counter()
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(session_iter, GENERATE_BATCH_SIZE))
+        if not batch:
+            break
+        cursor.executemany("""
+            INSERT INTO p_sessions (id, parking_lot_id, user_id, vehicle_id, license_plate, user_name, started_at,
+                                    stopped_at, duration_minutes, cost, payment_status, verified_exit_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+        cursor.executemany("""
+            INSERT INTO payments (user_id, p_session_id, amount, currency, method, status, created_at, paid_at)
+            VALUES (?, ?, ?, 'EUR', ?, 'paid', ?, ?)
+        """, payment_rows)
+        payment_rows.clear()
+        inserted += len(batch)
+        if inserted % (GENERATE_BATCH_SIZE * 20) == 0:
+            print(f"    sessions: {inserted:,}/{sessions:,} ({inserted / (time.perf_counter() - started):,.0f} rows/s)")
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"  - sessions (+ payments): {inserted:,} rows in {elapsed:.1f}s ({inserted / elapsed:,.0f} rows/s)")
+
+    # Reservations: verleden ones afgerond/geannuleerd, toekomstige bevestigd
+    reservation_rng = random.Random(f"{seed}-reservations")
+
+    def reservation_rows():
+        for _ in range(reservations):
+            lot_index = reservation_rng.choices(range(lots), cum_weights=lot_weights)[0]
+            start = reservation_rng.randrange((days + 7) * 1440) // 15 * 15
+            duration = int(min(DWELL_MAX_MINUTES, max(30, reservation_rng.lognormvariate(dwell_mu, DWELL_SIGMA))))
+            if reservation_rng.random() < 0.05:
+                status = "cancelled"
+            else:
+                status = "completed" if start + duration < now_minute else "confirmed"
+            user_index = reservation_rng.choices(range(users), cum_weights=user_weights)[0] if users else None
+            tariff, day_tariff = lot_tariffs[lot_index]
+            days_reserved = (start + duration) // 1440 - start // 1440
+            yield (first_user + user_index if users else None, first_lot + lot_index,
+                   user_vehicle[user_index] if users else None, clock.format(start), clock.format(start + duration),
+                   status, clock.format(max(0, start - reservation_rng.randrange(7 * 1440))),
+                   _session_cost(duration, tariff, day_tariff, days_reserved > 0, days_reserved))
+
+    _insert_batches(cursor, """
+        INSERT INTO reservations (user_id, parking_lot_id, vehicle_id, start_time, end_time, status, created_at, cost)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, reservation_rows(), "reservations", reservations)
+
+    # Discounts: mix van procent en vast bedrag, deels per lot, verlopen/actief/gepland
+    discount_rng = random.Random(f"{seed}-discounts")
+
+    def discount_rows():
+        for index in range(discounts):
+            start = discount_rng.randrange((days + 30) * 1440)
+            percent = round(discount_rng.choice([5, 10, 15, 20, 25, 50]), 2) if discount_rng.random() < 0.6 else None
+            yield (f"GEN{seed}-{index:07d}", f"Generated discount {index}", percent,
+                   None if percent else float(discount_rng.choice([2, 5, 10])),
+                   discount_rng.choice(["reservation", "session", "both"]),
+                   clock.format(start), clock.format(start + discount_rng.randint(1, 60) * 1440),
+                   first_lot + discount_rng.randrange(lots) if discount_rng.random() < 0.3 else None)
+
+    _insert_batches(cursor, """
+        INSERT INTO discounts (code, description, percent, amount, applies_to, starts_at, ends_at, parking_lot_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, discount_rows(), "discounts", discounts)
+
+    # Indexes pas na het laden, in een keer opbouwen (zelfde indexes als de API bij startup aanmaakt)
+    from utils import database_utils
+    started = time.perf_counter()
+    for statement in database_utils.INDEXES:
+        cursor.execute(statement)
+    conn.commit()
+    cursor.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(f"  - indexes + ANALYZE: {time.perf_counter() - started:.1f}s")
+    print(f"\n✓ Generated dataset: {db_path} (users log in as user<id> / {GENERATED_PASSWORD})")
+
+
 def create_test_database():
     """Create test database with schema and test data"""
     data_dir = os.path.join(api_dir, 'data')
@@ -250,6 +574,11 @@ def create_test_database():
     if os.path.exists(test_db):
         print("Removing existing test database...")
         os.remove(test_db)
+
+    # Remove the archive database of a previous run (see utils/archive_utils.py)
+    test_archive_db = os.path.join(data_dir, 'parking_test_archive.sqlite3')
+    if os.path.exists(test_archive_db):
+        os.remove(test_archive_db)
     
     # Create test database
     conn = sqlite3.connect(test_db)
@@ -276,4 +605,25 @@ def create_test_database():
 
 
 if __name__ == "__main__":
-    create_test_database()
+    parser = argparse.ArgumentParser(description="Create the test database, or a large synthetic dataset with --generate")
+    parser.add_argument("--generate", action="store_true", help="Generate a synthetic dataset instead of the test database")
+    parser.add_argument("--db", default=os.path.join(api_dir, 'data', 'parking_perf.sqlite3'),
+                        help="Target database for --generate")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--lots", type=int, default=100)
+    parser.add_argument("--sessions", type=int, default=1000000)
+    parser.add_argument("--reservations", type=int, default=100000)
+    parser.add_argument("--payments", type=int, default=500000, help="Approximate number of paid sessions")
+    parser.add_argument("--discounts", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365, help="Length of the session history")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None,
+                        help="End of the history (YYYY-MM-DD[ HH:MM]), default now; fix it for identical reruns")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_dataset(args.db, users=args.users, lots=args.lots, sessions=args.sessions,
+                         reservations=args.reservations, payments=args.payments, discounts=args.discounts,
+                         days=args.days, seed=args.seed, end=args.end)
+    else:
+        create_test_database()
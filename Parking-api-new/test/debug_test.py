@@ -0,0 +1,219 @@
+import os
+import pytest
+import requests
+
+BASE_URL = os.environ.get("API_BASE_URL", "http://localhost:8000")
+
+
+def get_admin_token():
+    """Login with the admin user created by create_test_db.py"""
+    res = requests.post(f"{BASE_URL}/login", json={"username": "admin", "password": "admin"})
+    if res.status_code == 200:
+        return res.json().get("session_token")
+    raise AssertionError("Could not login as admin. Run 'python test/create_test_db.py' first.")
+
+
+@pytest.fixture
+def profiles_dir(tmp_path, monkeypatch):
+    """De test server draait in hetzelfde proces: profielen naar een tijdelijke map"""
+    import constants
+    monkeypatch.setattr(constants, "PROFILES_DIR", str(tmp_path))
+    return tmp_path
+
+
+# ---------------------------
+# Profiling (X-Profile header)
+# ---------------------------
+
+def test_admin_request_is_profiled(profiles_dir):
+    headers = {"Authorization": get_admin_token()}
+    res = requests.get(f"{BASE_URL}/billing/admin", headers={**headers, "X-Profile": "cprofile"})
+    assert res.status_code == 200
+    name = res.headers["X-Profile-Id"]
+    assert (profiles_dir / f"{name}.prof").exists()
+
+    listing = requests.get(f"{BASE_URL}/debug/profiles", headers=headers).json()
+    entry = next(profile for profile in listing if profile["name"] == name)
+    assert entry["route"] == "/billing/{username}"
+    assert entry["profiler"] == "cprofile" and entry["status"] == 200
+
+    text = requests.get(f"{BASE_URL}/debug/profiles/{name}", params={"format": "text"}, headers=headers)
+    assert text.status_code == 200
+    assert "get_user_sessions_by_username" in text.text
+
+    raw = requests.get(f"{BASE_URL}/debug/profiles/{name}", headers=headers)
+    assert raw.status_code == 200 and len(raw.content) > 0
+
+
+def test_profile_name_ignores_unsafe_request_ids(profiles_dir):
+    """Een X-Request-ID met / of . komt niet in de bestandsnaam, het profiel blijft op te halen"""
+    headers = {"Authorization": get_admin_token()}
+    for request_id in ("../../etc/x", "a.b", "ok-id_1"):
+        res = requests.get(f"{BASE_URL}/parking-lots", headers={**headers, "X-Profile": "cprofile",
+                                                                "X-Request-ID": request_id})
+        assert res.status_code == 200
+        name = res.headers["X-Profile-Id"]
+        assert name.endswith("_ok-id_1") == (request_id == "ok-id_1")
+        assert requests.get(f"{BASE_URL}/debug/profiles/{name}", headers=headers).status_code == 200
+
+
+def test_sampling_profile_is_saved_as_folded_stacks(profiles_dir):
+    headers = {"Authorization": get_admin_token()}
+    res = requests.get(f"{BASE_URL}/parking-lots", headers={**headers, "X-Profile": "sample"})
+    assert res.status_code == 200
+    assert (profiles_dir / f"{res.headers['X-Profile-Id']}.folded").exists()
+
+
+def test_only_newest_profiles_are_kept(profiles_dir, monkeypatch):
+    import constants
+    monkeypatch.setattr(constants, "PROFILES_KEEP", 2)
+    headers = {"Authorization": get_admin_token(), "X-Profile": "cprofile"}
+    names = [requests.get(f"{BASE_URL}/parking-lots", headers=headers).headers["X-Profile-Id"] for _ in range(3)]
+    assert sorted(path.name for path in profiles_dir.iterdir()) == sorted(
+        f"{name}{extension}" for name in names[1:] for extension in (".prof", ".json"))
+
+
+def test_profile_header_is_ignored_for_non_admins(profiles_dir, register_and_login):
+    token = register_and_login("notprofiled", "pass123", "Not Profiled", "notprofiled@test.local", "+3344556688", 1990)
+    res = requests.get(f"{BASE_URL}/billing", headers={"Authorization": token, "X-Profile": "cprofile"})
+    assert res.status_code == 200
+    assert "X-Profile-Id" not in res.headers
+    assert not list(profiles_dir.iterdir())
+
+    assert requests.get(f"{BASE_URL}/debug/profiles", headers={"Authorization": token}).status_code == 403
+
+
+def test_get_profile_rejects_invalid_names():
+    headers = {"Authorization": get_admin_token()}
+    assert requests.get(f"{BASE_URL}/debug/profiles/..%2Fsecrets", headers=headers).status_code in (400, 404)
+    assert requests.get(f"{BASE_URL}/debug/profiles/does-not-exist", headers=headers).status_code == 404
+
+
+# ---------------------------
+# Geheugen (tracemalloc)
+# ---------------------------
+
+def test_memory_snapshots_and_diff():
+    headers = {"Authorization": get_admin_token()}
+    try:
+        assert requests.post(f"{BASE_URL}/debug/memory/snapshots", headers=headers).status_code == 400
+
+        started = requests.post(f"{BASE_URL}/debug/memory/start", headers=headers)
+        assert started.status_code == 200 and started.json()["tracing"] is True
+
+        first = requests.post(f"{BASE_URL}/debug/memory/snapshots", headers=headers)
+        assert first.status_code == 201
+        for _ in range(5):
+            requests.get(f"{BASE_URL}/parking-lots")
+        second = requests.post(f"{BASE_URL}/debug/memory/snapshots", params={"limit": 5}, headers=headers).json()
+        assert len(second["top"]) <= 5
+        assert all("location" in site and site["size_bytes"] > 0 for site in second["top"])
+
+        res = requests.get(f"{BASE_URL}/debug/memory/diff",
+                           params={"old": first.json()["id"], "new": second["id"], "group_by": "filename"}, headers=headers)
+        assert res.status_code == 200
+        assert all("size_diff_bytes" in site for site in res.json()["diff"])
+
+        by_traceback = requests.get(f"{BASE_URL}/debug/memory/snapshots/{second['id']}",
+                                    params={"group_by": "traceback", "limit": 3}, headers=headers)
+        assert by_traceback.status_code == 200
+        assert isinstance(by_traceback.json()["top"][0]["location"], list)
+
+        assert requests.get(f"{BASE_URL}/debug/memory/snapshots/999999", headers=headers).status_code == 404
+        assert requests.get(f"{BASE_URL}/debug/memory/snapshots/{second['id']}", params={"group_by": "x"},
+                            headers=headers).status_code == 400
+    finally:
+        stopped = requests.post(f"{BASE_URL}/debug/memory/stop", headers=headers).json()
+    assert stopped["tracing"] is False and stopped["snapshots"] == []
+
+
+def test_memory_status_reports_known_structures(register_and_login):
+    token = register_and_login("memuser", "pass123", "Mem User", "memuser@test.local", "+3344556699", 1990)
+    assert requests.get(f"{BASE_URL}/debug/memory", headers={"Authorization": token}).status_code == 403
+
+    res = requests.get(f"{BASE_URL}/debug/memory", headers={"Authorization": get_admin_token()})
+    assert res.status_code == 200
+    structures = res.json()["structures"]
+    assert structures["utils.session_manager.sessions"]["items"] >= 2
+    assert structures["utils.session_manager.sessions"]["size_bytes"] > 0
+    assert structures["metrics_utils.query_labels cache"]["max_items"] == 1024
+    assert structures["logging"]["loggers"] >= 1
+    assert structures["metrics_utils.REGISTRY series"]["thread_cells"] >= 1
+    assert structures["singleflight_utils in-flight calls"]["items"] == 0
+    assert "looplag_utils blocked functions" in structures
+    assert structures["profiling_utils stack samples"]["samplers"] == 0
+
+
+# ---------------------------
+# Tracing
+# ---------------------------
+
+def test_start_session_trace_has_handler_utils_and_sql_spans():
+    headers = {"Authorization": get_admin_token()}
+    lot = requests.post(f"{BASE_URL}/parking-lots", json={"name": "Trace Lot", "address": "Trace Street",
+                                                          "capacity": 5, "tariff": 1.0}, headers=headers)
+    lot_id = lot.json()["lot_id"]
+
+    res = requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "TR-01-CE"},
+                        headers={**headers, "traceparent": "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"})
+    assert res.status_code in (200, 201), res.text
+    assert res.headers["X-Trace-Id"] == "ab" * 16
+
+    traces = requests.get(f"{BASE_URL}/debug/traces", params={"route": "/parking-lots/{lot_id}/sessions/start"},
+                          headers=headers).json()
+    trace = next(trace for trace in traces if trace["trace_id"] == "ab" * 16)
+    assert trace["name"] == "POST /parking-lots/{lot_id}/sessions/start"
+    names = [span["name"] for span in trace["tree"]]
+    assert names[0] == trace["name"] and trace["tree"][0]["depth"] == 0
+    assert "handler parking_lots.start_session" in names
+    assert "parking_lots_utils.get_parking_lot_by_id" in names
+    assert "parking_lots_utils.count_active_sessions" in names
+    assert "SELECT parking_lots" in names
+    utils_depth = next(span["depth"] for span in trace["tree"] if span["name"] == "parking_lots_utils.count_active_sessions")
+    sql_depth = next(span["depth"] for span in trace["tree"][names.index("parking_lots_utils.count_active_sessions"):]
+                     if span["name"].startswith("SELECT"))
+    assert sql_depth == utils_depth + 1
+
+    otlp = requests.get(f"{BASE_URL}/debug/traces/{'ab' * 16}", headers=headers).json()
+    spans = otlp["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert spans[0]["kind"] == 2 and spans[0]["parentSpanId"] == "cd" * 8
+    assert all(span["traceId"] == "ab" * 16 for span in spans)
+    assert any(attribute["key"] == "db.statement" for span in spans for attribute in span["attributes"])
+
+    assert requests.get(f"{BASE_URL}/debug/traces/{'0' * 32}", headers=headers).status_code == 404
+
+
+# ---------------------------
+# Achtergrond jobs
+# ---------------------------
+
+def test_jobs_expire_reservations_and_reconcile_counts(register_and_login):
+    token = register_and_login("jobuser", "pass123", "Job User", "jobuser@test.local", "+3344556677", 1990)
+    headers = {"Authorization": get_admin_token()}
+    lot = requests.post(f"{BASE_URL}/parking-lots", json={"name": "Job Lot", "address": "Job Street",
+                                                          "capacity": 5, "tariff": 1.0}, headers=headers)
+    lot_id = lot.json()["lot_id"]
+    created = requests.post(f"{BASE_URL}/reservations", json={
+        "parking_lot_id": lot_id, "vehicle_id": 1, "start_time": "2025-01-10 10:00:00",
+        "end_time": "2025-01-10 12:00:00", "status": "pending"}, headers={"Authorization": token})
+    reservation_id = created.json()["reservation"]["id"]
+    assert requests.get(f"{BASE_URL}/parking-lots/{lot_id}").json()["reserved"] == 1
+
+    assert requests.post(f"{BASE_URL}/debug/jobs/reservation_lifecycle/run",
+                         headers={"Authorization": token}).status_code == 403
+    run = requests.post(f"{BASE_URL}/debug/jobs/reservation_lifecycle/run", headers=headers)
+    assert run.status_code == 200 and run.json()["status"] == "success" and run.json()["result"] >= 1
+    reservation = requests.get(f"{BASE_URL}/reservations/{reservation_id}", headers={"Authorization": token}).json()
+    assert reservation["status"] == "expired"
+
+    run = requests.post(f"{BASE_URL}/debug/jobs/reconcile_reserved_counts/run", headers=headers)
+    assert run.json()["status"] == "success"
+    assert requests.get(f"{BASE_URL}/parking-lots/{lot_id}").json()["reserved"] == 0
+
+    jobs = {job["name"]: job for job in requests.get(f"{BASE_URL}/debug/jobs", headers=headers).json()}
+    assert {"resume_expired_sessions", "reservation_lifecycle", "reconcile_reserved_counts",
+            "rollup_daily_stats", "archive_sessions"} <= set(jobs)
+    assert jobs["archive_sessions"]["schedule"] == "daily at 03:00"
+    assert jobs["reservation_lifecycle"]["last_run"]["status"] == "success"
+    assert jobs["reservation_lifecycle"]["lease"]["last_status"] == "success"
+    assert requests.post(f"{BASE_URL}/debug/jobs/does_not_exist/run", headers=headers).status_code == 404
@@ -0,0 +1,389 @@
+"""
+Asyncio load generator that replays realistic parking traffic against the API.
+
+Vehicles arrive as a Poisson process with periodic bursts (shift changes,
+events). Each vehicle runs start -> (dwell) -> stop -> verify-exit on one
+lot, and some skip the stop and let the barrier auto-stop them. In parallel,
+registered users log in, look at their billing and create reservations. At
+the end it prints throughput plus p50/p95/p99 latency and error rate per route.
+
+    python test/loadgen.py --url http://127.0.0.1:8000 --duration 60 --rate 50
+    python test/loadgen.py --start-server --duration 30        # uvicorn in-process, like conftest.py
+    python test/loadgen.py --start-server --db /tmp/perf.sqlite3 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+test_dir = os.path.dirname(os.path.abspath(__file__))
+api_dir = os.path.abspath(os.path.join(test_dir, '..', 'api'))
+
+
+# ---------------------------
+# HTTP client (keep-alive, zonder externe dependencies)
+# ---------------------------
+
+class HttpConnection:
+    """
+    One keep-alive HTTP/1.1 connection; reconnects after an error or Connection: close.
+
+    Uvicorn closes keep-alive connections that were idle for 5s. A reused
+    connection that fails before any response byte arrived was closed that way
+    (the request never reached the app), so it is retried once on a fresh one.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.responded = False
+
+    async def request(self, method, path, body=None, headers=None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(payload)}"]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload
+
+        reused = self.writer is not None
+        try:
+            return await self._send(data)
+        except (OSError, EOFError):
+            if not reused or self.responded:
+                raise
+        return await self._send(data)
+
+    async def _send(self, data):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.responded = False
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+            return await self._read_response()
+        except Exception:
+            self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed by server")
+        self.responded = True
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readline()
+            body = bytes(body)
+        else:
+            body = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class LoadClient:
+    """Pool of keep-alive connections plus latency/status bookkeeping per route"""
+
+    def __init__(self, base_url, max_connections):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.pool = asyncio.Queue()
+        for _ in range(max_connections):
+            self.pool.put_nowait(HttpConnection(self.host, self.port))
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    async def call(self, route, method, path, body=None, token=None):
+        """Do one request; `route` is the route template the stats are grouped by"""
+        connection = await self.pool.get()
+        started = time.perf_counter()
+        try:
+            status, raw = await connection.request(method, path, body, {"Authorization": token} if token else None)
+        except Exception:
+            self.errors[route] += 1
+            return None, None
+        finally:
+            self.pool.put_nowait(connection)
+        self.latencies[route].append((time.perf_counter() - started) * 1000)
+        self.statuses[route][status] += 1
+        try:
+            return status, json.loads(raw) if raw else None
+        except ValueError:
+            return status, None
+
+    def close(self):
+        while not self.pool.empty():
+            self.pool.get_nowait().close()
+
+
+# ---------------------------
+# Verkeer
+# ---------------------------
+
+class Traffic:
+    """Drives the scenarios for one run"""
+
+    def __init__(self, client, args, rng):
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.lot_ids = []
+        self.accounts = []  # (username, password, vehicle_id)
+        self.tasks = set()
+        self.run_id = uuid.uuid4().hex[:6].upper()
+        self.plate_counter = 0
+
+    def _spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def setup(self):
+        """Register the load test accounts (each with a vehicle) and find the lots to park on"""
+        for index in range(self.args.accounts):
+            username = f"load_{self.run_id.lower()}_{index}"
+            password = "loadtest"
+            await self.client.call("POST /register", "POST", "/register", {
+                "username": username, "password": password, "name": f"Load User {index}",
+                "email": f"{username}@load.test", "phone": f"+3169{self.run_id}{index:04d}", "birth_year": 1990,
+            })
+            status, data = await self.client.call("POST /login", "POST", "/login",
+                                                  {"username": username, "password": password})
+            if status != 200:
+                raise RuntimeError(f"Could not log in load test account {username} ({status})")
+            token = data["session_token"]
+            _, vehicle = await self.client.call("POST /vehicles", "POST", "/vehicles",
+                                                {"license_plate": f"LD-{self.run_id}-{index}"}, token)
+            vehicle_id = (vehicle or {}).get("vehicle", {}).get("id")
+            self.accounts.append((username, password, vehicle_id))
+
+        if self.args.lots:
+            self.lot_ids = [int(lot_id) for lot_id in self.args.lots.split(",")]
+        else:
+            _, lots = await self.client.call("GET /parking-lots", "GET", f"/parking-lots?limit={self.args.max_lots}")
+            self.lot_ids = [lot["id"] for lot in (lots or {}).get("parking_lots", [])]
+        if not self.lot_ids:
+            raise RuntimeError("No parking lots found to generate traffic on")
+
+    async def vehicle(self, token):
+        """Barrier sequence for one vehicle: start, park, stop, drive to the barrier"""
+        self.plate_counter += 1
+        plate = f"LG-{self.run_id}-{self.plate_counter}"
+        lot_id = self.rng.choice(self.lot_ids)
+        status, _ = await self.client.call("POST /parking-lots/{id}/sessions/start", "POST",
+                                           f"/parking-lots/{lot_id}/sessions/start", {"licenseplate": plate}, token)
+        if status != 200:
+            return
+        await asyncio.sleep(self.rng.expovariate(1 / self.args.dwell))
+        # Een deel stopt de sessie niet zelf: de slagboom stopt en verifieert dan tegelijk
+        if self.rng.random() >= self.args.auto_stop_share:
+            await self.client.call("POST /parking-lots/{id}/sessions/stop", "POST",
+                                   f"/parking-lots/{lot_id}/sessions/stop", {"licenseplate": plate}, token)
+            await asyncio.sleep(self.rng.uniform(0, self.args.dwell / 4))
+        await self.client.call("POST /parking-lots/{id}/sessions/verify-exit", "POST",
+                               f"/parking-lots/{lot_id}/sessions/verify-exit", {"licenseplate": plate})
+
+    async def user_visit(self):
+        """A registered user logs in, checks billing and sometimes makes a reservation"""
+        username, password, vehicle_id = self.rng.choice(self.accounts)
+        status, data = await self.client.call("POST /login", "POST", "/login",
+                                              {"username": username, "password": password})
+        if status != 200:
+            return
+        token = data["session_token"]
+        await self.client.call("GET /billing", "GET", "/billing", token=token)
+        if vehicle_id and self.rng.random() < self.args.reservation_share:
+            start = datetime.now() + timedelta(hours=self.rng.randint(1, 72))
+            await self.client.call("POST /reservations", "POST", "/reservations", {
+                "parking_lot_id": self.rng.choice(self.lot_ids), "vehicle_id": vehicle_id,
+                "start_time": start.strftime("%Y-%m-%d %H:%M:%S"),
+                "end_time": (start + timedelta(hours=self.rng.randint(1, 8))).strftime("%Y-%m-%d %H:%M:%S"),
+            }, token)
+
+    async def arrivals(self, rate, spawn, deadline):
+        """Poisson arrivals at `rate`/s, plus a burst of burst_size every burst_every seconds"""
+        next_burst = time.monotonic() + self.args.burst_every
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            spawn()
+            if self.args.burst_size and time.monotonic() >= next_burst:
+                next_burst += self.args.burst_every
+                for _ in range(self.args.burst_size):
+                    spawn()
+
+    async def run(self):
+        deadline = time.monotonic() + self.args.duration
+        logged_in = {}
+
+        def spawn_vehicle():
+            # Een deel van de voertuigen parkeert met een account (token), de rest anoniem
+            token = None
+            if self.accounts and self.rng.random() < self.args.registered_share:
+                token = logged_in.get(self.rng.randrange(len(self.accounts)))
+            self._spawn(self.vehicle(token))
+
+        for index, (username, password, _) in enumerate(self.accounts):
+            _, data = await self.client.call("POST /login", "POST", "/login", {"username": username, "password": password})
+            if data and "session_token" in data:
+                logged_in[index] = data["session_token"]
+
+        started = time.perf_counter()
+        producers = [self.arrivals(self.args.rate, spawn_vehicle, deadline)]
+        if self.accounts and self.args.user_rate > 0:
+            producers.append(self.arrivals(self.args.user_rate, lambda: self._spawn(self.user_visit()), deadline))
+        await asyncio.gather(*producers)
+        # Laat lopende voertuigen hun sequence afmaken (begrensd)
+        if self.tasks:
+            _, pending = await asyncio.wait(set(self.tasks), timeout=self.args.drain_timeout)
+            for task in pending:
+                task.cancel()
+        return time.perf_counter() - started
+
+
+# ---------------------------
+# Rapport
+# ---------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentiel
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def build_report(client, elapsed):
+    routes = {}
+    total = 0
+    for route in sorted(set(client.latencies) | set(client.errors)):
+        latencies = sorted(client.latencies.get(route, []))
+        statuses = dict(client.statuses.get(route, {}))
+        failed = sum(count for status, count in statuses.items() if status >= 500) + client.errors.get(route, 0)
+        rejected = sum(count for status, count in statuses.items() if 400 <= status < 500)
+        count = len(latencies) + client.errors.get(route, 0)
+        total += count
+        routes[route] = {
+            "requests": count,
+            "throughput_rps": round(count / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+            "error_rate": round(failed / count, 4) if count else 0.0,
+            "client_error_rate": round(rejected / count, 4) if count else 0.0,
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+            "connection_errors": client.errors.get(route, 0),
+        }
+    return {"duration_s": round(elapsed, 2), "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0, "routes": routes}
+
+
+def print_report(report):
+    print(f"\n{report['requests']} requests in {report['duration_s']}s ({report['throughput_rps']} req/s)\n")
+    print(f"{'route':<46} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err%':>6} {'4xx%':>6}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<46} {stats['requests']:>7} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>6.1f}ms "
+              f"{stats['p95_ms']:>6.1f}ms {stats['p99_ms']:>6.1f}ms {stats['error_rate']:>6.1%} "
+              f"{stats['client_error_rate']:>6.1%}")
+
+
+def start_server(db_path=None):
+    """Start the API with uvicorn in a background thread, exactly like test/conftest.py does"""
+    if db_path:
+        os.environ["DATABASE_PATH"] = os.path.abspath(db_path)
+    sys.path.insert(0, test_dir)
+    import conftest
+    server, thread = conftest._start_test_api_server(api_dir)
+    return conftest.BASE_URL, server, thread
+
+
+async def main_async(args):
+    client = LoadClient(args.url, args.connections)
+    traffic = Traffic(client, args, random.Random(args.seed))
+    try:
+        await traffic.setup()
+        # Setup verkeer (registraties) niet meetellen
+        client.latencies.clear()
+        client.statuses.clear()
+        client.errors.clear()
+        elapsed = await traffic.run()
+    finally:
+        client.close()
+    return build_report(client, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay realistic parking traffic and report latency per route")
+    parser.add_argument("--url", default=os.environ.get("API_BASE_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--start-server", action="store_true", help="Start the API in-process (like test/conftest.py)")
+    parser.add_argument("--db", help="Database for --start-server (default: the test database)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of new arrivals")
+    parser.add_argument("--rate", type=float, default=20, help="Vehicle arrivals per second")
+    parser.add_argument("--burst-every", type=float, default=10, help="Seconds between arrival bursts")
+    parser.add_argument("--burst-size", type=int, default=25, help="Extra arrivals per burst (0 = no bursts)")
+    parser.add_argument("--dwell", type=float, default=5, help="Mean seconds a vehicle stays parked (scaled time)")
+    parser.add_argument("--auto-stop-share", type=float, default=0.1, help="Share of vehicles that never call stop")
+    parser.add_argument("--registered-share", type=float, default=0.5, help="Share of vehicles parking with an account")
+    parser.add_argument("--user-rate", type=float, default=2, help="User visits (login + billing) per second")
+    parser.add_argument("--reservation-share", type=float, default=0.3, help="Share of user visits that reserve")
+    parser.add_argument("--accounts", type=int, default=10, help="Accounts registered for this run")
+    parser.add_argument("--lots", help="Comma separated lot ids (default: first --max-lots from GET /parking-lots)")
+    parser.add_argument("--max-lots", type=int, default=20)
+    parser.add_argument("--connections", type=int, default=50, help="Max concurrent keep-alive connections")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="Max seconds to let running vehicles finish")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    server = thread = None
+    if args.start_server:
+        args.url, server, thread = start_server(args.db)
+    try:
+        report = asyncio.run(main_async(args))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(timeout=5)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
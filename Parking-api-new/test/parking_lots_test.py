@@ -3,6 +3,7 @@ import pytest
 import requests
 import uuid
 import sqlite3
+import json
 from datetime import datetime, timedelta
 import time
 
@@ -196,6 +197,38 @@ def test_get_all_parking_lots_contains_required_fields():
         assert "name" in lot
         assert "capacity" in lot
 
+def test_get_all_parking_lots_paginated():
+    # 3. Ophalen parkeerplaatsen per pagina met cursor
+    admin_token = get_admin_token()
+    for i in range(3):
+        requests.post(f"{BASE_URL}/parking-lots",
+            json={"name": f"Page Lot {i}", "address": "Page Street", "capacity": 10, "tariff": 1.0},
+            headers={"Authorization": admin_token})
+
+    first = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 2})
+    assert first.status_code == 200
+    first_data = first.json()
+    assert len(first_data["parking_lots"]) == 2
+    assert first_data["next_cursor"]
+    assert first.headers.get("X-Next-Cursor") == first_data["next_cursor"]
+
+    second = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 2, "cursor": first_data["next_cursor"]})
+    assert second.status_code == 200
+    first_ids = {lot["id"] for lot in first_data["parking_lots"]}
+    second_ids = {lot["id"] for lot in second.json()["parking_lots"]}
+    assert second_ids and not first_ids & second_ids
+    assert min(second_ids) > max(first_ids)
+
+    # Zonder limit en cursor: alle lots, zoals voor de paginering
+    everything = requests.get(f"{BASE_URL}/parking-lots").json()
+    assert everything["next_cursor"] is None
+    assert first_ids | second_ids <= {lot["id"] for lot in everything["parking_lots"]}
+
+def test_get_all_parking_lots_invalid_cursor():
+    # 4. Ongeldige cursor geeft 400
+    res = requests.get(f"{BASE_URL}/parking-lots", params={"cursor": "not-a-cursor"})
+    assert res.status_code == 400
+
 # GET /parking-lots/{lot_id} tests
 def test_get_single_parking_lot_success():
     # 1. Ophalen enkele parkeerplaats
@@ -218,6 +251,22 @@ def test_get_single_parking_lot_success():
         assert res.status_code == 200
         assert res.json()["name"] == "Test Lot Single"
 
+def test_get_parking_lot_null_columns_read_as_zero():
+    # NULL capaciteit, reserved en tarieven (oude of geimporteerde lots) komen als 0 terug, niet als null
+    conn = sqlite3.connect(get_test_db_path())
+    lot_id = conn.execute("INSERT INTO parking_lots (name, address) VALUES ('Null Lot', 'Null Street')").lastrowid
+    conn.commit()
+    conn.close()
+
+    expected = {"capacity": 0, "reserved": 0, "tariff": 0.0, "day_tariff": 0.0}
+    lot = requests.get(f"{BASE_URL}/parking-lots/{lot_id}").json()
+    assert {key: lot[key] for key in expected} == expected and lot["location"] is None
+    lots = requests.get(f"{BASE_URL}/parking-lots").json()["parking_lots"]
+    listed = next(item for item in lots if item["id"] == lot_id)
+    assert {key: listed[key] for key in expected} == expected
+    partial = requests.get(f"{BASE_URL}/parking-lots/{lot_id}", params={"fields": "name,tariff"}).json()
+    assert partial == {"id": lot_id, "name": "Null Lot", "tariff": 0.0}
+
 def test_get_parking_lot_not_found():
     # 2. Ophalen parkeerplaats die niet bestaat
     res = requests.get(f"{BASE_URL}/parking-lots/99999")
@@ -508,6 +557,171 @@ def test_get_all_sessions_success(register_and_login):
         assert res.status_code == 200
         assert b"sessions" in res.content
 
+def test_get_all_sessions_order():
+    # Zonder cursor en limit alles oudste eerst (zoals voor de paginering), pagina's nieuwste eerst
+    admin_token = get_admin_token()
+    lot_id = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Order Lot", "address": "Order Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token}).json()["lot_id"]
+    for plate in ("ORD-01", "ORD-02", "ORD-03"):
+        requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": plate})
+
+    full = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", headers={"Authorization": admin_token}).json()
+    assert [session["license_plate"] for session in full["sessions"]] == ["ORD-01", "ORD-02", "ORD-03"]
+    page = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", params={"limit": 3},
+                        headers={"Authorization": admin_token}).json()
+    assert [session["license_plate"] for session in page["sessions"]] == ["ORD-03", "ORD-02", "ORD-01"]
+
+def test_get_all_sessions_filtered_by_plate_and_status():
+    # 4. Admin filtert sessies op kenteken en status
+    admin_token = get_admin_token()
+    create_res = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Filter Lot", "address": "Filter Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token})
+    lot_id = create_res.json()["lot_id"]
+
+    plate = f"FLT-{uuid.uuid4().hex[:4].upper()}"
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": plate})
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "OTHER-01"})
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        params={"plate": plate, "status": "active"},
+        headers={"Authorization": admin_token})
+    assert res.status_code == 200
+    sessions = res.json()["sessions"]
+    assert len(sessions) == 1
+    assert sessions[0]["license_plate"] == plate
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        params={"status": "completed"},
+        headers={"Authorization": admin_token})
+    assert res.status_code == 200
+    assert res.json()["sessions"] == []
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        params={"status": "unknown"},
+        headers={"Authorization": admin_token})
+    assert res.status_code == 400
+
+def test_get_all_sessions_user_sees_only_own(register_and_login):
+    # 5. Gewone gebruiker ziet alleen eigen sessies, ook via /me/sessions
+    admin_token = get_admin_token()
+    unique_id = uuid.uuid4().hex[:6]
+    user_token = register_and_login(
+        f"user_{unique_id}", "user_pw", "Regular User",
+        f"user_{unique_id}@test.com", f"+3161{unique_id}", 1990
+    )
+    create_res = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Own Sessions Lot", "address": "Own Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token})
+    lot_id = create_res.json()["lot_id"]
+
+    own_plate = f"OWN-{unique_id.upper()}"
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start",
+        json={"licenseplate": own_plate}, headers={"Authorization": user_token})
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "ANON-01"})
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", headers={"Authorization": user_token})
+    assert res.status_code == 200
+    plates = [s["license_plate"] for s in res.json()["sessions"]]
+    assert plates == [own_plate]
+
+    res = requests.get(f"{BASE_URL}/me/sessions", headers={"Authorization": user_token})
+    assert res.status_code == 200
+    sessions = res.json()["sessions"]
+    assert [s["license_plate"] for s in sessions] == [own_plate]
+    assert sessions[0]["user_name"] == f"user_{unique_id}"
+
+def test_get_my_sessions_missing_token():
+    # 6. /me/sessions zonder token
+    res = requests.get(f"{BASE_URL}/me/sessions")
+    assert res.status_code == 401
+
+def test_get_all_sessions_streamed_export():
+    # 7. Admin exporteert alle sessies als NDJSON en als JSON array
+    admin_token = get_admin_token()
+    create_res = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Export Lot", "address": "Export Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token})
+    lot_id = create_res.json()["lot_id"]
+    for i in range(3):
+        requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": f"EXP-00{i}"})
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        headers={"Authorization": admin_token, "Accept": "application/x-ndjson"})
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert sorted(r["license_plate"] for r in rows) == ["EXP-000", "EXP-001", "EXP-002"]
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        params={"stream": "json", "plate": "EXP-001"},
+        headers={"Authorization": admin_token})
+    assert res.status_code == 200
+    assert [r["license_plate"] for r in res.json()] == ["EXP-001"]
+
+def test_concurrent_streamed_exports():
+    """Gelijktijdige exports lopen allemaal volledig door (sqlite connectie blijft op een thread)"""
+    from concurrent.futures import ThreadPoolExecutor
+    admin_token = get_admin_token()
+    lot_id = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Concurrent Export Lot", "address": "Export Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token}).json()["lot_id"]
+    conn = sqlite3.connect(get_test_db_path())
+    conn.executemany("INSERT INTO p_sessions (parking_lot_id, license_plate, started_at, stopped_at) VALUES (?, ?, ?, ?)",
+                     [(lot_id, f"CEX-{i:05d}", "2025-01-01 10:00:00", "2025-01-01 11:00:00") for i in range(3000)])
+    conn.commit()
+    conn.close()
+
+    def export(fmt):
+        res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", params={"stream": fmt},
+                           headers={"Authorization": admin_token})
+        assert res.status_code == 200
+        return len(res.text.splitlines()) if fmt == "ndjson" else len(res.json())
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        counts = list(pool.map(export, ["ndjson", "json"] * 4))
+    assert counts == [3000] * 8
+
+def test_get_all_sessions_includes_archived():
+    # 8. Gearchiveerde sessies blijven zichtbaar in het overzicht
+    import constants
+    from utils import archive_utils
+    admin_token = get_admin_token()
+    create_res = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Archive Lot", "address": "Archive Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token})
+    lot_id = create_res.json()["lot_id"]
+
+    conn = sqlite3.connect(get_test_db_path())
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO p_sessions (parking_lot_id, license_plate, started_at, stopped_at, verified_exit_at)
+        VALUES (?, 'ARCH-01', '2000-01-01 08:00:00', '2000-01-01 10:00:00', '2000-01-01 10:05:00')
+    """, (lot_id,))
+    session_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "HOT-01"})
+
+    # Jonger dan ARCHIVE_AFTER_DAYS archiveren zou sessies uit recente ranges laten verdwijnen
+    with pytest.raises(ValueError):
+        archive_utils.archive_sessions(older_than_days=constants.ARCHIVE_AFTER_DAYS - 1)
+    assert get_session_from_db(session_id) is not None
+
+    # Alleen sessies van voor ~2002 verplaatsen, de rest van de test data blijft staan
+    assert archive_utils.archive_sessions(older_than_days=9000) >= 1
+    assert get_session_from_db(session_id) is None
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", headers={"Authorization": admin_token})
+    assert res.status_code == 200
+    assert sorted(s["license_plate"] for s in res.json()["sessions"]) == ["ARCH-01", "HOT-01"]
+
+    res = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions",
+        params={"start_date": datetime.now().strftime("%Y-%m-%d")},
+        headers={"Authorization": admin_token})
+    assert [s["license_plate"] for s in res.json()["sessions"]] == ["HOT-01"]
+
 def test_get_all_sessions_missing_token():
     # 2. Ophalen sessies zonder token
     res = requests.get(f"{BASE_URL}/parking-lots/1/sessions")
@@ -1124,4 +1338,188 @@ def test_fraud_no_session_barrier_exit():
     barrier_res = requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/verify-exit",
         json={"licenseplate": license_plate})
     assert barrier_res.status_code == 404
-    assert "No active or pending session" in barrier_res.json()["detail"]
\ No newline at end of file
+    assert "No active or pending session" in barrier_res.json()["detail"]
+
+def test_get_all_parking_lots_etag():
+    """Ongewijzigde lijst: 304 op If-None-Match; een nieuw lot geeft een nieuwe ETag"""
+    first = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 5})
+    etag = first.headers["ETag"]
+    cached = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["ETag"] == etag
+    # Andere pagina, andere representatie
+    assert requests.get(f"{BASE_URL}/parking-lots", params={"limit": 6},
+                        headers={"If-None-Match": etag}).status_code == 200
+
+    requests.post(f"{BASE_URL}/parking-lots", json={"name": "ETag Lot", "address": "ETag Street", "capacity": 3,
+                                                    "tariff": 1.0}, headers={"Authorization": get_admin_token()})
+    changed = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+
+def test_etag_never_tags_a_query_from_before_a_write(monkeypatch):
+    """Een read na een wijziging deelt geen query die nog van voor die wijziging loopt"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from utils import pagination_utils
+    paginate = pagination_utils.paginate
+    started, release = threading.Event(), threading.Event()
+
+    def slow_paginate(*args, **kwargs):
+        # Eerste aanroep: oude data lezen en dan blijven hangen tot na de wijziging
+        result = paginate(*args, **kwargs)
+        if not started.is_set():
+            started.set()
+            release.wait(10)
+        return result
+    monkeypatch.setattr(pagination_utils, "paginate", slow_paginate)
+
+    params = {"fields": "name,address"}
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        before = pool.submit(requests.get, f"{BASE_URL}/parking-lots", params=params)
+        assert started.wait(10)
+        requests.post(f"{BASE_URL}/parking-lots", json={"name": "Flight Lot", "address": "Flight Street",
+                                                        "capacity": 3, "tariff": 1.0},
+                      headers={"Authorization": get_admin_token()})
+        after = pool.submit(requests.get, f"{BASE_URL}/parking-lots", params=params)
+        try:
+            res = after.result(timeout=5)
+        finally:
+            release.set()
+        assert before.result().status_code == 200
+    assert res.status_code == 200
+    assert "Flight Lot" in [lot["name"] for lot in res.json()["parking_lots"]]
+    assert res.headers["ETag"] != before.result().headers["ETag"]
+
+def test_concurrent_lot_reads_are_coalesced():
+    """Gelijktijdige identieke reads krijgen allemaal hetzelfde antwoord; een deel deelt de query"""
+    from concurrent.futures import ThreadPoolExecutor
+    admin_token = get_admin_token()
+    lot_id = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Herd Lot", "address": "Herd Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token}).json()["lot_id"]
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        lots = list(pool.map(lambda _: requests.get(f"{BASE_URL}/parking-lots/{lot_id}"), range(40)))
+        missing = list(pool.map(lambda _: requests.get(f"{BASE_URL}/parking-lots/999999999"), range(5)))
+    assert all(res.status_code == 200 and res.json()["name"] == "Herd Lot" for res in lots)
+    assert all(res.status_code == 404 for res in missing)
+
+    text = requests.get(f"{BASE_URL}/metrics").text
+    assert 'singleflight_calls_total{function="parking_lots_utils.get_parking_lot_by_id",outcome="leader"}' in text
+    assert 'singleflight_in_flight{function="parking_lots_utils.get_parking_lot_by_id"} 0' in text
+
+def test_responses_are_compressed_except_barrier_calls():
+    """Grote antwoorden in br of gzip volgens Accept-Encoding; slagboom antwoorden nooit"""
+    import brotli
+    admin_token = get_admin_token()
+    for i in range(10):
+        requests.post(f"{BASE_URL}/parking-lots", json={"name": f"Compression Lot {i}", "address": "Gzip Street",
+                                                        "capacity": 5, "tariff": 1.0}, headers={"Authorization": admin_token})
+    for encoding in ("br", "gzip"):
+        res = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 100}, headers={"Accept-Encoding": encoding})
+        assert res.status_code == 200 and res.headers["Content-Encoding"] == encoding
+        assert "Accept-Encoding" in res.headers["Vary"] and res.headers["ETag"].startswith('W/"')
+        assert "parking_lots" in res.json()  # requests pakt het zelf uit
+    raw = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 100}, headers={"Accept-Encoding": "br"}, stream=True)
+    assert json.loads(brotli.decompress(raw.raw.read())) == res.json()
+    assert "Content-Encoding" not in requests.get(f"{BASE_URL}/parking-lots", params={"limit": 100},
+                                                  headers={"Accept-Encoding": "identity"}).headers
+
+    # Zonder drempel wordt ook een klein antwoord gecomprimeerd, maar de slagboom nog steeds niet
+    import constants
+    lot_id = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Compression Lot", "address": "Gzip Street", "capacity": 5, "tariff": 1.0},
+        headers={"Authorization": admin_token}).json()["lot_id"]
+    min_size = constants.COMPRESSION_MIN_SIZE
+    constants.COMPRESSION_MIN_SIZE = 0
+    try:
+        lot = requests.get(f"{BASE_URL}/parking-lots/{lot_id}", headers={"Accept-Encoding": "gzip"})
+        start = requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "ZIP-001"},
+                              headers={"Accept-Encoding": "br, gzip"})
+    finally:
+        constants.COMPRESSION_MIN_SIZE = min_size
+    assert lot.headers["Content-Encoding"] == "gzip"
+    assert start.status_code == 200 and "Content-Encoding" not in start.headers
+
+    text = requests.get(f"{BASE_URL}/metrics").text
+    assert 'http_compressed_responses_total{encoding="br"}' in text
+    assert 'http_compression_ratio_count{route="/parking-lots"}' in text
+
+def test_msgpack_requests_and_responses():
+    """Accept: application/msgpack geeft hetzelfde antwoord als MessagePack; een MessagePack body gebruikt hetzelfde model"""
+    import msgpack
+    headers = {"Authorization": get_admin_token(), "Content-Type": "application/msgpack",
+               "Accept": "application/msgpack"}
+    created = requests.post(f"{BASE_URL}/parking-lots", headers=headers, data=msgpack.packb(
+        {"name": "Msgpack Lot", "address": "Binary Street", "capacity": 7, "tariff": 2.5}))
+    assert created.status_code in (200, 201) and created.headers["Content-Type"] == "application/msgpack"
+    lot_id = msgpack.unpackb(created.content)["lot_id"]
+
+    lot = requests.get(f"{BASE_URL}/parking-lots/{lot_id}", headers={"Accept": "application/msgpack"})
+    assert "Accept" in lot.headers["Vary"]
+    assert msgpack.unpackb(lot.content) == requests.get(f"{BASE_URL}/parking-lots/{lot_id}").json()
+
+    # Zelfde pydantic validatie als bij JSON, en kapotte MessagePack is een 400
+    invalid = requests.post(f"{BASE_URL}/parking-lots", headers=headers, data=msgpack.packb({"name": "No address"}))
+    assert invalid.status_code == 422 and msgpack.unpackb(invalid.content)["detail"]
+    assert requests.post(f"{BASE_URL}/parking-lots", headers=headers, data=b"\xc1").status_code == 400
+
+    body = requests.get(f"{BASE_URL}/openapi.json").json()["paths"]["/parking-lots"]["post"]["requestBody"]["content"]
+    assert body["application/msgpack"] == body["application/json"]
+
+def test_sparse_fieldsets_on_lots_and_sessions():
+    """fields= geeft alleen de gevraagde kolommen (plus id); onbekende velden zijn een 400"""
+    admin_token = get_admin_token()
+    lot_id = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Fields Lot", "address": "Sparse Street", "capacity": 12, "tariff": 1.5},
+        headers={"Authorization": admin_token}).json()["lot_id"]
+
+    full = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 5})
+    sparse = requests.get(f"{BASE_URL}/parking-lots", params={"limit": 5, "fields": "name,capacity"})
+    assert sparse.status_code == 200
+    assert all(set(lot) == {"id", "name", "capacity"} for lot in sparse.json()["parking_lots"])
+    assert sparse.headers["ETag"] != full.headers["ETag"]
+    lot = requests.get(f"{BASE_URL}/parking-lots/{lot_id}", params={"fields": "capacity"}).json()
+    assert lot == {"id": lot_id, "capacity": 12}
+    assert requests.get(f"{BASE_URL}/parking-lots", params={"fields": "name,secret"}).status_code == 400
+
+    requests.post(f"{BASE_URL}/parking-lots/{lot_id}/sessions/start", json={"licenseplate": "FLD-001"})
+    sessions = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions", params={"fields": "license_plate"},
+                            headers={"Authorization": admin_token}).json()["sessions"]
+    assert sessions == [{"id": sessions[0]["id"], "license_plate": "FLD-001"}]
+    # Detail: parking_lot_id wordt voor de check gelezen, maar niet teruggegeven
+    session = requests.get(f"{BASE_URL}/parking-lots/{lot_id}/sessions/{sessions[0]['id']}",
+                           params={"fields": "started_at"}, headers={"Authorization": admin_token}).json()
+    assert set(session) == {"id", "started_at"}
+
+def test_metrics_endpoint_reports_routes_and_queries():
+    """/metrics geeft per route (template, niet het pad) latency, status codes en query timings"""
+    admin_token = get_admin_token()
+    create_res = requests.post(f"{BASE_URL}/parking-lots",
+        json={"name": "Metrics Lot", "address": "Metrics Street", "capacity": 10, "tariff": 1.0},
+        headers={"Authorization": admin_token})
+    lot_id = create_res.json()["lot_id"]
+    assert requests.get(f"{BASE_URL}/parking-lots/{lot_id}").status_code == 200
+    assert requests.get(f"{BASE_URL}/parking-lots/999999999").status_code == 404
+
+    res = requests.get(f"{BASE_URL}/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    text = res.text
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/parking-lots/{lot_id}"}' in text
+    assert 'http_responses_total{method="GET",route="/parking-lots/{lot_id}",status="404"}' in text
+    assert f"/parking-lots/{lot_id}\"" not in text
+    assert 'db_query_duration_seconds_count{operation="SELECT",table="parking_lots"}' in text
+    assert "http_requests_in_flight 1" in text
+    assert "event_loop_lag_seconds_count" in text
+    assert 'admission_admitted_total{class="default"}' in text
+    assert 'admission_in_flight{class="default"} 0' in text  # /metrics zelf gaat buiten admission om
+
+
+def test_request_id_header():
+    """Elk response heeft een X-Request-ID; een id van de client wordt overgenomen"""
+    res = requests.get(f"{BASE_URL}/parking-lots", headers={"X-Request-ID": "client-id-42"})
+    assert res.headers["X-Request-ID"] == "client-id-42"
+    generated = requests.get(f"{BASE_URL}/parking-lots").headers["X-Request-ID"]
+    assert len(generated) == 32 and generated != requests.get(f"{BASE_URL}/parking-lots").headers["X-Request-ID"]
@@ -151,6 +151,30 @@ def test_get_own_payments(auth_token):
     assert isinstance(data, list)
 
 
+def test_get_own_payments_sparse_fields(auth_token):
+    requests.post(f"{BASE_URL}/payments", headers={"Authorization": auth_token},
+                  json={"amount": 5.0, "currency": "EUR", "method": "CARD"})
+    res = requests.get(f"{BASE_URL}/payments", params={"fields": "amount,status"},
+                       headers={"Authorization": auth_token})
+    assert res.status_code == 200 and res.json()
+    assert all(set(payment) == {"id", "amount", "status"} for payment in res.json())
+    assert requests.get(f"{BASE_URL}/payments", params={"fields": "password"},
+                        headers={"Authorization": auth_token}).status_code == 400
+
+
+def test_get_own_payments_order(register_and_login):
+    """Zonder cursor en limit alles oudste eerst (zoals voor de paginering), pagina's nieuwste eerst"""
+    token = register_and_login(f"order_{uuid.uuid4().hex[:6]}", "secret", "Order User",
+                               f"order_{uuid.uuid4().hex[:6]}@example.com", f"+3162{uuid.uuid4().hex[:6]}", 1990)
+    for amount in (1.0, 2.0, 3.0):
+        requests.post(f"{BASE_URL}/payments", headers={"Authorization": token},
+                      json={"amount": amount, "currency": "EUR", "method": "CARD"})
+    full = [payment["id"] for payment in requests.get(f"{BASE_URL}/payments", headers={"Authorization": token}).json()]
+    assert len(full) == 3 and full == sorted(full)
+    page = requests.get(f"{BASE_URL}/payments", params={"limit": 3}, headers={"Authorization": token}).json()
+    assert [payment["id"] for payment in page] == sorted(full, reverse=True)
+
+
 # ---------- GET /payments/{username} ----------
 
 def test_get_payments_by_username(auth_token):
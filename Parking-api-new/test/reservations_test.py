@@ -193,6 +193,29 @@ def test_delete_reservation_decrements_reserved(register_and_login):
     assert get_reserved_count_via_api(lot_id) == 0
 
 
+def test_delete_closed_reservation_keeps_reserved(register_and_login):
+    """Een verlopen reservering telt niet meer mee in reserved; verwijderen mag de andere niet wegstrepen"""
+    from utils import reservations_utils
+    _, token, _, lot_id = setup_user_and_lot(register_and_login)
+    ids = []
+    for day in (17, 18):
+        created = requests.post(f"{BASE_URL}/reservations", json={
+            "parking_lot_id": lot_id, "vehicle_id": 1,
+            "start_time": f"2025-12-{day} 18:00:00", "end_time": f"2025-12-{day} 20:00:00",
+        }, headers=auth_headers(token), timeout=10)
+        ids.append(created.json()["reservation"]["id"])
+    assert get_reserved_count_via_api(lot_id) == 2
+
+    # Zoals de reservation_lifecycle job: status naar expired, reconcile zet reserved op de open reserveringen
+    requests.put(f"{BASE_URL}/reservations/{ids[0]}", json={"status": "expired"}, headers=auth_headers(token), timeout=10)
+    reservations_utils.reconcile_reserved_counts()
+    assert get_reserved_count_via_api(lot_id) == 1
+
+    deleted = requests.delete(f"{BASE_URL}/reservations/{ids[0]}", headers=auth_headers(token), timeout=10)
+    assert deleted.status_code in (200, 204)
+    assert get_reserved_count_via_api(lot_id) == 1
+
+
 def test_unauthorized_access_requires_token():
     # No token
     resp = requests.post(
@@ -438,3 +461,34 @@ def test_capacity_independent_of_current_sessions(register_and_login):
     resp2 = requests.post(f"{BASE_URL}/reservations", json=payload2, headers=auth_headers(user2_token), timeout=10)
     assert resp2.status_code in (200, 201), f"Second future reservation should succeed: {resp2.text}"
 
+
+def test_get_reservation_etag(register_and_login):
+    _, token, _, lot_id = setup_user_and_lot(register_and_login)
+    created = requests.post(f"{BASE_URL}/reservations", json={
+        "parking_lot_id": lot_id, "vehicle_id": 1,
+        "start_time": "2025-12-20 10:00:00", "end_time": "2025-12-20 12:00:00",
+    }, headers=auth_headers(token), timeout=10)
+    res_id = created.json()["reservation"]["id"]
+
+    first = requests.get(f"{BASE_URL}/reservations/{res_id}", headers=auth_headers(token), timeout=10)
+    etag = first.headers["ETag"]
+    cached = requests.get(f"{BASE_URL}/reservations/{res_id}", headers={**auth_headers(token), "If-None-Match": etag},
+                          timeout=10)
+    assert cached.status_code == 304
+
+    # De ETag geldt alleen voor deze user: een ander krijgt gewoon de permissie check
+    _, other_token, _, _ = setup_user_and_lot(register_and_login)
+    other = requests.get(f"{BASE_URL}/reservations/{res_id}",
+                         headers={**auth_headers(other_token), "If-None-Match": etag}, timeout=10)
+    assert other.status_code == 403
+    # If-None-Match: * geeft geen 304 voor andermans of een niet bestaande reservering
+    for rid, headers, status in ((res_id, auth_headers(other_token), 403), (999999999, auth_headers(token), 404),
+                                 (res_id, auth_headers(token), 304)):
+        starred = requests.get(f"{BASE_URL}/reservations/{rid}", headers={**headers, "If-None-Match": "*"}, timeout=10)
+        assert starred.status_code == status
+
+    requests.put(f"{BASE_URL}/reservations/{res_id}", json={"status": "confirmed"}, headers=auth_headers(token), timeout=10)
+    changed = requests.get(f"{BASE_URL}/reservations/{res_id}", headers={**auth_headers(token), "If-None-Match": etag},
+                           timeout=10)
+    assert changed.status_code == 200 and changed.json()["status"] == "confirmed"
+    assert changed.headers["ETag"] != etag
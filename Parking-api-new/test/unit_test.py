@@ -12,12 +12,14 @@ import hashlib
 from cryptography.fernet import InvalidToken
 import cryptography
 
-# Voeg parent directory aan path toe voor imports
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Voeg de api directory aan path toe voor imports (zelfde modulenamen als de app: utils.*)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
 
-from api.utils import session_calculator
-from api.utils import auth_utils
-from api.utils import database_utils
+from utils import session_calculator
+from utils import auth_utils
+from utils import database_utils
+from utils import row_types
+import sqlite3
 
 
 # ---------------------------
@@ -237,3 +239,1192 @@ class TestVerifyPasswordInvalid:
         invalid_hash = "not_a_valid_hash"
         with pytest.raises(InvalidToken):
             auth_utils.verify_password("password", invalid_hash, "bcrypt")
+
+
+# ===========================
+# row_types – slotted query rows
+# ===========================
+
+class TestRowTypes:
+
+    def _cursor(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE parking_lots (id INTEGER PRIMARY KEY, name TEXT, capacity INTEGER)")
+        conn.execute("INSERT INTO parking_lots VALUES (1, 'Central', 100), (2, 'Station', 50)")
+        return conn.execute("SELECT * FROM parking_lots ORDER BY id")
+
+    def test_rows_support_dict_style_access(self):
+        """Rows gedragen zich als read-only dicts"""
+        row = row_types.fetch_one(self._cursor())
+        assert row["name"] == "Central"
+        assert row.get("capacity") == 100
+        assert row.get("missing", "default") == "default"
+        assert row.to_dict() == {"id": 1, "name": "Central", "capacity": 100}
+        assert dict(row) == row.to_dict()
+
+    def test_rows_have_no_instance_dict(self):
+        """Rows gebruiken __slots__ en delen een type per kolom-set"""
+        rows = row_types.fetch_all(self._cursor())
+        assert len(rows) == 2
+        assert not hasattr(rows[0], "__dict__")
+        assert type(rows[0]) is type(rows[1])
+        with pytest.raises(KeyError):
+            rows[0]["missing"]
+
+
+# ===========================
+# tools/import_legacy – import van de oude JSON data
+# ===========================
+
+class TestImportLegacy:
+
+    @pytest.fixture
+    def import_legacy(self, monkeypatch):
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools'))
+        monkeypatch.syspath_prepend(tools_dir)
+        import import_legacy
+        # Kleine chunks zodat items over chunk grenzen heen gelezen worden
+        monkeypatch.setattr(import_legacy, "READ_CHUNK_SIZE", 7)
+        return import_legacy
+
+    @pytest.fixture
+    def legacy_data(self, tmp_path):
+        import json
+        data_dir = tmp_path / "data"
+        (data_dir / "pdata").mkdir(parents=True)
+        (data_dir / "users.json").write_text(json.dumps([
+            {"id": "1", "username": "cindy", "password": hashlib.md5(b"secret").hexdigest(), "name": "Cindy",
+             "email": "cindy@test.nl", "phone": "+31612345678", "role": "USER", "created_at": "2017-10-06",
+             "birth_year": 1937, "active": True},
+        ]))
+        (data_dir / "parking-lots.json").write_text(json.dumps({
+            "1": {"name": "Centrum", "location": "Rotterdam", "address": "Coolsingel 1", "capacity": 100,
+                  "reserved": 0, "tariff": 2.5, "daytariff": 20, "created_at": "2020-01-01",
+                  "coordinates": {"lat": 51.92, "lng": 4.47}},
+        }))
+        (data_dir / "pdata" / "p1-sessions.json").write_text(json.dumps({
+            "1": {"licenseplate": "AB-12-CD", "started": "01-02-2020 10:00:00", "stopped": "01-02-2020 12:30:00", "user": "cindy"},
+            "2": {"licenseplate": "EF-34-GH", "started": "02-02-2020 09:00:00", "stopped": None, "user": "cindy"},
+            "3": {"licenseplate": "IJ-56-KL", "started": "03-02-2020 08:00:00", "stopped": "03-02-2020 08:10:00", "user": "cindy"},
+        }))
+        (data_dir / "payments.json").write_text(json.dumps([
+            {"transaction": "abc", "amount": 12.5, "initiator": "cindy", "created_at": "2020-02-01 12:31:00",
+             "completed": "2020-02-01 12:32:00", "hash": "x", "t_data": {"method": "ideal"}},
+        ]))
+
+        from create_test_db import get_schemas
+        db_path = str(tmp_path / "parking.sqlite3")
+        conn = sqlite3.connect(db_path)
+        for schema in get_schemas():
+            conn.execute(schema)
+        conn.commit()
+        conn.close()
+        return str(data_dir), db_path
+
+    def test_iter_json_items_streams_arrays_and_objects(self, import_legacy, tmp_path):
+        """Items worden een voor een gelezen, ook als ze over chunk grenzen vallen"""
+        path = tmp_path / "items.json"
+        path.write_text('{"1": {"n": 12345}, "2": [1, 2, 3], "3": 678}')
+        assert list(import_legacy.iter_json_items(str(path))) == [("1", {"n": 12345}), ("2", [1, 2, 3]), ("3", 678)]
+        path.write_text('[{"a": "x,y"}, 10]')
+        assert list(import_legacy.iter_json_items(str(path))) == [(None, {"a": "x,y"}), (None, 10)]
+
+    def test_legacy_timestamp(self, import_legacy):
+        """Oude dd-mm-yyyy timestamps worden yyyy-mm-dd"""
+        assert import_legacy.legacy_timestamp("01-02-2020 10:00:00") == "2020-02-01 10:00:00"
+        assert import_legacy.legacy_timestamp("2020-02-01T10:00:00Z") == "2020-02-01 10:00:00"
+        assert import_legacy.legacy_date("06-10-2017") == "2017-10-06"
+        assert import_legacy.legacy_timestamp(None) is None
+
+    def test_import_maps_fields_and_resumes(self, import_legacy, legacy_data):
+        """Velden worden gemapt en een onderbroken import gaat verder vanaf de checkpoint"""
+        data_dir, db_path = legacy_data
+        conn = sqlite3.connect(db_path)
+        # Simuleer een eerdere run die na de eerste sessie is gestopt
+        conn.execute("CREATE TABLE legacy_import_progress (source TEXT PRIMARY KEY, items_done INTEGER NOT NULL, finished INTEGER NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO legacy_import_progress VALUES ('sessions:p1', 1, 0)")
+        conn.commit()
+
+        for _ in range(2):
+            importer = import_legacy.LegacyImporter(data_dir, db_path, batch_size=1, hash_workers=1)
+            importer.run()
+            importer.close()
+
+        user = conn.execute("SELECT password_hash, hash_v, created_at FROM users WHERE username = 'cindy'").fetchone()
+        assert user[1] == "md5" and user[2] == "2017-10-06"
+        assert auth_utils.verify_password("secret", user[0], "md5")
+
+        lot = conn.execute("SELECT day_tariff, lat, lng FROM parking_lots WHERE id = 1").fetchone()
+        assert lot == (20.0, 51.92, 4.47)
+
+        sessions = conn.execute("""
+            SELECT license_plate, user_id, started_at, stopped_at, duration_minutes, verified_exit_at
+            FROM p_sessions ORDER BY started_at
+        """).fetchall()
+        assert sessions == [
+            ("EF-34-GH", 1, "2020-02-02 09:00:00", None, None, None),
+            ("IJ-56-KL", 1, "2020-02-03 08:00:00", "2020-02-03 08:10:00", 10, "2020-02-03 08:10:00"),
+        ]
+
+        payment = conn.execute("SELECT user_id, amount, method, status, paid_at, external_ref FROM payments").fetchall()
+        assert payment == [(1, 12.5, "ideal", "paid", "2020-02-01 12:32:00", "abc")]
+        conn.close()
+
+
+# ===========================
+# create_test_db --generate – synthetische datasets
+# ===========================
+
+class TestGenerateDataset:
+
+    def _generate(self, path, seed=7):
+        from create_test_db import generate_dataset
+        generate_dataset(str(path), users=50, lots=5, sessions=500, reservations=40, payments=100,
+                         discounts=10, days=10, seed=seed, end=datetime(2025, 1, 31, 12, 0))
+        conn = sqlite3.connect(str(path))
+        try:
+            # Alleen de gegenereerde rijen, na de vaste rijen van insert_test_data
+            fixed = {"parking_lots": 2, "p_sessions": 1, "reservations": 1, "payments": 1, "discounts": 2}
+            return {table: conn.execute(f"SELECT * FROM {table} WHERE id > ? ORDER BY id", (offset,)).fetchall()
+                    for table, offset in fixed.items()}
+        finally:
+            conn.close()
+
+    def test_same_seed_gives_same_dataset(self, tmp_path):
+        """Zelfde seed en grootte geven exact dezelfde rijen"""
+        first = self._generate(tmp_path / "a.sqlite3")
+        second = self._generate(tmp_path / "b.sqlite3")
+        assert first == second
+        assert first["p_sessions"] != self._generate(tmp_path / "c.sqlite3", seed=8)["p_sessions"]
+
+    def test_generated_sizes_and_consistency(self, tmp_path):
+        """Aantallen kloppen en betaalde sessies hebben een payment"""
+        data = self._generate(tmp_path / "a.sqlite3")
+        assert len(data["parking_lots"]) == 5
+        assert len(data["p_sessions"]) == 500
+        assert len(data["reservations"]) == 40
+        assert len(data["discounts"]) == 10
+        started = [row[6] for row in data["p_sessions"]]
+        assert started == sorted(started)
+        paid_sessions = {row[0] for row in data["p_sessions"] if row[10] == "paid"}
+        assert paid_sessions == {row[3] for row in data["payments"]}
+
+
+# ===========================
+# benchmark – vergelijking met een baseline
+# ===========================
+
+class TestBenchmarkCompare:
+
+    def test_regressions_are_flagged(self):
+        """Alleen een mediaan boven de drempel telt als regressie"""
+        from benchmark import compare
+        baseline = {"sizes": {"small": {"calculate_price": {"median_us": 10.0}, "count_active_sessions": {"median_us": 100.0}}}}
+        current = {"sizes": {"small": {"calculate_price": {"median_us": 10.5}, "count_active_sessions": {"median_us": 150.0},
+                                       "verify_password": {"median_us": 1000.0}}}}
+        lines, regressions = compare(current, baseline, threshold=0.10)
+        assert regressions == 1
+        assert any("count_active_sessions" in line and "REGRESSION" in line for line in lines)
+        assert any("verify_password" in line and "new" in line for line in lines)
+
+
+# ===========================
+# loadgen – latency rapport
+# ===========================
+
+class TestLoadgenReport:
+
+    def test_percentiles_and_error_rates_per_route(self):
+        """p50/p95/p99 per route, 5xx en verbindingsfouten tellen als fout, 4xx apart"""
+        from loadgen import build_report, percentile
+        assert percentile(list(range(1, 101)), 0.50) == 50
+        assert percentile(list(range(1, 101)), 0.99) == 99
+        assert percentile([], 0.95) == 0.0
+
+        class Client:
+            latencies = {"POST /login": [float(ms) for ms in range(1, 101)]}
+            statuses = {"POST /login": {200: 90, 401: 5, 500: 5}}
+            errors = {"POST /login": 0, "GET /billing": 2}
+
+        report = build_report(Client(), elapsed=10.0)
+        login = report["routes"]["POST /login"]
+        assert (login["p50_ms"], login["p95_ms"], login["p99_ms"]) == (50.0, 95.0, 99.0)
+        assert login["error_rate"] == 0.05 and login["client_error_rate"] == 0.05
+        assert report["routes"]["GET /billing"]["error_rate"] == 1.0
+        assert report["requests"] == 102
+
+    def test_stale_keep_alive_connection_is_retried_once(self):
+        """De server sluit een idle connectie (zoals uvicorn na 5s): de volgende request gaat over een verse"""
+        import asyncio
+        from loadgen import HttpConnection
+
+        async def run():
+            connections = []
+
+            async def serve_one(reader, writer):
+                # Eén antwoord per connectie, daarna dicht
+                connections.append(writer)
+                await reader.readuntil(b"\r\n\r\n")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+                writer.close()
+
+            server = await asyncio.start_server(serve_one, "127.0.0.1", 0)
+            connection = HttpConnection("127.0.0.1", server.sockets[0].getsockname()[1])
+            try:
+                first = await connection.request("GET", "/")
+                await asyncio.sleep(0.05)
+                second = await connection.request("GET", "/")
+            finally:
+                connection.close()
+                server.close()
+                await server.wait_closed()
+            return first, second, len(connections)
+
+        first, second, connections = asyncio.run(run())
+        assert first == second == (200, b"ok") and connections == 2
+
+
+# ===========================
+# simulate_lots – capaciteitsregels
+# ===========================
+
+class TestSimulateLots:
+
+    @pytest.fixture
+    def simulate_lots(self, monkeypatch):
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools'))
+        monkeypatch.syspath_prepend(tools_dir)
+        import simulate_lots
+        return simulate_lots
+
+    def test_capacity_rules(self):
+        """Reserveringen tellen als bezet"""
+        from utils import parking_lots_utils
+        assert parking_lots_utils.available_spots(10, 8, 2) == 0
+        assert parking_lots_utils.available_spots(10, 7, 2) == 1
+
+    def test_reserved_arrival_counts_its_own_reservation(self, simulate_lots):
+        """Zoals start_session: de reservering die nu begint telt bij de admit check nog mee"""
+        import argparse
+        import random
+        # Een plek en precies een reservering, zonder gewone aankomsten
+        args = argparse.Namespace(days=1, turnover=1.0, dwell_median=60, dwell_sigma=0.5, reservation_share=1.0,
+                                  late_exit_share=0.0)
+        lot = simulate_lots.Lot(1, "Een plek", 1, 2.0, 15.0)
+        simulation = simulate_lots.Simulation([lot], args, random.Random(1))
+        simulation.arrival_times = lambda lot: []
+        simulation.run()
+        assert lot.arrivals == 1 and lot.admitted == 0 and lot.reserved_rejected == 1
+
+    def test_price_cache_matches_price_for_period(self, simulate_lots):
+        import argparse
+        import random
+        args = argparse.Namespace(days=3, dwell_median=60, dwell_sigma=0.5, late_exit_share=0.0)
+        simulation = simulate_lots.Simulation([], args, random.Random(1))
+        lot = simulate_lots.Lot(1, "Prijs", 10, 2.5, 20.0)
+        prices = {}
+        for started, stopped in ((10.0, 12.5), (500.0, 700.0), (1300.0, 1500.0), (100.0, 3000.0), (700.5, 759.9)):
+            assert simulation.price(lot, started, stopped, prices) == session_calculator.price_for_period(
+                lot.pricing, simulation.clock(started), simulation.clock(stopped))[0]
+
+    def test_price_for_period_matches_calculate_price(self):
+        lot = {"tariff": 2.5, "day_tariff": 20}
+        session = {"started": "2025-01-06 08:15:00", "stopped": "2025-01-06 11:40:00"}
+        assert session_calculator.calculate_price(lot, 1, session) == session_calculator.price_for_period(
+            lot, datetime(2025, 1, 6, 8, 15), datetime(2025, 1, 6, 11, 40))
+
+    def test_small_lot_rejects_and_is_deterministic(self, simulate_lots):
+        """Een te kleine lot weigert auto's; dezelfde seed geeft hetzelfde resultaat ongeacht workers"""
+        import argparse
+        args = argparse.Namespace(days=2, turnover=30.0, dwell_median=240, dwell_sigma=0.5, reservation_share=0.05,
+                                  late_exit_share=0.1, seed=7, workers=1)
+        reports = []
+        for _ in range(2):
+            lots = [simulate_lots.Lot(1, "Klein", 5, 2.0, 15.0), simulate_lots.Lot(2, "Groot", 500, 2.0, 15.0)]
+            lots = simulate_lots.simulate(lots, args)
+            reports.append(simulate_lots.build_report(lots, args.days, elapsed=0.0))
+        small, large = reports[0]["per_lot"]
+        assert small["rejected_full"] + small["rejected_reserved"] > 0
+        assert small["peak_occupancy"] <= 5 and large["peak_occupancy"] <= 500
+        assert small["revenue"] > 0
+        assert reports[0]["totals"] == reports[1]["totals"]
+
+
+# ===========================
+# metrics_utils – Prometheus metrics
+# ===========================
+
+class TestMetrics:
+
+    def test_histogram_buckets_are_cumulative(self):
+        from utils import metrics_utils
+        histogram = metrics_utils.Histogram("test_latency_seconds", "Test", ("route",), buckets=(0.1, 1.0))
+        metrics_utils.REGISTRY.remove(histogram)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, ("/a",))
+        lines = histogram.render()
+        assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 2' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="1.0"} 3' in lines
+        assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+        assert 'test_latency_seconds_count{route="/a"} 4' in lines
+        assert 'test_latency_seconds_sum{route="/a"} 3.65' in lines
+
+    def test_counters_from_many_threads_are_exact(self):
+        """Elke thread schrijft in een eigen cel: geen verloren increments zonder lock"""
+        import threading
+        from utils import metrics_utils
+        counter = metrics_utils.Counter("test_total", "Test")
+        metrics_utils.REGISTRY.remove(counter)
+
+        def work():
+            for _ in range(20000):
+                counter.inc()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert metrics_utils.metric_value(counter) == 160000
+
+    def test_cells_of_ended_threads_are_folded(self):
+        """Kortlevende threads (to_thread, streams) laten geen cellen achter"""
+        import threading
+        from utils import metrics_utils
+        counter = metrics_utils.Counter("test_folded_total", "Test")
+        metrics_utils.REGISTRY.remove(counter)
+        for _ in range(50):
+            thread = threading.Thread(target=lambda: counter.inc(amount=2))
+            thread.start()
+            thread.join()
+        counter.inc()
+        assert metrics_utils.metric_value(counter) == 101
+        assert counter.series().cell_count() == 1
+        assert metrics_utils.metric_value(counter) == 101
+
+    def test_query_labels(self):
+        from utils import metrics_utils
+        assert metrics_utils.query_labels("SELECT * FROM p_sessions WHERE id = ?") == ("SELECT", "p_sessions")
+        assert metrics_utils.query_labels("UPDATE users SET name = ? WHERE id = ?") == ("UPDATE", "users")
+        assert metrics_utils.query_labels("SELECT * FROM (SELECT * FROM main.p_sessions UNION ALL "
+                                          "SELECT * FROM archive.p_sessions)") == ("SELECT", "p_sessions")
+
+
+# ===========================
+# slowquery_utils – slow-query log
+# ===========================
+
+class TestSlowQueryLog:
+
+    @pytest.fixture
+    def slow_log(self, tmp_path, monkeypatch):
+        import logging
+        import constants
+        from utils import slowquery_utils
+        log_path = tmp_path / "slow_queries.log"
+        monkeypatch.setattr(constants, "SLOW_QUERY_THRESHOLD_MS", 0)
+        monkeypatch.setattr(constants, "SLOW_QUERY_LOG_PATH", str(log_path))
+        monkeypatch.setattr(slowquery_utils, "_logger", None)
+        monkeypatch.setattr(slowquery_utils, "_explained", set())
+        logger = logging.getLogger("SlowQueries")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        yield log_path
+        for handler in list(logger.handlers):
+            handler.close()
+            logger.removeHandler(handler)
+
+    def test_slow_statements_are_logged_with_plan_once(self, slow_log, tmp_path):
+        from utils import database_utils, metrics_utils
+        conn = database_utils.connect(str(tmp_path / "slow.sqlite3"))
+        conn.execute("CREATE TABLE p_sessions (id INTEGER PRIMARY KEY, license_plate TEXT)")
+        token = metrics_utils.CURRENT_REQUEST.set({"method": "GET", "path": "/parking-lots/1/sessions"})
+        try:
+            for plate in ("AB-12-CD", "XY-99-ZZ"):
+                conn.execute("SELECT * FROM p_sessions WHERE license_plate = ? AND id > 5", (plate,)).fetchall()
+        finally:
+            metrics_utils.CURRENT_REQUEST.reset(token)
+        conn.close()
+
+        lines = [line for line in slow_log.read_text().splitlines() if "license_plate = ?" in line]
+        assert len(lines) == 2
+        assert "GET /parking-lots/1/sessions" in lines[0]
+        assert "unit_test.test_slow_statements_are_logged_with_plan_once" in lines[0]
+        assert "params (str)" in lines[0] and "AB-12-CD" not in slow_log.read_text()
+        assert "id > ?" in lines[0]
+        assert "plan: SCAN p_sessions" in lines[0] or "plan: SEARCH p_sessions" in lines[0]
+        assert "plan:" not in lines[1]
+
+    def test_normalize_sql(self):
+        from utils.slowquery_utils import normalize_sql
+        assert normalize_sql("SELECT *\n  FROM t WHERE id IN (?, ?,?) AND name = 'x''y' LIMIT 10") == \
+            "SELECT * FROM t WHERE id IN (?, ...) AND name = ? LIMIT ?"
+
+
+# ===========================
+# customlogger – async JSON logging
+# ===========================
+
+class TestCustomLogger:
+
+    @pytest.fixture
+    def app_logger(self, tmp_path, monkeypatch):
+        import logging
+        import constants
+        import customlogger
+        monkeypatch.setattr(constants, "SYSTEMLOGS_DIR", str(tmp_path))
+        monkeypatch.setattr(constants, "MAX_LOG_SIZE", 2000)
+        monkeypatch.setattr(constants, "LOG_LEVEL", "DEBUG")
+        monkeypatch.setattr(constants, "LOG_DEBUG_SAMPLE_RATE", 0.25)
+        root = logging.getLogger()
+        level = root.level
+        logger = customlogger.Logger()
+        yield logger
+        logger.stop()
+        root.removeHandler(logger.queue_handler)
+        root.setLevel(level)
+
+    def read_lines(self, tmp_path):
+        import json
+        lines = []
+        for path in sorted(tmp_path.glob("Log_*.txt")):
+            lines += [json.loads(line) for line in path.read_text().splitlines()]
+        return lines
+
+    def test_lines_are_json_with_request_context(self, app_logger, tmp_path):
+        from utils import metrics_utils
+        token = metrics_utils.CURRENT_REQUEST.set({"method": "GET", "path": "/parking-lots/1"})
+        id_token = metrics_utils.CURRENT_REQUEST_ID.set("req-123")
+        try:
+            app_logger.getLogger("API").info("lot %s opgehaald", 1)
+        finally:
+            metrics_utils.CURRENT_REQUEST_ID.reset(id_token)
+            metrics_utils.CURRENT_REQUEST.reset(token)
+        try:
+            raise ValueError("kapot")
+        except ValueError:
+            app_logger.getLogger("API").exception("mislukt")
+        app_logger.stop()
+
+        lines = self.read_lines(tmp_path)
+        entry = next(line for line in lines if line["message"] == "lot 1 opgehaald")
+        assert entry["level"] == "INFO" and entry["logger"] == "API"
+        assert entry["request_id"] == "req-123"
+        assert entry["route"] == "GET /parking-lots/1"
+        failed = next(line for line in lines if line["message"] == "mislukt")
+        assert "request_id" not in failed
+        assert "ValueError: kapot" in failed["exception"]
+
+    def test_debug_records_are_sampled(self, app_logger, tmp_path):
+        for i in range(20):
+            app_logger.getLogger("Sampled").debug("debug %d", i)
+        app_logger.getLogger("Sampled").warning("altijd")
+        app_logger.stop()
+
+        messages = [line["message"] for line in self.read_lines(tmp_path) if line["logger"] == "Sampled"]
+        assert messages == ["debug 0", "debug 4", "debug 8", "debug 12", "debug 16", "altijd"]
+
+    def test_rotated_files_are_gzipped(self, app_logger, tmp_path):
+        import gzip
+        import json
+        for i in range(60):
+            app_logger.getLogger("API").info("regel %d %s", i, "x" * 40)
+        app_logger.stop()
+
+        rotated = sorted(tmp_path.glob("Log_*.txt.*.gz"))
+        assert rotated and not list(tmp_path.glob("Log_*.txt.[0-9]"))
+        with gzip.open(rotated[0], "rt") as file:
+            assert json.loads(file.readline())["logger"]
+        messages = [line["message"] for line in self.read_lines(tmp_path)]
+        assert "Log reached maximum file size, transferring to new log file." in messages
+
+
+    def test_rotation_waits_for_pending_gzip(self, app_logger, tmp_path, monkeypatch):
+        """Een volgende rollover mag een bestand dat nog gecomprimeerd wordt niet overschrijven of verschuiven"""
+        import gzip
+        import json
+        import time
+        import customlogger
+        gzip_file = customlogger._gzip_file
+
+        def slow_gzip_file(source, dest):
+            time.sleep(0.05)
+            gzip_file(source, dest)
+
+        monkeypatch.setattr(customlogger, "_gzip_file", slow_gzip_file)
+        for i in range(100):
+            app_logger.getLogger("API").info("regel %d %s", i, "x" * 40)
+        app_logger.stop()
+
+        lines = self.read_lines(tmp_path)
+        for path in tmp_path.glob("Log_*.txt.*.gz"):
+            with gzip.open(path, "rt") as file:
+                lines += [json.loads(line) for line in file.read().splitlines()]
+        messages = {line["message"] for line in lines}
+        assert {f"regel {i} {'x' * 40}" for i in range(100)} <= messages
+        assert not list(tmp_path.glob("Log_*.txt.[0-9]"))
+
+# ===========================
+# looplag_utils – blokkerende calls op de event loop
+# ===========================
+
+def _blocking_lookup():
+    import time
+    time.sleep(0.3)
+
+
+class TestLoopLagMonitor:
+
+    def test_stall_is_sampled_and_counted(self, monkeypatch, caplog):
+        import asyncio
+        import logging
+        from utils import looplag_utils, metrics_utils
+        monkeypatch.setattr(looplag_utils, "API_DIR", os.path.dirname(os.path.abspath(__file__)))
+        before = metrics_utils.metric_value(looplag_utils.EVENT_LOOP_BLOCKED, ("unit_test._blocking_lookup",)) or 0
+
+        async def run():
+            monitor = looplag_utils.LoopLagMonitor(interval=0.01, threshold=0.05)
+            monitor.start()
+            await asyncio.sleep(0.05)
+            _blocking_lookup()
+            await asyncio.sleep(0.05)
+            await monitor.stop()
+
+        with caplog.at_level(logging.WARNING, logger="LoopLag"):
+            asyncio.run(run())
+
+        assert metrics_utils.metric_value(looplag_utils.EVENT_LOOP_BLOCKED, ("unit_test._blocking_lookup",)) == before + 1
+        assert metrics_utils.metric_value(looplag_utils.EVENT_LOOP_BLOCKED_SECONDS, ("unit_test._blocking_lookup",)) >= 0.2
+        messages = [record.getMessage() for record in caplog.records]
+        assert any("stalled" in message and "time.sleep(0.3)" in message for message in messages)
+        assert any(message.startswith("Event loop blocked for") for message in messages)
+
+    def test_blocking_frame_skips_database_layer(self):
+        from utils import looplag_utils
+
+        class Code:
+            def __init__(self, filename, name):
+                self.co_filename, self.co_name = filename, name
+
+        class Frame:
+            def __init__(self, filename, name, back=None):
+                self.f_code, self.f_back = Code(filename, name), back
+
+        api_dir = looplag_utils.API_DIR
+        caller = Frame(os.path.join(api_dir, "utils", "parking_lots_utils.py"), "get_sessions_by_lot_id")
+        frame = Frame(os.path.join(api_dir, "utils", "database_utils.py"), "execute_query", caller)
+        assert looplag_utils.blocking_frame(Frame("/usr/lib/python3/sqlite3.py", "execute", frame)) == \
+            "parking_lots_utils.get_sessions_by_lot_id"
+        assert looplag_utils.blocking_frame(Frame("/usr/lib/python3/bcrypt.py", "checkpw")) is None
+
+
+# ===========================
+# tracing_utils – spans en OTLP export
+# ===========================
+
+class TestTracing:
+
+    def test_spans_are_nested_and_exported(self, tmp_path, monkeypatch):
+        import json
+        import time
+        import constants
+        from utils import tracing_utils
+        export_path = tmp_path / "traces.jsonl"
+        monkeypatch.setattr(constants, "TRACE_EXPORT_PATH", str(export_path))
+
+        @tracing_utils.traced("lookup")
+        def lookup():
+            tracing_utils.record_statement("SELECT * FROM parking_lots WHERE id = ?", 0.002)
+            return 42
+
+        assert lookup() == 42  # buiten een trace geen spans
+        trace = tracing_utils.Trace()
+        root = trace.add(tracing_utils.Span(trace, "GET /x", tracing_utils.KIND_SERVER, None, {}))
+        token = tracing_utils.CURRENT_SPAN.set(root)
+        try:
+            assert lookup() == 42
+        finally:
+            tracing_utils.CURRENT_SPAN.reset(token)
+        root.end_ns = time.time_ns()
+        tracing_utils.finish_trace(trace)
+
+        root_span, lookup_span, sql_span = trace.spans
+        assert lookup_span.parent_id == root_span.span_id and sql_span.parent_id == lookup_span.span_id
+        assert sql_span.name == "SELECT parking_lots" and sql_span.kind == tracing_utils.KIND_CLIENT
+        assert tracing_utils.get_trace(trace.trace_id) is trace
+
+        deadline = time.time() + 5
+        while time.time() < deadline and not export_path.exists():
+            time.sleep(0.01)
+        exported = json.loads(export_path.read_text().splitlines()[0])
+        spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert [span["name"] for span in spans] == ["GET /x", "lookup", "SELECT parking_lots"]
+        assert "parentSpanId" not in spans[0]
+
+    def test_instrument_module_skips_generators_and_excluded(self):
+        from utils import parking_lots_utils, archive_utils, billing_utils
+        assert hasattr(parking_lots_utils.get_parking_lot_by_id, "__wrapped__")
+        assert not hasattr(billing_utils.iter_billing_data, "__wrapped__")
+        assert not hasattr(parking_lots_utils.available_spots, "__wrapped__")
+        assert not hasattr(archive_utils.session_source, "__wrapped__")
+
+
+# ===========================
+# jobs_utils – achtergrond jobs met leases
+# ===========================
+
+class TestJobs:
+
+    @pytest.fixture
+    def jobs_db(self, tmp_path, monkeypatch):
+        """Lege database met het schema van create_test_db en de tabellen van de API zelf"""
+        from create_test_db import get_schemas
+        path = str(tmp_path / "jobs.sqlite3")
+        conn = sqlite3.connect(path)
+        for statement in get_schemas() + database_utils.SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+        monkeypatch.setenv("DATABASE_PATH", path)
+        return path
+
+    def test_lease_is_held_by_one_worker(self, jobs_db, monkeypatch):
+        from utils import jobs_utils
+        own_id = jobs_utils.WORKER_ID
+        future = datetime.now() + timedelta(minutes=5)
+        assert jobs_utils.acquire_lease("cleanup", future)
+        assert jobs_utils.acquire_lease("cleanup", future)  # eigen lease verlengen mag
+
+        monkeypatch.setattr(jobs_utils, "WORKER_ID", "other-host:1:abcdef")
+        assert not jobs_utils.acquire_lease("cleanup", future)
+        jobs_utils.finish_lease("cleanup", datetime.now(), "success", None, 0.01)  # niet van deze worker
+        assert jobs_utils.get_leases()[0]["last_status"] is None
+
+        monkeypatch.setattr(jobs_utils, "WORKER_ID", own_id)
+        jobs_utils.finish_lease("cleanup", datetime.now() - timedelta(seconds=1), "success", None, 0.01)
+        monkeypatch.setattr(jobs_utils, "WORKER_ID", "other-host:1:abcdef")
+        assert jobs_utils.acquire_lease("cleanup", future)  # verlopen lease wordt overgenomen
+
+    def test_run_outcomes_and_metrics(self, jobs_db):
+        import asyncio
+        import time
+        from utils import jobs_utils, metrics_utils
+
+        def fail():
+            raise RuntimeError("boom")
+
+        scheduler = jobs_utils.Scheduler()
+        scheduler.add(jobs_utils.Job("unit_ok", lambda: 3, interval=60))
+        scheduler.add(jobs_utils.Job("unit_fail", fail, interval=60))
+        scheduler.add(jobs_utils.Job("unit_slow", lambda: time.sleep(0.3), interval=60, timeout=0.05))
+        with pytest.raises(ValueError):
+            scheduler.add(jobs_utils.Job("unit_ok", lambda: None, interval=60))
+
+        async def run():
+            return [await scheduler.run(name) for name in ("unit_ok", "unit_fail", "unit_slow", "unit_slow")]
+
+        ok, failed, slow, again = asyncio.run(run())
+        assert ok["status"] == "success" and ok["result"] == 3
+        assert failed["status"] == "error" and "boom" in failed["error"]
+        assert slow["status"] == "timeout"
+        assert again["status"] == "skipped"  # de vorige run loopt nog in zijn thread
+        assert scheduler.jobs["unit_slow"].last_run["status"] == "timeout"
+
+        assert metrics_utils.metric_value(jobs_utils.JOB_RUNS, ("unit_ok", "success")) == 1
+        assert metrics_utils.metric_value(jobs_utils.JOB_ITEMS, ("unit_ok",)) == 3
+        assert metrics_utils.metric_value(jobs_utils.JOB_RUNS, ("unit_slow", "skipped")) == 1
+        status = {job["name"]: job for job in scheduler.status()}
+        assert status["unit_fail"]["lease"]["last_status"] == "error"
+        assert status["unit_ok"]["lease"]["lease_until"] > datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def test_schedule_next(self):
+        from utils import jobs_utils
+        now = datetime(2025, 3, 1, 12, 0, 0)
+        assert jobs_utils.Job("a", print, interval=60).schedule_next(now) == now + timedelta(seconds=60)
+        assert jobs_utils.Job("b", print, daily_at="03:00").schedule_next(now) == datetime(2025, 3, 2, 3, 0)
+        assert jobs_utils.Job("c", print, daily_at="13:30").schedule_next(now) == datetime(2025, 3, 1, 13, 30)
+        jittered = jobs_utils.Job("d", print, interval=60, jitter=10).schedule_next(now)
+        assert now + timedelta(seconds=60) <= jittered <= now + timedelta(seconds=70)
+        with pytest.raises(ValueError):
+            jobs_utils.Job("e", print)
+
+
+# ===========================
+# admission_utils – admission control per route class
+# ===========================
+
+class TestAdmission:
+
+    CLASSES = {
+        "critical": {"priority": 0, "limit": 2, "max_queue": 10, "deadline": 1.0, "shared": False},
+        "default": {"priority": 1, "limit": 2, "max_queue": 10, "deadline": 1.0},
+        "bulk": {"priority": 2, "limit": 1, "max_queue": 1, "deadline": 0.05},
+    }
+
+    def test_classify(self):
+        from utils import admission_utils
+        assert admission_utils.classify("POST", "/parking-lots/3/sessions/start") == "critical"
+        assert admission_utils.classify("POST", "/payments/refund") == "critical"
+        assert admission_utils.classify("GET", "/billing/admin") == "bulk"
+        assert admission_utils.classify("GET", "/parking-lots/3/sessions") == "bulk"
+        assert admission_utils.classify("GET", "/discounts") == "bulk"
+        assert admission_utils.classify("GET", "/discounts/7") == "default"
+        assert admission_utils.classify("GET", "/parking-lots/3") == "default"
+        assert admission_utils.classify("GET", "/metrics") is None
+
+    def test_waiting_requests_are_served_by_priority(self):
+        import asyncio
+        from utils import admission_utils
+        controller = admission_utils.AdmissionController(self.CLASSES, max_concurrency=1)
+        order = []
+
+        async def request(name):
+            await controller.acquire(name)
+            order.append(name)
+
+        async def run():
+            await controller.acquire("default")  # het enige gedeelde slot
+            await request("critical")  # eigen slots, hoeft niet te wachten
+            waiting = [asyncio.create_task(request(name)) for name in ("bulk", "default")]
+            await asyncio.sleep(0.01)
+            assert order == ["critical"] and controller.classes["default"].queue
+            controller.release("default")
+            await asyncio.sleep(0.01)
+            assert order == ["critical", "default"]  # default gaat voor bulk, die al eerder wachtte
+            with pytest.raises(admission_utils.Rejected) as rejected:
+                await waiting[0]
+            assert rejected.value.reason == "deadline" and rejected.value.retry_after == 1
+            await waiting[1]
+
+        asyncio.run(run())
+        assert controller.shared_in_flight == 1 and not controller.classes["bulk"].queue
+
+    def test_middleware_sheds_with_503(self):
+        import asyncio
+        from utils import admission_utils, metrics_utils
+        controller = admission_utils.AdmissionController(self.CLASSES, max_concurrency=10)
+        before = metrics_utils.metric_value(admission_utils.ADMISSION_REJECTED, ("bulk", "queue_full")) or 0
+
+        async def run():
+            gate = asyncio.Event()
+
+            async def app(scope, receive, send):
+                await gate.wait()
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await send({"type": "http.response.body", "body": b"ok"})
+
+            def collect(messages):
+                async def send(message):
+                    messages.append(message)
+                return send
+
+            middleware = admission_utils.AdmissionMiddleware(app, controller)
+            scope = {"type": "http", "method": "GET", "path": "/billing/admin", "headers": []}
+            sent = [[], [], []]
+            calls = [asyncio.create_task(middleware(scope, None, collect(messages))) for messages in sent]
+            await asyncio.sleep(0.1)  # langer dan de deadline van bulk
+            gate.set()
+            await asyncio.gather(*calls)
+            return sent
+
+        running, queued, shed = asyncio.run(run())
+        assert running[0]["status"] == 200
+        assert queued[0]["status"] == 503 and (b"retry-after", b"1") in queued[0]["headers"]
+        assert b"deadline" in queued[1]["body"]
+        assert shed[0]["status"] == 503 and b"queue_full" in shed[1]["body"]
+        assert metrics_utils.metric_value(admission_utils.ADMISSION_REJECTED, ("bulk", "queue_full")) == before + 1
+        assert controller.classes["bulk"].in_flight == 0
+
+
+# ===========================
+# singleflight_utils – gedeelde reads
+# ===========================
+
+class TestSingleFlight:
+
+    def test_concurrent_identical_calls_share_one_execution(self):
+        import asyncio
+        import threading
+        import time
+        from utils import singleflight_utils, metrics_utils
+        calls = []
+        lock = threading.Lock()
+
+        def lookup_lot(lot_id):
+            with lock:
+                calls.append(lot_id)
+            time.sleep(0.05)
+            return {"id": lot_id}
+
+        shared_lookup = singleflight_utils.coalesced(lookup_lot)
+
+        async def run():
+            same = await asyncio.gather(*[shared_lookup(1) for _ in range(10)])
+            other = await asyncio.gather(shared_lookup(2), shared_lookup(2, scope=("user", 7)))
+            return same, other
+
+        same, other = asyncio.run(run())
+        assert all(result is same[0] for result in same) and same[0] == {"id": 1}
+        assert sorted(calls) == [1, 2, 2]  # andere scope deelt niet
+        assert other[0] == other[1] == {"id": 2}
+        assert metrics_utils.metric_value(singleflight_utils.COALESCED_CALLS, ("unit_test.lookup_lot", "shared")) == 9
+        assert metrics_utils.metric_value(singleflight_utils.COALESCED_IN_FLIGHT, ("unit_test.lookup_lot",)) == 0
+        assert singleflight_utils._calls == {}
+
+    def test_exception_is_shared_and_not_cached(self):
+        import asyncio
+        import time
+        from utils import singleflight_utils
+        calls = []
+
+        def failing(value):
+            calls.append(value)
+            time.sleep(0.02)
+            raise ValueError("Invalid cursor")
+
+        shared_failing = singleflight_utils.coalesced(failing)
+
+        async def run():
+            return await asyncio.gather(*[shared_failing("x") for _ in range(3)], return_exceptions=True)
+
+        first = asyncio.run(run())
+        assert all(isinstance(result, ValueError) for result in first) and calls == ["x"]
+        asyncio.run(run())
+        assert calls == ["x", "x"]
+
+
+# ===========================
+# etag_utils – versies en If-None-Match
+# ===========================
+
+class TestETags:
+
+    def test_triggers_bump_versions(self, tmp_path, monkeypatch):
+        from create_test_db import get_schemas
+        from utils import etag_utils
+        path = str(tmp_path / "etag.sqlite3")
+        conn = sqlite3.connect(path)
+        for statement in get_schemas() + database_utils.SCHEMA:
+            conn.execute(statement)
+        monkeypatch.setenv("DATABASE_PATH", path)
+        keys = (("parking_lots", 0), ("reservations", 1), ("billing", 7), ("billing", 8))
+        assert etag_utils.get_versions(*keys) == (0, 0, 0, 0)
+
+        conn.execute("INSERT INTO parking_lots (id, name, capacity) VALUES (1, 'A', 10)")
+        conn.execute("INSERT INTO reservations (id, parking_lot_id, start_time) VALUES (1, 1, '2025-01-01 10:00:00')")
+        conn.execute("UPDATE reservations SET status = 'confirmed' WHERE id = 1")
+        conn.execute("INSERT INTO p_sessions (id, parking_lot_id, user_id, started_at) VALUES (1, 1, 7, '2025-01-01')")
+        conn.execute("UPDATE p_sessions SET user_id = 8 WHERE id = 1")  # beide users zien een andere billing
+        conn.execute("INSERT INTO p_sessions (id, parking_lot_id, started_at) VALUES (2, 1, '2025-01-01')")
+        conn.commit()
+        conn.close()
+        assert etag_utils.get_versions(*keys) == (1, 2, 2, 1)
+
+    def test_if_none_match(self):
+        from utils import etag_utils
+        etag = etag_utils.make_etag("parking_lots", 3, None, None)
+        assert etag.startswith('"') and etag != etag_utils.make_etag("parking_lots", 4, None, None)
+        assert etag_utils.matches(etag, etag)
+        assert etag_utils.matches(f'"other", W/{etag}', etag)
+        assert etag_utils.matches("*", etag)
+        assert not etag_utils.matches(None, etag) and not etag_utils.matches('"other"', etag)
+
+
+# ===========================
+# compression_utils – Accept-Encoding, drempel en streaming
+# ===========================
+
+class TestCompression:
+
+    @staticmethod
+    def run_app(chunks, accept_encoding, content_type=b"application/json", headers=(), endpoint=None, status=200):
+        """Stuur chunks door CompressionMiddleware; geeft (status, headers, body) terug"""
+        import asyncio
+        from types import SimpleNamespace
+        from utils import compression_utils
+
+        async def app(scope, receive, send):
+            await send({"type": "http.response.start", "status": status,
+                        "headers": [(b"content-type", content_type), *headers]})
+            for index, chunk in enumerate(chunks):
+                await send({"type": "http.response.body", "body": chunk, "more_body": index < len(chunks) - 1})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/test", "headers": [(b"accept-encoding", accept_encoding)],
+                 "route": SimpleNamespace(path="/test", endpoint=endpoint)}
+        asyncio.run(compression_utils.CompressionMiddleware(app)(scope, None, send))
+        return messages[0]["status"], dict(messages[0]["headers"]), b"".join(m.get("body", b"") for m in messages[1:])
+
+    def test_choose_encoding(self):
+        from utils.compression_utils import choose_encoding
+        assert choose_encoding("gzip, deflate, br") == "br"
+        assert choose_encoding("gzip;q=1.0, br;q=0.5") == "gzip"
+        assert choose_encoding("br;q=0, gzip") == "gzip"
+        assert choose_encoding("*") == "br"
+        assert choose_encoding("identity") is None and choose_encoding(None) is None
+
+    def test_compresses_large_responses_only(self):
+        import gzip
+        import brotli
+        from utils.compression_utils import no_compression
+        body = b'{"rows": [' + b'{"name": "Parking Centrum"},' * 200 + b"]}"
+        status, headers, data = self.run_app([body], b"gzip", headers=[(b"etag", b'"abc"')])
+        assert headers[b"content-encoding"] == b"gzip" and gzip.decompress(data) == body
+        assert headers[b"content-length"] == str(len(data)).encode() and len(data) < len(body) / 5
+        assert headers[b"etag"] == b'W/"abc"' and headers[b"vary"] == b"Accept-Encoding"
+
+        status, headers, data = self.run_app([body], b"br")
+        assert headers[b"content-encoding"] == b"br" and brotli.decompress(data) == body
+
+        # Onder de drempel, niet comprimeerbaar of expliciet uitgezet: ongewijzigd
+        for kwargs in ({"chunks": [b'{"ok": true}']}, {"chunks": [body], "content_type": b"image/png"},
+                       {"chunks": [body], "endpoint": no_compression(lambda: None)}):
+            status, headers, data = self.run_app(accept_encoding=b"gzip, br", **kwargs)
+            assert b"content-encoding" not in headers and data == kwargs["chunks"][0]
+
+    def test_streamed_response_is_compressed_incrementally(self):
+        import zlib
+        from utils import compression_utils, metrics_utils
+        before = metrics_utils.metric_value(compression_utils.COMPRESSED_RESPONSES, ("gzip",))
+        rows = [b'{"id": %d, "licenseplate": "AB-12-CD"}\n' % i for i in range(5000)]
+        status, headers, data = self.run_app(rows, b"gzip", content_type=b"application/x-ndjson",
+                                             headers=[(b"content-length", b"1")])
+        assert b"content-length" not in headers and headers[b"content-encoding"] == b"gzip"
+        assert zlib.decompress(data, 31) == b"".join(rows)
+        assert metrics_utils.metric_value(compression_utils.COMPRESSED_RESPONSES, ("gzip",)) == before + 1
+
+    def test_not_modified_passes_through(self):
+        # 304 met een (lege) body message: geen exception, wel de zwakke ETag
+        status, headers, data = self.run_app([b""], b"gzip", headers=[(b"etag", b'"abc"')], status=304)
+        assert status == 304 and headers[b"etag"] == b'W/"abc"' and data == b""
+        assert b"content-encoding" not in headers
+
+
+# ===========================
+# streaming_utils – export cursors op de gedeelde stream threads
+# ===========================
+
+class TestStreaming:
+
+    @staticmethod
+    def chunks(threads, closed, count):
+        """Chunk generator die bijhoudt op welke threads hij loopt en op welke hij gesloten wordt"""
+        import threading
+        try:
+            for i in range(count):
+                threads.add(threading.current_thread())
+                yield "x" * 1024
+        finally:
+            closed.append(threading.current_thread())
+
+    def test_each_stream_stays_on_one_shared_thread(self):
+        import asyncio
+        from utils import streaming_utils
+        runs = [(set(), []) for _ in range(streaming_utils.STREAM_WORKERS * 2)]
+
+        async def consume(threads, closed):
+            return "".join([batch async for batch in streaming_utils._on_one_thread(self.chunks(threads, closed, 200))])
+
+        async def main():
+            return await asyncio.gather(*(consume(threads, closed) for threads, closed in runs))
+
+        bodies = asyncio.run(main())
+        assert all(body == "x" * 1024 * 200 for body in bodies)
+        assert all(len(threads) == 1 and closed == list(threads) for threads, closed in runs)
+        assert len(set().union(*(threads for threads, closed in runs))) <= streaming_utils.STREAM_WORKERS
+
+    def test_aborted_stream_closes_generator_on_its_thread(self):
+        import asyncio
+        import time
+        from utils import streaming_utils
+        threads, closed = set(), []
+
+        async def main():
+            stream = streaming_utils._on_one_thread(self.chunks(threads, closed, 100_000))
+            await stream.__anext__()
+            await stream.aclose()
+
+        asyncio.run(main())
+        # De worker ziet de stop na zijn huidige batch en sluit dan zelf de generator
+        deadline = time.monotonic() + 5
+        while not closed:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert closed == list(threads) and len(threads) == 1
+
+# ===========================
+# msgpack_utils – Accept en request bodies
+# ===========================
+
+class TestMessagePack:
+
+    def test_wants_msgpack(self):
+        from utils.msgpack_utils import wants_msgpack
+        assert wants_msgpack("application/msgpack") == "application/msgpack"
+        assert wants_msgpack("application/json;q=0.5, application/x-msgpack") == "application/x-msgpack"
+        assert wants_msgpack("application/msgpack;q=0.5, application/json") is None
+        assert wants_msgpack("*/*") is None and wants_msgpack(None) is None
+        assert wants_msgpack("application/msgpack;q=0") is None
+
+    def test_unpackb_rejects_what_json_cannot_hold(self):
+        import msgpack
+        from utils.msgpack_utils import unpackb
+        assert unpackb(msgpack.packb({"licenseplate": "AB-12-CD", "lot": 1})) == {"licenseplate": "AB-12-CD", "lot": 1}
+        for data in (b"\xc1", msgpack.packb(b"raw bytes", use_bin_type=True), msgpack.packb({1: 2}) + b"\x00"):
+            with pytest.raises(ValueError):
+                unpackb(data)
+
+    def test_middleware_converts_request_and_response(self):
+        import asyncio
+        import json
+        import msgpack
+        from utils.msgpack_utils import MessagePackMiddleware
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen["headers"] = dict(scope["headers"])
+            seen["body"] = (await receive())["body"]
+            body = json.dumps({"id": 1, "name": "Centrum"}).encode()
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                (b"etag", b'"abc"')]})
+            await send({"type": "http.response.body", "body": body})
+
+        async def receive():
+            return {"type": "http.request", "body": msgpack.packb({"name": "Centrum"}), "more_body": False}
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/parking-lots", "headers": [
+            (b"content-type", b"application/msgpack"), (b"accept", b"application/msgpack")]}
+        asyncio.run(MessagePackMiddleware(app)(scope, receive, send))
+        assert seen["headers"][b"content-type"] == b"application/json"
+        assert json.loads(seen["body"]) == {"name": "Centrum"}
+        headers = dict(messages[0]["headers"])
+        assert headers[b"content-type"] == b"application/msgpack" and headers[b"vary"] == b"Accept"
+        assert headers[b"etag"] == b'W/"abc"' and headers[b"content-length"] == str(len(messages[1]["body"])).encode()
+        assert msgpack.unpackb(messages[1]["body"]) == {"id": 1, "name": "Centrum"}
+
+
+# ===========================
+# fields_utils – sparse fieldsets
+# ===========================
+
+class TestSparseFields:
+
+    def test_parse_fields_against_table_columns(self, tmp_path, monkeypatch):
+        from create_test_db import get_schemas
+        from utils import fields_utils, parking_lots_utils
+        path = str(tmp_path / "fields.sqlite3")
+        conn = sqlite3.connect(path)
+        for statement in get_schemas():
+            conn.execute(statement)
+        conn.execute("INSERT INTO parking_lots (id, name, address, capacity) VALUES (1, 'A', 'Street 1', 10)")
+        conn.commit()
+        conn.close()
+        monkeypatch.setenv("DATABASE_PATH", path)
+        monkeypatch.setattr(parking_lots_utils, "DATABASE_PATH", path)
+        monkeypatch.setattr(fields_utils, "_table_columns", {})
+
+        assert fields_utils.parse_fields(None, "parking_lots") is None
+        assert fields_utils.parse_fields("name, capacity,name", "parking_lots") == ("id", "name", "capacity")
+        for invalid in ("", "name,password", "name; DROP TABLE parking_lots"):
+            with pytest.raises(ValueError):
+                fields_utils.parse_fields(invalid, "parking_lots")
+
+        fields = fields_utils.parse_fields("name", "parking_lots")
+        assert fields_utils.columns(fields, "p.") == "p.id, p.name" and fields_utils.columns(None) == "*"
+        lots, _ = parking_lots_utils.get_all_parking_lots(fields=fields)
+        assert lots == [{"id": 1, "name": "A"}]
+        lot = parking_lots_utils.get_parking_lot_by_id(1, fields_utils.with_fields(fields, "capacity"))
+        assert fields_utils.pick(lot, fields) == {"id": 1, "name": "A"} and lot["capacity"] == 10
+
+
+# ===========================
+# pagination_utils – keyset paginering
+# ===========================
+
+class TestPagination:
+
+    def test_unpaginated_without_cursor_and_limit_and_composite_key(self, tmp_path, monkeypatch):
+        from utils import pagination_utils
+        path = str(tmp_path / "pages.sqlite3")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE p_sessions (id INTEGER PRIMARY KEY, started_at TEXT)")
+        # id volgorde wijkt af van started_at volgorde, en twee sessies starten tegelijk
+        conn.executemany("INSERT INTO p_sessions VALUES (?, ?)", [
+            (1, "2025-01-03"), (2, "2025-01-01"), (3, "2025-01-02"), (4, "2025-01-02"), (5, "2025-01-04")])
+        conn.commit()
+        conn.close()
+        monkeypatch.setenv("DATABASE_PATH", path)
+
+        rows, next_cursor = pagination_utils.paginate("SELECT * FROM p_sessions", [], [])
+        assert len(rows) == 5 and next_cursor is None
+
+        key = ("started_at", "id")
+        ids, cursor = [], None
+        while True:
+            rows, cursor = pagination_utils.paginate("SELECT * FROM p_sessions", [], [], cursor, 2, key=key,
+                                                     descending=True)
+            ids += [row["id"] for row in rows]
+            if not cursor:
+                break
+        assert ids == [5, 1, 4, 3, 2]
+        with pytest.raises(ValueError):
+            pagination_utils.paginate("SELECT * FROM p_sessions", [], [], pagination_utils.encode_cursor(3), 2,
+                                      key=key)
+
+
+# ===========================
+# audit_query_plans – geen full table scans
+# ===========================
+
+class TestQueryPlanAudit:
+
+    @pytest.fixture
+    def audit_query_plans(self, monkeypatch):
+        tools_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'tools'))
+        monkeypatch.syspath_prepend(tools_dir)
+        import audit_query_plans
+        return audit_query_plans
+
+    @pytest.fixture
+    def schema_db(self, tmp_path):
+        """Lege database met het schema van create_test_db en de indexes van de app"""
+        from create_test_db import get_schemas
+        path = str(tmp_path / "audit.sqlite3")
+        conn = sqlite3.connect(path)
+        for statement in get_schemas():
+            conn.execute(statement)
+        for statement in database_utils.SCHEMA + database_utils.INDEXES:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+        return path
+
+    def test_registered_queries_use_indexes(self, audit_query_plans, schema_db):
+        """Elke geregistreerde query (behalve bewuste overzichten) gebruikt een index"""
+        findings = audit_query_plans.audit(schema_db)
+        flagged = [f"{finding.location}: {finding.detail}" for finding in findings if not finding.allowed]
+        assert flagged == []
+        queries = audit_query_plans.load_queries()
+        assert any("LOWER(code)" in query.sql and query.location.startswith("utils/discount_utils.py")
+                   for query in queries)
+        assert any(query.location.startswith("endpoints/discounts.py") for query in queries)
+
+    def test_missing_index_is_flagged(self, audit_query_plans, schema_db):
+        conn = sqlite3.connect(schema_db)
+        conn.execute("DROP INDEX idx_discounts_code_lower")
+        conn.commit()
+        conn.close()
+        flagged = [finding for finding in audit_query_plans.audit(schema_db) if not finding.allowed]
+        assert flagged and all(finding.detail == "SCAN discounts" for finding in flagged)
+        assert any(finding.location.startswith("utils/discount_utils.py") for finding in flagged)
@@ -271,6 +271,15 @@ def test_get_vehicles_success(register_and_login):
     assert any(v["license_plate"] == "GET-123" for v in vehicles)
     assert any(v["license_plate"] == "GET-456" for v in vehicles)
 
+def test_get_vehicles_sparse_fields(register_and_login):
+    token = register_and_login("fld", "geheim", "Sanne Veld", "96", "30192196", 1990)
+    requests.post(f"{BASE_URL}/vehicles", headers={"Authorization": token},
+                  json={"license_plate": "FLD-123", "make": "Kia", "model": "Niro"})
+
+    res = requests.get(f"{BASE_URL}/vehicles", params={"fields": "license_plate"}, headers={"Authorization": token})
+    assert res.status_code == 200
+    assert [set(v) for v in res.json()] == [{"id", "license_plate"}] and res.json()[0]["license_plate"] == "FLD-123"
+
 def test_get_vehicle_reservations_empty(register_and_login):
     # 2. Opvraging reserveringen voor voertuig zonder reserveringen
     token = register_and_login("resuser", "pw", "Res Gebruiker", "16", "30192114", 1990)
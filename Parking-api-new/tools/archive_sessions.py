@@ -0,0 +1,35 @@
+"""
+Move old verified parking sessions from p_sessions to the archive database.
+
+Usage: python tools/archive_sessions.py [--days N] [--batch-size N]
+"""
+import argparse
+import os
+import sys
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+api_dir = os.path.abspath(os.path.join(script_dir, '..', 'api'))
+sys.path.insert(0, api_dir)
+
+from utils import archive_utils  # noqa: E402
+import constants  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive verified parking sessions older than N days")
+    parser.add_argument("--days", type=int, default=constants.ARCHIVE_AFTER_DAYS,
+                        help=f"Archive sessions with a verified exit older than this (default and minimum "
+                             f"{constants.ARCHIVE_AFTER_DAYS}, ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--batch-size", type=int, default=constants.ARCHIVE_BATCH_SIZE,
+                        help=f"Sessions moved per transaction (default {constants.ARCHIVE_BATCH_SIZE})")
+    args = parser.parse_args()
+    if args.days < constants.ARCHIVE_AFTER_DAYS:
+        parser.error(f"--days must be at least ARCHIVE_AFTER_DAYS ({constants.ARCHIVE_AFTER_DAYS}); "
+                     f"reads of recent date ranges skip the archive")
+
+    moved = archive_utils.archive_sessions(args.days, args.batch_size)
+    print(f"Archived {moved} sessions to {archive_utils.database_utils.get_archive_db_path()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Audit the query plans of every registered SQL statement.
+
+Imports all modules in api/utils/ plus endpoints/discounts.py (which registers
+their statements in utils.query_registry), runs EXPLAIN QUERY PLAN for each
+statement against a database file and reports every table SCAN that does not
+use an index, with the location where the statement is registered. Statements
+registered with allow_scan=True (listings of a whole table) are only listed.
+The exit code is 1 when something is flagged, so it can run in CI;
+test/unit_test.py runs the same audit against a fresh schema.
+
+    python tools/audit_query_plans.py --db api/data/parking.sqlite3
+"""
+import argparse
+import glob
+import importlib
+import os
+import re
+import sqlite3
+import sys
+from typing import List, NamedTuple
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.abspath(os.path.join(script_dir, '..'))
+api_dir = os.path.join(project_dir, 'api')
+sys.path.insert(0, project_dir)
+sys.path.insert(0, api_dir)
+
+# Modules met SQL buiten utils/
+EXTRA_MODULES = ("endpoints.discounts",)
+
+_BINDINGS = re.compile(r"uses (\d+)")
+
+
+class Finding(NamedTuple):
+    location: str
+    sql: str
+    detail: str    # plan regel (bv. "SCAN discounts") of de foutmelding
+    allowed: bool  # geregistreerd met allow_scan
+
+
+def load_queries():
+    """Import every module that registers SQL and return the registered statements"""
+    from utils import query_registry
+    modules = list(EXTRA_MODULES)
+    for path in sorted(glob.glob(os.path.join(api_dir, "utils", "*.py"))):
+        # Alleen modules die iets registreren (auth_utils bv. heeft bij import een FERNET_KEY nodig)
+        with open(path, encoding="utf-8") as file:
+            source = file.read()
+        if "register(" in source or "register_page(" in source:
+            modules.append(f"utils.{os.path.splitext(os.path.basename(path))[0]}")
+    for module in modules:
+        importlib.import_module(module)
+    return query_registry.registered_queries()
+
+
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    """EXPLAIN QUERY PLAN details; placeholders are bound to NULL (the plan doesn't depend on values)"""
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    except sqlite3.ProgrammingError as e:
+        match = _BINDINGS.search(str(e))
+        if not match:
+            raise
+        rows = conn.execute("EXPLAIN QUERY PLAN " + sql, [None] * int(match.group(1))).fetchall()
+    return [row[3] for row in rows]
+
+
+def is_unindexed_scan(detail: str) -> bool:
+    return detail.startswith("SCAN ") and " USING " not in detail and not detail.startswith("SCAN CONSTANT ROW")
+
+
+def audit(db_path: str) -> List[Finding]:
+    """Findings for every registered statement with an unindexed scan (or that fails to plan)"""
+    from utils import archive_utils, database_utils
+    findings = []
+    queries = load_queries()
+    conn = sqlite3.connect(db_path)
+    try:
+        # Leeg archief met hetzelfde schema, zodat ook de archief statements gepland kunnen worden
+        conn.execute("ATTACH DATABASE ':memory:' AS archive")
+        try:
+            archive_utils._ensure_archive_schema(conn)
+        except sqlite3.Error:
+            pass
+        # Tabellen die de API zelf bij startup aanmaakt, in een transactie die niet gecommit wordt
+        conn.execute("BEGIN")
+        for statement in database_utils.SCHEMA:
+            conn.execute(statement)
+        for query in queries:
+            try:
+                details = explain(conn, query.sql)
+            except sqlite3.Error as e:
+                findings.append(Finding(query.location, query.sql, f"ERROR {e}", False))
+                continue
+            for detail in details:
+                if is_unindexed_scan(detail):
+                    findings.append(Finding(query.location, query.sql, detail, query.allow_scan))
+    finally:
+        conn.rollback()
+        conn.close()
+    return findings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report full table scans in the registered SQL statements")
+    parser.add_argument("--db", help="Database file to plan against (default: the API's database)")
+    parser.add_argument("--show-allowed", action="store_true", help="Also list scans registered with allow_scan")
+    args = parser.parse_args()
+
+    from utils import database_utils
+    db_path = args.db or database_utils.get_db_path()
+    if not os.path.exists(db_path):
+        parser.error(f"database not found: {db_path}")
+
+    findings = audit(db_path)
+    flagged = [finding for finding in findings if not finding.allowed]
+    for finding in findings:
+        if finding.allowed and not args.show_allowed:
+            continue
+        marker = "allowed" if finding.allowed else "FLAGGED"
+        print(f"{marker:<8} {finding.location:<40} {finding.detail}")
+        print(f"         {' '.join(finding.sql.split())}")
+
+    print(f"\n{len(load_queries())} statements audited, {len(flagged)} unindexed scan(s) flagged")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Import the JSON data store of the old API (Parking-api-old) into the SQLite database.
+
+Reads users.json, parking-lots.json, reservations.json, payments.json and
+pdata/p{lid}-sessions.json from the legacy data directory. Files are parsed item
+by item (never loaded whole) and inserted with executemany in large batches.
+Progress is stored per source file in the legacy_import_progress table, in the
+same transaction as each batch, so an interrupted run continues where it stopped.
+
+Usage: python tools/import_legacy.py path/to/old/data [--db path] [--batch-size N] [--defer-indexes]
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import bcrypt
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+api_dir = os.path.abspath(os.path.join(script_dir, '..', 'api'))
+sys.path.insert(0, api_dir)
+
+from utils import database_utils  # noqa: E402
+
+BATCH_SIZE = 10000
+READ_CHUNK_SIZE = 1 << 20
+REPORT_INTERVAL_SECONDS = 5
+
+# Alleen voor de duur van de import: geen fsync per commit, grote page cache
+IMPORT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA foreign_keys=OFF",
+)
+
+RESERVATION_STATUSES = ("pending", "confirmed", "cancelled", "expired", "completed")
+
+_SESSIONS_FILE = re.compile(r"p(\d+)-sessions\.json$")
+_WHITESPACE = re.compile(r"[ \t\r\n]*")
+
+
+def iter_json_items(path: str) -> Iterator[Tuple[Optional[str], Any]]:
+    """
+    Stream the items of a top-level JSON array or object.
+
+    Yields (key, value) per item; key is None for arrays. Only one item is held
+    in memory at a time, plus at most one read chunk.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = file.read(READ_CHUNK_SIZE)
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            return bool(chunk)
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                pos = _WHITESPACE.match(buffer, pos).end()
+                if pos < len(buffer) or not fill():
+                    return
+
+        def decode() -> Any:
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # Een getal aan het eind van de buffer kan nog doorlopen in de volgende chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        skip_whitespace()
+        if pos >= len(buffer):
+            return
+        opening = buffer[pos]
+        if opening not in "[{":
+            raise ValueError(f"{path}: expected a JSON array or object")
+        closing = "]" if opening == "[" else "}"
+        pos += 1
+
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"{path}: unexpected end of file")
+            if buffer[pos] == closing:
+                return
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            key = None
+            if opening == "{":
+                key = decode()
+                skip_whitespace()
+                if pos >= len(buffer) or buffer[pos] != ":":
+                    raise ValueError(f"{path}: expected ':' after key {key!r}")
+                pos += 1
+                skip_whitespace()
+            yield key, decode()
+
+
+def legacy_timestamp(value: Optional[str]) -> Optional[str]:
+    """Convert a legacy timestamp (%d-%m-%Y %H:%M:%S, or already ISO) to %Y-%m-%d %H:%M:%S"""
+    if not value:
+        return None
+    value = str(value).strip()
+    # Snelle route zonder strptime: dd-mm-yyyy[ hh:mm:ss] -> yyyy-mm-dd[ hh:mm:ss]
+    if len(value) >= 10 and value[2] == "-" and value[5] == "-":
+        value = f"{value[6:10]}-{value[3:5]}-{value[0:2]}{value[10:]}"
+    value = value.replace("T", " ").rstrip("Z")
+    return value[:19]
+
+
+def legacy_date(value: Optional[str]) -> Optional[str]:
+    """Convert a legacy date or timestamp to %Y-%m-%d"""
+    timestamp = legacy_timestamp(value)
+    return timestamp[:10] if timestamp else None
+
+
+def _minutes_between(started: Optional[str], stopped: Optional[str]) -> Optional[int]:
+    if not started or not stopped:
+        return None
+    try:
+        # fromisoformat is een C implementatie, vele malen sneller dan strptime
+        diff = datetime.fromisoformat(stopped) - datetime.fromisoformat(started)
+    except ValueError:
+        return None
+    return int(diff.total_seconds() // 60)
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float_or_none(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class LegacyImporter:
+    """Imports one legacy data directory into a SQLite database, source file by source file"""
+
+    def __init__(self, data_dir: str, db_path: str, batch_size: int = BATCH_SIZE, hash_workers: int = 8):
+        self.data_dir = data_dir
+        self.batch_size = batch_size
+        self.hash_workers = hash_workers
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        for pragma in IMPORT_PRAGMAS:
+            self.conn.execute(pragma)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS legacy_import_progress (
+                source TEXT PRIMARY KEY,
+                items_done INTEGER NOT NULL,
+                finished INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.user_ids: Dict[str, int] = {}
+        self.total_rows = 0
+        self.skipped = 0
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ---------------------------
+    # Checkpoints
+    # ---------------------------
+
+    def _progress(self, source: str) -> Tuple[int, bool]:
+        row = self.conn.execute(
+            "SELECT items_done, finished FROM legacy_import_progress WHERE source = ?", (source,)
+        ).fetchone()
+        return (row[0], bool(row[1])) if row else (0, False)
+
+    def _save_progress(self, source: str, items_done: int, finished: bool) -> None:
+        self.conn.execute("""
+            INSERT INTO legacy_import_progress (source, items_done, finished) VALUES (?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET items_done = excluded.items_done, finished = excluded.finished
+        """, (source, items_done, int(finished)))
+
+    def _import_source(self, source: str, path: str, insert_sql: str,
+                       to_rows: Callable[[List[Tuple[Optional[str], Any]]], List[tuple]]) -> None:
+        """Import one file: skip what a previous run already committed, then insert batch by batch"""
+        if not os.path.exists(path):
+            print(f"{source}: {path} not found, skipped")
+            return
+        done, finished = self._progress(source)
+        if finished:
+            print(f"{source}: already imported")
+            return
+
+        started = time.perf_counter()
+        last_report = started
+        rows_inserted = 0
+        items = itertools.islice(iter_json_items(path), done, None)
+
+        for batch in _batches(items, self.batch_size):
+            rows = to_rows(batch)
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(insert_sql, rows)
+                done += len(batch)
+                self._save_progress(source, done, False)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            rows_inserted += len(rows)
+            self.skipped += len(batch) - len(rows)
+
+            now = time.perf_counter()
+            if now - last_report >= REPORT_INTERVAL_SECONDS:
+                print(f"{source}: {done} items, {rows_inserted / (now - started):,.0f} rows/s")
+                last_report = now
+
+        self._save_progress(source, done, True)
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        self.total_rows += rows_inserted
+        print(f"{source}: {rows_inserted} rows in {elapsed:.1f}s ({rows_inserted / elapsed:,.0f} rows/s)")
+
+    # ---------------------------
+    # Mapping per bron
+    # ---------------------------
+
+    def _user_rows(self, batch: List[Tuple[Optional[str], Any]]) -> List[tuple]:
+        users = [user for _, user in batch if user.get("username")]
+
+        # Oude md5 hashes worden gehasht met bcrypt (hash_v 'md5', zie auth_utils.verify_password).
+        # bcrypt geeft de GIL vrij, dus een thread pool schaalt over de cores.
+        def rehash(user: Dict[str, Any]) -> Optional[str]:
+            md5_hash = user.get("password")
+            if not md5_hash:
+                return None
+            return bcrypt.hashpw(md5_hash.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as pool:
+            hashes = list(pool.map(rehash, users))
+
+        return [(
+            _int_or_none(user.get("id")),
+            user["username"],
+            password_hash,
+            user.get("name"),
+            user.get("email"),
+            user.get("phone"),
+            user.get("role") or "USER",
+            legacy_date(user.get("created_at")),
+            _int_or_none(user.get("birth_year")),
+            0 if user.get("active") is False else 1,
+        ) for user, password_hash in zip(users, hashes)]
+
+    def _parking_lot_rows(self, batch: List[Tuple[Optional[str], Any]]) -> List[tuple]:
+        rows = []
+        for key, lot in batch:
+            lot_id = _int_or_none(lot.get("id", key))
+            if lot_id is None or not lot.get("name"):
+                continue
+            coordinates = lot.get("coordinates") or {}
+            rows.append((
+                lot_id,
+                lot["name"],
+                lot.get("location"),
+                lot.get("address"),
+                _int_or_none(lot.get("capacity")),
+                _int_or_none(lot.get("reserved")) or 0,
+                _float_or_none(lot.get("tariff")),
+                _float_or_none(lot.get("daytariff", lot.get("day_tariff"))),
+                legacy_timestamp(lot.get("created_at")),
+                _float_or_none(coordinates.get("lat", lot.get("lat"))),
+                _float_or_none(coordinates.get("lng", lot.get("lng"))),
+            ))
+        return rows
+
+    def _reservation_rows(self, batch: List[Tuple[Optional[str], Any]]) -> List[tuple]:
+        rows = []
+        for key, reservation in batch:
+            start_time = legacy_timestamp(reservation.get("startdate") or reservation.get("start_time"))
+            if not start_time:
+                continue
+            status = reservation.get("status")
+            rows.append((
+                _int_or_none(reservation.get("id", key)),
+                self._user_id(reservation),
+                _int_or_none(reservation.get("parkinglot", reservation.get("parking_lot_id"))),
+                start_time,
+                legacy_timestamp(reservation.get("enddate") or reservation.get("end_time")),
+                status if status in RESERVATION_STATUSES else "confirmed",
+                legacy_timestamp(reservation.get("created_at")),
+                _float_or_none(reservation.get("cost")),
+            ))
+        return rows
+
+    def _session_rows(self, lot_id: int) -> Callable[[List[Tuple[Optional[str], Any]]], List[tuple]]:
+        def to_rows(batch: List[Tuple[Optional[str], Any]]) -> List[tuple]:
+            rows = []
+            for _, session in batch:
+                started = legacy_timestamp(session.get("started"))
+                if not started:
+                    continue
+                stopped = legacy_timestamp(session.get("stopped"))
+                user_name = session.get("user")
+                duration = _int_or_none(session.get("duration_minutes"))
+                rows.append((
+                    lot_id,
+                    self.user_ids.get(user_name),
+                    session.get("licenseplate"),
+                    user_name,
+                    started,
+                    stopped,
+                    duration if duration is not None else _minutes_between(started, stopped),
+                    _float_or_none(session.get("cost")),
+                    (session.get("payment_status") or "unpaid").lower(),
+                    # Oude sessies kennen geen slagboom controle: gestopt = vertrokken,
+                    # anders tellen ze mee als bezet in count_active_sessions
+                    stopped,
+                ))
+            return rows
+        return to_rows
+
+    def _payment_rows(self, batch: List[Tuple[Optional[str], Any]]) -> List[tuple]:
+        rows = []
+        for _, payment in batch:
+            amount = _float_or_none(payment.get("amount"))
+            if amount is None:
+                continue
+            completed = payment.get("completed")
+            if amount < 0:
+                status = "refunded"
+            else:
+                status = "paid" if completed else "initiated"
+            created_at = legacy_timestamp(payment.get("created_at"))
+            t_data = payment.get("t_data") or {}
+            rows.append((
+                self.user_ids.get(payment.get("initiator") or payment.get("processed_by")),
+                abs(amount),
+                t_data.get("method"),
+                status,
+                created_at,
+                legacy_timestamp(completed) if isinstance(completed, str) else (created_at if completed else None),
+                payment.get("transaction"),
+            ))
+        return rows
+
+    def _user_id(self, item: Dict[str, Any]) -> Optional[int]:
+        user_id = _int_or_none(item.get("user_id"))
+        return user_id if user_id is not None else self.user_ids.get(item.get("user"))
+
+    # ---------------------------
+    # Import
+    # ---------------------------
+
+    def run(self, defer_indexes: bool = False) -> None:
+        started = time.perf_counter()
+        if defer_indexes:
+            # Secundaire indexes na afloop in een keer opbouwen is veel sneller dan per insert bijwerken
+            for statement in database_utils.INDEXES:
+                self.conn.execute(f"DROP INDEX IF EXISTS {statement.split()[5]}")
+
+        self._import_source("users", os.path.join(self.data_dir, "users.json"), """
+            INSERT OR IGNORE INTO users (id, username, password_hash, name, email, phone, role,
+                                         created_at, birth_year, active, hash_v)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'md5')
+        """, self._user_rows)
+        self.user_ids = dict(self.conn.execute("SELECT username, id FROM users"))
+
+        self._import_source("parking_lots", os.path.join(self.data_dir, "parking-lots.json"), """
+            INSERT OR IGNORE INTO parking_lots (id, name, location, address, capacity, reserved,
+                                                tariff, day_tariff, created_at, lat, lng)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, self._parking_lot_rows)
+
+        self._import_source("reservations", os.path.join(self.data_dir, "reservations.json"), """
+            INSERT OR IGNORE INTO reservations (id, user_id, parking_lot_id, start_time, end_time,
+                                                status, created_at, cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, self._reservation_rows)
+
+        session_files = []
+        for path in glob.glob(os.path.join(self.data_dir, "pdata", "p*-sessions.json")):
+            match = _SESSIONS_FILE.search(os.path.basename(path))
+            if match:
+                session_files.append((int(match.group(1)), path))
+        for lot_id, path in sorted(session_files):
+            self._import_source(f"sessions:p{lot_id}", path, """
+                INSERT INTO p_sessions (parking_lot_id, user_id, license_plate, user_name, started_at,
+                                        stopped_at, duration_minutes, cost, payment_status, verified_exit_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, self._session_rows(lot_id))
+
+        self._import_source("payments", os.path.join(self.data_dir, "payments.json"), """
+            INSERT INTO payments (user_id, amount, method, status, created_at, paid_at, external_ref)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, self._payment_rows)
+
+        if defer_indexes:
+            index_started = time.perf_counter()
+            for statement in database_utils.INDEXES:
+                self.conn.execute(statement)
+            print(f"indexes: rebuilt in {time.perf_counter() - index_started:.1f}s")
+
+        self.conn.execute("PRAGMA optimize")
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"Done: {self.total_rows} rows in {elapsed:.1f}s ({self.total_rows / elapsed:,.0f} rows/s), "
+              f"{self.skipped} invalid items skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the legacy JSON data store into SQLite (resumable)")
+    parser.add_argument("data_dir", help="Legacy data directory (with users.json, parking-lots.json, pdata/, ...)")
+    parser.add_argument("--db", default=database_utils.get_db_path(), help="Target SQLite database")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per transaction (default {BATCH_SIZE})")
+    parser.add_argument("--hash-workers", type=int, default=os.cpu_count() or 4,
+                        help="Threads used to bcrypt legacy password hashes")
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="Drop the secondary indexes during the import and rebuild them afterwards")
+    args = parser.parse_args()
+
+    importer = LegacyImporter(args.data_dir, args.db, args.batch_size, args.hash_workers)
+    try:
+        importer.run(defer_indexes=args.defer_indexes)
+    finally:
+        importer.close()
+
+
+if __name__ == "__main__":
+    main()
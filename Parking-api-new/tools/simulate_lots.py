@@ -0,0 +1,321 @@
+"""
+Discrete-event simulation of parking lot traffic on a virtual clock.
+
+Uses the same rules as the API, without HTTP or database writes:
+- admission through parking_lots_utils.available_spots, in the order of
+  start_session. Active sessions, sessions in their grace period and
+  reservations starting within UPCOMING_RESERVATION_MINUTES (also the one of a
+  reserved vehicle arriving at its start time) count as occupied.
+- the grace period after a stop (GRACE_PERIOD_MINUTES). A vehicle that misses
+  it has its session resumed, and is auto-stopped when it reaches the barrier,
+  like verify-exit does.
+- prices from session_calculator.price_for_period, the core of calculate_price.
+
+Lots come from a database (--db) or are generated. --capacity-scale and
+--tariff-scale evaluate changes to capacity and tariffs. Every lot is simulated
+independently (own random stream, own event queue) and lots are spread over
+--workers processes; one process handles roughly 110k vehicles per second, so
+the default run (100 lots, 14 days, ~1.9M vehicles) takes about 17s on one core.
+
+    python tools/simulate_lots.py --lots 300 --days 28
+    python tools/simulate_lots.py --db api/data/parking.sqlite3 --days 14 --capacity-scale 0.9 --json out.json
+"""
+import argparse
+import bisect
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush, merge
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+project_dir = os.path.abspath(os.path.join(script_dir, '..'))
+api_dir = os.path.join(project_dir, 'api')
+sys.path.insert(0, project_dir)
+sys.path.insert(0, api_dir)
+
+import constants  # noqa: E402
+from utils import parking_lots_utils  # noqa: E402
+from utils.session_calculator import price_for_period  # noqa: E402
+
+# Relatieve drukte per uur van de dag (zelfde profiel als create_test_db --generate)
+HOURLY_ARRIVALS = [1, 1, 1, 1, 2, 4, 9, 16, 18, 14, 11, 11, 12, 11, 11, 12, 14, 16, 13, 9, 7, 5, 3, 2]
+
+# Soorten aankomst, in volgorde van afhandeling bij gelijke tijd
+RESERVED_ARRIVAL, ARRIVAL = range(2)
+
+
+class Lot:
+    __slots__ = ("id", "name", "capacity", "tariff", "day_tariff", "pricing", "occupied", "reservation_starts",
+                 "arrivals", "admitted", "rejected_full", "rejected_reserved", "reserved_rejected",
+                 "late_exits", "revenue", "occupied_minutes", "peak", "last_change")
+
+    def __init__(self, lot_id, name, capacity, tariff, day_tariff):
+        self.id = lot_id
+        self.name = name
+        self.capacity = capacity
+        self.tariff = tariff
+        self.day_tariff = day_tariff
+        # Lot zoals calculate_price hem verwacht
+        self.pricing = {"id": lot_id, "name": name, "capacity": capacity, "tariff": tariff, "day_tariff": day_tariff}
+        self.occupied = 0
+        self.reservation_starts = []  # gesorteerde starttijden (minuten) van open reserveringen
+        self.arrivals = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_reserved = 0
+        self.reserved_rejected = 0
+        self.late_exits = 0
+        self.revenue = 0.0
+        self.occupied_minutes = 0.0
+        self.peak = 0
+        self.last_change = 0.0
+
+    def set_occupied(self, now, delta):
+        # Tijdgewogen bezetting bijhouden
+        self.occupied_minutes += self.occupied * (now - self.last_change)
+        self.last_change = now
+        self.occupied += delta
+        if self.occupied > self.peak:
+            self.peak = self.occupied
+
+    def upcoming_reservations(self, now):
+        # Zelfde venster als UPCOMING_RESERVATIONS_QUERY: now <= start <= now + UPCOMING_RESERVATION_MINUTES
+        low = bisect.bisect_left(self.reservation_starts, now)
+        high = bisect.bisect_right(self.reservation_starts, now + constants.UPCOMING_RESERVATION_MINUTES)
+        return high - low
+
+
+class Simulation:
+    """
+    Event loop over virtual minutes since `start`, one lot at a time.
+
+    All arrivals of a lot are known up front (a Poisson process plus the reservations),
+    so they are generated in one pass and merged in time order; only departures need a heap.
+    """
+
+    def __init__(self, lots, args, rng):
+        self.lots = lots
+        self.args = args
+        self.rng = rng
+        self.start = datetime(2025, 1, 6)  # maandag 00:00
+        self.end_minute = args.days * 1440
+        self.hour_share = [weight / sum(HOURLY_ARRIVALS) for weight in HOURLY_ARRIVALS]
+        self.dwell_mu = math.log(args.dwell_median)
+        self.dwell_sigma = args.dwell_sigma
+        self.late_share = args.late_exit_share
+
+    def clock(self, minute):
+        return self.start + timedelta(minutes=minute)
+
+    def arrival_times(self, lot):
+        """
+        Arrivals of a non-homogeneous Poisson process with the hourly profile, in time order.
+
+        The rate is constant within an hour, so a unit-rate exponential draw is walked
+        through the hours until its expected arrivals are used up (no rejected draws).
+        """
+        per_day = lot.capacity * self.args.turnover
+        if per_day <= 0:
+            return []
+        expovariate = self.rng.expovariate
+        arrivals = []
+        remaining = expovariate(1.0)
+        for hour in range(self.end_minute // 60):
+            rate = per_day * self.hour_share[hour % 24] / 60
+            now = hour * 60.0
+            expected = rate * 60
+            while remaining < expected:
+                now += remaining / rate
+                expected -= remaining
+                arrivals.append(now)
+                remaining = expovariate(1.0)
+            remaining -= expected
+        return arrivals
+
+    def price(self, lot, started, stopped, prices):
+        """
+        price_for_period, cached per lot: the price only depends on the number of date
+        changes, whole days and started hours (or < 3 minutes), not on the times themselves.
+        """
+        duration = stopped - started
+        key = (int(stopped // 1440) - int(started // 1440), int(duration // 1440),
+               math.ceil(duration / 60) if duration >= 3 else 0)
+        price = prices.get(key)
+        if price is None:
+            price = prices[key] = price_for_period(lot.pricing, self.clock(started), self.clock(stopped))[0]
+        return price
+
+    def leave(self, lot, now, started, stopped, prices):
+        """Stop at `stopped`, reach the barrier at `now`"""
+        # Zelfde regel als RESUME_EXPIRED_SESSIONS_QUERY: stopped_at + GRACE_PERIOD_MINUTES < nu
+        late = now - stopped > constants.GRACE_PERIOD_MINUTES
+        if late:
+            # Sessie liep weer door; verify-exit stopt hem nu automatisch
+            stopped = now
+            lot.late_exits += 1
+        lot.revenue += self.price(lot, started, stopped, prices)
+        lot.set_occupied(now, -1)
+
+    def park(self, lot, now, exits):
+        lot.admitted += 1
+        lot.set_occupied(now, +1)
+        rng = self.rng
+        dwell = min(3 * 1440, max(1.0, rng.lognormvariate(self.dwell_mu, self.dwell_sigma)))
+        # Meestal bij de slagboom binnen de grace period na de stop, soms (veel) later.
+        # De plek blijft tot het vertrek bezet, dus stop en vertrek zijn een enkel event.
+        if rng.random() < self.late_share:
+            exit_delay = constants.GRACE_PERIOD_MINUTES + rng.expovariate(1 / 60)
+        else:
+            exit_delay = rng.uniform(0.5, min(10, constants.GRACE_PERIOD_MINUTES))
+        stopped = now + dwell
+        heappush(exits, (stopped + exit_delay, now, stopped))
+
+    def run(self):
+        for lot in self.lots:
+            self.run_lot(lot)
+
+    def run_lot(self, lot):
+        arrivals = [(minute, ARRIVAL) for minute in self.arrival_times(lot)]
+        # Reserveringen: vooraf bekend, voertuig komt op de starttijd aan
+        count = int(lot.capacity * self.args.reservation_share * self.args.turnover * self.args.days)
+        lot.reservation_starts = sorted(self.rng.uniform(0, self.end_minute) for _ in range(count))
+        reserved = [(minute, RESERVED_ARRIVAL) for minute in lot.reservation_starts]
+
+        exits = []  # heap van (vertrek, start, stop)
+        prices = {}
+        for now, kind in merge(reserved, arrivals):
+            # Bij gelijke tijd eerst vertrekken
+            while exits and exits[0][0] <= now:
+                self.leave(lot, *heappop(exits), prices)
+            lot.arrivals += 1
+            # Zelfde volgorde als start_session: een reservering die nu begint telt nog als upcoming,
+            # ook die van het voertuig zelf; daarna valt hij vanzelf uit het venster
+            upcoming = lot.upcoming_reservations(now)
+            if parking_lots_utils.available_spots(lot.capacity, lot.occupied, upcoming) > 0:
+                self.park(lot, now, exits)
+            elif kind == RESERVED_ARRIVAL:
+                lot.reserved_rejected += 1
+            elif upcoming:
+                lot.rejected_reserved += 1
+            else:
+                lot.rejected_full += 1
+        while exits:
+            self.leave(lot, *heappop(exits), prices)
+
+        lot.set_occupied(max(self.end_minute, lot.last_change), 0)
+
+
+def simulate_lot(lot, args):
+    """Simulate one lot with its own random stream, so results don't depend on --workers"""
+    Simulation([lot], args, random.Random(f"{args.seed}-{lot.id}")).run()
+    return lot
+
+
+def simulate(lots, args):
+    """
+    Lots don't share vehicles, so every lot is an independent simulation.
+    Small per-lot event queues are faster than one big one, and spread over worker processes.
+    """
+    if args.workers <= 1 or len(lots) <= 1:
+        return [simulate_lot(lot, args) for lot in lots]
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        return list(executor.map(simulate_lot, lots, [args] * len(lots), chunksize=max(1, len(lots) // (args.workers * 4))))
+
+
+def load_lots(args, rng):
+    if args.db:
+        conn = sqlite3.connect(args.db)
+        query = "SELECT id, name, capacity, tariff, day_tariff FROM parking_lots ORDER BY id"
+        if args.lots:
+            query += f" LIMIT {int(args.lots)}"
+        rows = conn.execute(query).fetchall()
+        conn.close()
+    else:
+        rows = []
+        for lot_id in range(1, (args.lots or 100) + 1):
+            tariff = round(rng.uniform(1.5, 5.0), 2)
+            rows.append((lot_id, f"Lot {lot_id}", int(min(5000, max(20, rng.lognormvariate(math.log(250), 0.8)))),
+                         tariff, round(tariff * rng.uniform(6, 10), 2)))
+    return [Lot(lot_id, name, max(0, int(round((capacity or 0) * args.capacity_scale))),
+                (tariff or 0) * args.tariff_scale, (day_tariff if day_tariff is not None else 999) * args.tariff_scale)
+            for lot_id, name, capacity, tariff, day_tariff in rows]
+
+
+def build_report(lots, days, elapsed):
+    minutes = days * 1440
+    per_lot = []
+    for lot in lots:
+        per_lot.append({
+            "lot_id": lot.id, "name": lot.name, "capacity": lot.capacity,
+            "arrivals": lot.arrivals, "admitted": lot.admitted,
+            "rejected_full": lot.rejected_full, "rejected_reserved": lot.rejected_reserved,
+            "reservations_rejected": lot.reserved_rejected, "late_exits": lot.late_exits,
+            "revenue": round(lot.revenue, 2),
+            "avg_occupancy": round(lot.occupied_minutes / minutes / lot.capacity, 4) if lot.capacity else 0.0,
+            "peak_occupancy": lot.peak,
+        })
+    totals = {key: sum(item[key] for item in per_lot) for key in
+              ("arrivals", "admitted", "rejected_full", "rejected_reserved", "reservations_rejected", "late_exits")}
+    totals["revenue"] = round(sum(item["revenue"] for item in per_lot), 2)
+    total_capacity = sum(lot.capacity for lot in lots)
+    totals["avg_occupancy"] = round(sum(lot.occupied_minutes for lot in lots) / minutes / total_capacity, 4) \
+        if total_capacity else 0.0
+    totals["rejection_rate"] = round((totals["arrivals"] - totals["admitted"]) / totals["arrivals"], 4) \
+        if totals["arrivals"] else 0.0
+    return {"days": days, "lots": len(lots), "simulated_in_s": round(elapsed, 2), "totals": totals, "per_lot": per_lot}
+
+
+def print_report(report, top):
+    totals = report["totals"]
+    print(f"\n{report['lots']} lots, {report['days']} days simulated in {report['simulated_in_s']}s")
+    print(f"  arrivals {totals['arrivals']:,}, admitted {totals['admitted']:,}, "
+          f"rejected {totals['rejected_full']:,} (full) + {totals['rejected_reserved']:,} (reservations) "
+          f"+ {totals['reservations_rejected']:,} reserved vehicles, rejection rate {totals['rejection_rate']:.1%}")
+    print(f"  average occupancy {totals['avg_occupancy']:.1%}, late exits {totals['late_exits']:,}, "
+          f"revenue EUR {totals['revenue']:,.2f}")
+    print(f"\n{'lot':>6} {'capacity':>8} {'arrivals':>9} {'rejected':>9} {'avg occ':>8} {'peak':>6} {'revenue':>12}")
+    worst = sorted(report["per_lot"], key=lambda item: item["rejected_full"] + item["rejected_reserved"], reverse=True)
+    for item in worst[:top]:
+        print(f"{item['lot_id']:>6} {item['capacity']:>8} {item['arrivals']:>9} "
+              f"{item['rejected_full'] + item['rejected_reserved']:>9} {item['avg_occupancy']:>8.1%} "
+              f"{item['peak_occupancy']:>6} {item['revenue']:>12,.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate parking lot traffic with the API's capacity rules")
+    parser.add_argument("--db", help="Take lots (capacity, tariffs) from this database instead of generating them")
+    parser.add_argument("--lots", type=int, help="Number of lots (default 100, or all lots in --db)")
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--turnover", type=float, default=4.0, help="Arrivals per spot per day")
+    parser.add_argument("--dwell-median", type=float, default=120, help="Median parking time in minutes")
+    parser.add_argument("--dwell-sigma", type=float, default=0.9, help="Lognormal sigma of the parking time")
+    parser.add_argument("--reservation-share", type=float, default=0.05, help="Reservations per arrival")
+    parser.add_argument("--late-exit-share", type=float, default=0.03,
+                        help="Share of vehicles reaching the barrier after the grace period")
+    parser.add_argument("--capacity-scale", type=float, default=1.0, help="Multiply every lot's capacity")
+    parser.add_argument("--tariff-scale", type=float, default=1.0, help="Multiply every lot's tariffs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes to spread the lots over")
+    parser.add_argument("--top", type=int, default=10, help="Lots with the most rejections to list")
+    parser.add_argument("--json", help="Write the full report (per lot) as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lots = load_lots(args, rng)
+    started = time.perf_counter()
+    lots = simulate(lots, args)
+    report = build_report(lots, args.days, time.perf_counter() - started)
+    print_report(report, args.top)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()